@@ -0,0 +1,214 @@
+"""
+ElevenLabs API client: latency per call and behaviour under throttling, with and without the pooled session.
+
+Starts a local mock of the agents endpoint (GET / PATCH /v1/convai/agents/{id})
+that waits --connect-ms on every new connection, standing in for the TCP + TLS
+handshake, and --server-ms on every request. Two scenarios are run twice, once
+with a bare requests call per request (as get_agent_data used to do) and once
+through get_agent_data on the shared http_client session:
+
+  sequential  --calls calls one after another: latency percentiles and
+              connections opened.
+  throttled   --threads threads making --calls calls each while the server
+              admits --rate requests per second (429 with Retry-After beyond
+              that) and fails --error-rate of requests with a 503: calls that
+              succeeded, retries, connections and wall time.
+
+Usage:
+    python -m benchmarks.bench_http_client [--calls 50] [--connect-ms 30] [--threads 8] [--rate 40]
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import elevenlab_api
+
+
+class MockState:
+    """Counters and the token bucket shared by the mock server's handler threads"""
+
+    def __init__(self, connect_ms, server_ms, rate, error_rate, seed):
+        self.connect_ms = connect_ms
+        self.server_ms = server_ms
+        self.rate = rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset(rate=None)
+
+    def reset(self, rate):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.throttled = 0
+            self.failed = 0
+            self.rate = rate
+            self.tokens = rate or 0
+            self.refilled_at = time.monotonic()
+
+    def admit(self):
+        """'ok', 'throttled' or 'failed' for one incoming request"""
+        with self.lock:
+            self.requests += 1
+            if self.rate:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                if self.tokens < 1:
+                    self.throttled += 1
+                    return "throttled"
+                self.tokens -= 1
+                if self.rng.random() < self.error_rate:
+                    self.failed += 1
+                    return "failed"
+            return "ok"
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Reply headers and body go out in separate writes; without this, Nagle and delayed ACKs add ~40 ms
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with state.lock:
+                state.connections += 1
+            time.sleep(state.connect_ms / 1000)
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body, headers=()):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(state.server_ms / 1000)
+            if not self.path.startswith("/v1/convai/agents/"):
+                return self._reply(404, {"detail": "not found"})
+            outcome = state.admit()
+            if outcome == "throttled":
+                return self._reply(429, {"detail": "too many requests"}, [("Retry-After", "0.2")])
+            if outcome == "failed":
+                return self._reply(503, {"detail": "service unavailable"})
+            agent_id = self.path.rsplit("/", 1)[-1]
+            self._reply(200, {"agent_id": agent_id, "conversation_config": {"agent": {"prompt": {"prompt": "..."}}}})
+
+        do_GET = _handle
+        do_PATCH = _handle
+
+    return Handler
+
+
+def plain_get_agent_data(agent_id, api_key, base_url):
+    """get_agent_data as it was: a new connection per call, no timeout and no retries"""
+    url = f"{base_url}/convai/agents/{agent_id}"
+    try:
+        response = requests.get(url, headers={"Accept": "application/json", "xi-api-key": api_key})
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException:
+        return None
+
+
+def pooled_get_agent_data(agent_id, api_key, base_url):
+    return elevenlab_api.get_agent_data(agent_id, api_key)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_sequential(call, base_url, calls):
+    latencies, ok = [], 0
+    for index in range(calls):
+        start = time.perf_counter()
+        ok += call(f"agent_{index % 5}", "key", base_url) is not None
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, ok
+
+
+def run_concurrent(call, base_url, threads, calls):
+    results = []
+    lock = threading.Lock()
+
+    def worker(thread_index):
+        for index in range(calls):
+            data = call(f"agent_{thread_index}_{index}", "key", base_url)
+            with lock:
+                results.append(data is not None)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(results), len(results), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50, help="calls per scenario (per thread when throttled)")
+    parser.add_argument("--connect-ms", type=float, default=30, help="delay per new connection (handshake)")
+    parser.add_argument("--server-ms", type=float, default=5, help="delay per request")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=40, help="requests per second admitted when throttled")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of admitted requests failing with 503")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    state = MockState(args.connect_ms, args.server_ms, None, args.error_rate, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    elevenlab_api.ELEVENLABS_API_BASE = base_url
+    modes = (("per-call", plain_get_agent_data), ("pooled", pooled_get_agent_data))
+
+    try:
+        print(f"sequential: {args.calls} calls, {args.connect_ms:g} ms per new connection, {args.server_ms:g} ms per request")
+        print(f"{'client':<10}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'ok':>6}{'connections':>13}")
+        for name, call in modes:
+            state.reset(rate=None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, ok = run_sequential(call, base_url, args.calls)
+            print(f"{name:<10}{percentile(latencies, 0.5):>9.1f}{percentile(latencies, 0.95):>9.1f}"
+                  f"{statistics.mean(latencies):>9.1f}{ok:>6}{state.connections:>13}")
+
+        print(f"\nthrottled: {args.threads} threads x {args.calls} calls, {args.rate:g} requests/s admitted, "
+              f"{args.error_rate:.0%} of admitted requests fail with 503")
+        print(f"{'client':<10}{'ok':>9}{'requests':>10}{'429s':>7}{'503s':>7}{'connections':>13}{'seconds':>9}")
+        for name, call in modes:
+            state.reset(rate=args.rate)
+            # get_agent_data prints the calls that fail; the counts below are what matters
+            with contextlib.redirect_stdout(io.StringIO()):
+                ok, total, elapsed = run_concurrent(call, base_url, args.threads, args.calls)
+            print(f"{name:<10}{f'{ok}/{total}':>9}{state.requests:>10}{state.throttled:>7}{state.failed:>7}"
+                  f"{state.connections:>13}{elapsed:>9.2f}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+NL→SQL latency and accuracy regression benchmark.
+
+Replays the scripted conversations in nl2sql_corpus.json through
+ConversationalSQLAssistant.process_query. The LLM is replaced by a stub that
+answers with the recorded completion after a configurable latency, and the
+database is a seeded SQLite stand-in of patients_personal_details (or the MySQL
+database in DB_CONFIG with --mysql, read-only). For every question it records
+per-stage latency (prompt_build, llm, guard, execute, of which render), prompt and
+completion tokens, whether the result set matches the expected SQL's and whether
+the SQL itself matches exactly. Results are written as JSON; --compare prints the
+change against an earlier run and --max-regression makes the run fail on a slowdown
+or an accuracy drop, for use in CI.
+
+Usage:
+    python -m benchmarks.bench_nl2sql [--llm-ms 400] [--jitter-ms 100] [--repeat 3] [--output run.json]
+    python -m benchmarks.bench_nl2sql --compare baseline.json --max-regression 10
+    python -m benchmarks.bench_nl2sql --record      # refresh recorded responses from the real model
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import openai
+
+import nlp_to_sql
+from db_pool import ConnectionPool
+from schema_catalog import SchemaCatalog
+from sql_cache import normalize_sql
+from sql_guard import apply_row_limit
+from sql_prompt import SCHEMA, count_tokens
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "nl2sql_corpus.json")
+STAGES = ("prompt_build", "llm", "guard", "execute", "render", "total")
+SQLITE_TYPES = {"BIGINT": "INTEGER", "INT": "INTEGER", "VARCHAR": "TEXT", "LONGTEXT": "TEXT", "TIMESTAMP": "TEXT"}
+
+LOCATIONS = ("Delhi", "Mumbai", "Chandigarh", "Pune", "Jaipur")
+SYMPTOMS = ("fever", "cough", "headache", "back pain", "fatigue", "nausea", "dizziness", "sore throat")
+
+
+def patient_row(rng, index):
+    created = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+    values = {
+        "id": index + 1,
+        "uuid": f"{rng.getrandbits(128):032x}",
+        "patient_id": f"P{index + 1:06d}",
+        "name": f"Patient {index + 1}",
+        "age": rng.randint(1, 95),
+        "height": rng.randint(140, 200),
+        "weight": rng.randint(40, 120),
+        "blood": rng.choice(("A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-")),
+        "gender": rng.choice(("Male", "Female")),
+        "date": f"2024-03-{rng.randint(1, 31):02d}",
+        "location": rng.choice(LOCATIONS),
+        "patient_type": rng.choice(("inpatient", "outpatient")),
+        "symptoms": ", ".join(rng.sample(SYMPTOMS, 3)),
+        "note": "Follow up in two weeks. " * rng.randint(1, 20),
+        "time_slot": f"{rng.randint(9, 17):02d}:00",
+        "doctor_id": rng.randint(1, 20),
+        "organisation_id": rng.randint(1, 5),
+        "session_type": rng.choice((1, 2)),
+        "created_at": created,
+        "updated_at": created,
+        "deleted_at": created if rng.random() < 0.05 else None,
+    }
+    return tuple(values.get(name) for name, _, _ in SCHEMA["patients_personal_details"])
+
+
+def build_stand_in(path, rows, seed):
+    """SQLite copy of patients_personal_details with deterministic rows"""
+    columns = SCHEMA["patients_personal_details"]
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE patients_personal_details ({})".format(", ".join(
+        f"{name} {SQLITE_TYPES[col_type]}{' PRIMARY KEY' if name == 'id' else ''}" for name, col_type, _ in columns
+    )))
+    rng = random.Random(seed)
+    conn.executemany(
+        f"INSERT INTO patients_personal_details VALUES ({', '.join('?' * len(columns))})",
+        (patient_row(rng, index) for index in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+class StubLLM:
+    """Stand-in for openai.ChatCompletion.create that replays recorded completions"""
+
+    def __init__(self, responses, latency_ms, jitter_ms, seed, record=False):
+        self.responses = responses
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rng = random.Random(seed)
+        self.record = record
+        self.real_create = openai.ChatCompletion.create
+        self.question = None
+        self.last_usage = {}
+
+    def create(self, messages, **kwargs):
+        if self.record:
+            # Recorded without streaming, so the whole completion and its usage come back at once
+            options = {key: value for key, value in kwargs.items() if key != "stream"}
+            response = self.real_create(messages=messages, **options)
+            self.responses[self.question] = response['choices'][0]['message']['content']
+        else:
+            time.sleep(max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+            content = self.responses[self.question]
+            response = {
+                "choices": [{"message": {"content": content}}],
+                "usage": {
+                    "prompt_tokens": sum(count_tokens(message["content"]) for message in messages),
+                    "completion_tokens": count_tokens(content),
+                },
+            }
+        self.last_usage = response.get("usage") or {}
+        if kwargs.get("stream"):
+            content = response['choices'][0]['message']['content']
+            return iter([{"choices": [{"delta": {"content": content}}]}])
+        return response
+
+
+def comparable(rows, ordered):
+    rows = [tuple(round(value, 6) if isinstance(value, float) else value for value in row) for row in rows]
+    return rows if ordered else sorted(rows, key=repr)
+
+
+def expected_rows(pool, sql):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(apply_row_limit(sql, nlp_to_sql.MAX_RESULT_ROWS))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def run_turn(assistant, stub, pool, turn):
+    stub.question = turn["question"]
+    record = {"question": turn["question"]}
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            rows = assistant.process_query(turn["question"])
+        error = assistant.conversation_history[-1]["error"] if rows is None else None
+    except Exception as e:
+        # The assistant only handles MySQL errors; SQLite ones from bad SQL end up here
+        rows, error = None, f"{type(e).__name__}: {e}"
+    total = time.perf_counter() - start
+
+    stages = dict(assistant.stage_timings, total=total)
+    record["stage_ms"] = {stage: round(stages[stage] * 1000, 3) for stage in STAGES if stage in stages}
+    record["prompt_tokens"] = assistant.prompt_tokens[-1] if assistant.prompt_tokens else 0
+    record["completion_tokens"] = stub.last_usage.get("completion_tokens", 0)
+    generated = assistant.conversation_history[-1]["sql_query"] if assistant.conversation_history else None
+    record["sql"] = generated
+    record["sql_match"] = bool(generated) and normalize_sql(generated).lower() == normalize_sql(turn["expected_sql"]).lower()
+    record["error"] = error
+    ordered = turn.get("ordered", False)
+    record["correct"] = rows is not None and comparable(rows, ordered) == comparable(expected_rows(pool, turn["expected_sql"]), ordered)
+    return record
+
+
+def summarize(records):
+    summary = {
+        "questions": len(records),
+        "accuracy": round(sum(r["correct"] for r in records) / len(records), 4),
+        "sql_exact_match": round(sum(r["sql_match"] for r in records) / len(records), 4),
+        "errors": sum(1 for r in records if r["error"]),
+        "prompt_tokens_mean": round(statistics.mean(r["prompt_tokens"] for r in records), 1),
+        "completion_tokens_mean": round(statistics.mean(r["completion_tokens"] for r in records), 1),
+        "stages": {},
+    }
+    for stage in STAGES:
+        values = sorted(r["stage_ms"].get(stage, 0.0) for r in records)
+        summary["stages"][stage] = {
+            "p50_ms": round(statistics.median(values), 3),
+            "p95_ms": round(values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))], 3),
+            "mean_ms": round(statistics.mean(values), 3),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"{summary['questions']} questions: accuracy {summary['accuracy']:.1%}, "
+          f"exact SQL {summary['sql_exact_match']:.1%}, {summary['errors']} errors, "
+          f"{summary['prompt_tokens_mean']:.0f} prompt / {summary['completion_tokens_mean']:.0f} completion tokens per question")
+    print(f"{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for stage, values in summary["stages"].items():
+        print(f"{stage:<14}{values['p50_ms']:>10.2f}{values['p95_ms']:>10.2f}{values['mean_ms']:>10.2f}")
+
+
+def compare(summary, baseline, max_regression):
+    """Print the change against a baseline run; returns False if a limit was exceeded"""
+    rows = [("accuracy", baseline["accuracy"], summary["accuracy"]),
+            ("prompt_tokens_mean", baseline["prompt_tokens_mean"], summary["prompt_tokens_mean"])]
+    rows += [(f"{stage} p50 ms", baseline["stages"][stage]["p50_ms"], summary["stages"][stage]["p50_ms"])
+             for stage in STAGES if stage in baseline["stages"]]
+    print(f"\n{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}")
+    ok = True
+    for name, before, after in rows:
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<22}{before:>12.2f}{after:>12.2f}{change:>+9.1f}%")
+    if max_regression is not None:
+        total_before = baseline["stages"]["total"]["p50_ms"]
+        total_after = summary["stages"]["total"]["p50_ms"]
+        if total_before and (total_after - total_before) / total_before * 100 > max_regression:
+            print(f"FAIL: total p50 regressed by more than {max_regression}%")
+            ok = False
+        if summary["accuracy"] < baseline["accuracy"]:
+            print("FAIL: accuracy dropped")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--llm-ms", type=float, default=400, help="stub LLM latency")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="standard deviation of the stub latency")
+    parser.add_argument("--rows", type=int, default=2000, help="rows in the SQLite stand-in")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="times to replay the corpus")
+    parser.add_argument("--mysql", action="store_true", help="query the DB_CONFIG database instead of SQLite")
+    parser.add_argument("--record", action="store_true", help="call the real model and save its completions to the corpus")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, help="fail if total p50 regresses by more than this percentage")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+    conversations = corpus["conversations"]
+    responses = {turn["question"]: turn["response"] for conversation in conversations for turn in conversation["turns"]}
+    stub = StubLLM(responses, args.llm_ms, args.jitter_ms, args.seed, record=args.record)
+    openai.ChatCompletion.create = stub.create
+
+    temp_dir = None
+    if args.mysql:
+        pool = nlp_to_sql.create_db_pool()
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "patients.db")
+        build_stand_in(db_path, args.rows, args.seed)
+        pool = ConnectionPool(lambda: sqlite3.connect(db_path, check_same_thread=False), size=2)
+    # The built-in schema is the stand-in's schema, so introspection is skipped
+    catalog = SchemaCatalog(refresh_seconds=float('inf'), fallback=SCHEMA)
+
+    records = []
+    try:
+        for repeat in range(args.repeat if not args.record else 1):
+            for conversation in conversations:
+                assistant = nlp_to_sql.ConversationalSQLAssistant(
+                    pool=pool, sql_cache=False, query_results_cache=False,
+                    schema_catalog=catalog, history_store=False
+                )
+                for index, turn in enumerate(conversation["turns"]):
+                    record = run_turn(assistant, stub, pool, turn)
+                    record.update(conversation=conversation["id"], turn=index + 1, repeat=repeat + 1)
+                    records.append(record)
+    finally:
+        pool.close()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    if args.record:
+        for conversation in conversations:
+            for turn in conversation["turns"]:
+                turn["response"] = responses[turn["question"]]
+        with open(args.corpus, "w") as f:
+            json.dump(corpus, f, indent=2)
+            f.write("\n")
+        print(f"Recorded {len(responses)} responses to {args.corpus}")
+
+    summary = summarize(records)
+    print_summary(summary)
+    for record in records:
+        if record["repeat"] == 1 and not record["correct"]:
+            print(f"  wrong: [{record['conversation']}#{record['turn']}] {record['question']} -> {record['sql']}"
+                  + (f" ({record['error']})" if record["error"] else ""))
+
+    config = {key: getattr(args, key) for key in ("llm_ms", "jitter_ms", "rows", "seed", "repeat", "mysql")}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": config, "summary": summary, "turns": records}, f, indent=2, default=str)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["summary"]
+        if not compare(summary, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Per-backend parsing throughput over a fixed corpus.
+
+Every registered backend whose library is importable is run over each corpus
+document of its MIME type; the backend picked at startup is marked with '*'.
+Without --corpus a deterministic generated corpus (PDF, TXT, HTML, RTF, ODT)
+is used so runs are comparable across machines and commits.
+
+Usage:
+    python -m benchmarks.bench_parsers [--corpus DIR] [--repeat 3]
+"""
+import argparse
+import os
+import tempfile
+import time
+import zipfile
+
+import doc_parsers
+from benchmarks.bench_pdf_extraction import build_synthetic_pdf
+
+RECORD_LINE = "Patient Name: John Smith  DOB: 01/15/1985  Visit notes line {index}."
+
+
+def build_corpus(directory):
+    lines = [RECORD_LINE.format(index=index) for index in range(20000)]
+    files = {
+        "record-300p.pdf": build_synthetic_pdf(300),
+        "record.txt": "\n".join(lines).encode(),
+        "record.html": ("<html><body>" + "".join(f"<p>{line}</p>" for line in lines) + "</body></html>").encode(),
+        "record.rtf": ("{\\rtf1\\ansi{\\fonttbl\\f0\\fswiss Helvetica;}\\f0\\pard "
+                       + "".join(f"{line}\\par " for line in lines) + "}").encode(),
+    }
+    for name, data in files.items():
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+
+    text_ns = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+    content = (f'<?xml version="1.0"?><office:document-content '
+               f'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:text="{text_ns}">'
+               f'<office:body><office:text>' + "".join(f"<text:p>{line}</text:p>" for line in lines)
+               + '</office:text></office:body></office:document-content>')
+    with zipfile.ZipFile(os.path.join(directory, "record.odt"), "w") as archive:
+        archive.writestr("mimetype", doc_parsers.ODT)
+        archive.writestr("content.xml", content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of documents to parse")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as generated:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            build_corpus(generated)
+            corpus_dir = generated
+
+        by_mime = {}
+        for name in sorted(os.listdir(corpus_dir)):
+            path = os.path.join(corpus_dir, name)
+            if os.path.isfile(path):
+                by_mime.setdefault(doc_parsers.sniff_mime_type(path), []).append(path)
+
+        print(f"{'format':<8}{'backend':<14}{'docs/s':>10}{'MB/s':>10}{'chars':>10}")
+        for mime_type, paths in by_mime.items():
+            total_bytes = sum(os.path.getsize(path) for path in paths)
+            selected = doc_parsers.ACTIVE_BACKENDS.get(mime_type, (None,))[0]
+            for _, name, func in doc_parsers.PARSERS.get(mime_type, []):
+                if not doc_parsers.backend_available(mime_type, name):
+                    continue
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    chars = sum(len(func(path)) for path in paths)
+                elapsed = time.perf_counter() - start
+                runs = len(paths) * args.repeat
+                marker = "*" if name == selected else " "
+                print(f"{doc_parsers.FORMAT_NAMES.get(mime_type, mime_type):<8}{marker}{name:<13}"
+                      f"{runs / elapsed:>10.1f}{total_bytes * args.repeat / elapsed / 1e6:>10.2f}{chars:>10}")
+
+
+if __name__ == "__main__":
+    main()
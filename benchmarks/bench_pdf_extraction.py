@@ -0,0 +1,89 @@
+"""
+Benchmark early-exit PDF extraction against full-document parsing.
+
+Compares the previous implementation (every page parsed, extract_text called
+twice per page) with extract_text_from_pdf, which stops once the prompt
+window is filled. Pass your own PDFs, or omit them to use generated ones.
+
+Usage:
+    python -m benchmarks.bench_pdf_extraction [file.pdf ...] [--repeat 5]
+"""
+import argparse
+import io
+import time
+
+import PyPDF2
+
+from doc_parsers import PDF_MAX_CHARS, extract_text_from_pdf
+
+
+def full_document_extract(file) -> str:
+    reader = PyPDF2.PdfReader(file)
+    return "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
+
+
+def build_synthetic_pdf(page_count: int, lines_per_page: int = 40) -> bytes:
+    """Build a minimal multi-page text PDF without third-party writers"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_number in range(page_count):
+        lines = [f"Page {page_number + 1} line {line}: Patient John Smith DOB 01/15/1985 follow-up notes."
+                 for line in range(lines_per_page)]
+        stream = "BT /F1 9 Tf 40 780 Td 11 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        stream_bytes = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream_bytes) + stream_bytes + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % page_count
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+    return out.getvalue()
+
+
+def time_it(func, data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = func(io.BytesIO(data))
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, len(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = []
+    for path in args.pdfs:
+        with open(path, "rb") as f:
+            corpus.append((path, f.read()))
+    if not corpus:
+        corpus = [(f"synthetic-{pages}p", build_synthetic_pdf(pages)) for pages in (10, 100, 300)]
+
+    print(f"Early exit after {PDF_MAX_CHARS} characters, best of {args.repeat} runs")
+    print(f"{'document':<28}{'full (ms)':>12}{'early (ms)':>12}{'speedup':>10}{'chars':>16}")
+    for name, data in corpus:
+        full_ms, full_chars = time_it(full_document_extract, data, args.repeat)
+        early_ms, early_chars = time_it(extract_text_from_pdf, data, args.repeat)
+        print(f"{name:<28}{full_ms:>12.1f}{early_ms:>12.1f}{full_ms / early_ms:>9.1f}x"
+              f"{early_chars:>7}/{full_chars:<8}")
+
+
+if __name__ == "__main__":
+    main()
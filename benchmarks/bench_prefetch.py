@@ -0,0 +1,142 @@
+"""
+Speculative follow-up prefetch: latency per question with and without it.
+
+Replays the conversations of nl2sql_corpus.json through process_query on the
+seeded SQLite stand-in, pausing --think-ms between questions as a user reading
+the answer would. The LLM is a stub with --llm-ms latency: SQL requests get the
+recorded completion; follow-up prediction requests get the corpus's actual next
+question (reworded) with probability --accuracy, plus a decoy. Reports latency
+percentiles, how many questions were answered from a prefetch, and the work spent
+on predictions that were never used.
+
+Usage:
+    python -m benchmarks.bench_prefetch [--llm-ms 400] [--think-ms 1500] [--accuracy 0.7]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import openai
+
+import nlp_to_sql
+from benchmarks.bench_nl2sql import CORPUS_PATH, build_stand_in
+from db_pool import ConnectionPool
+from schema_catalog import SchemaCatalog
+from sql_prompt import SCHEMA
+
+DECOY = ("How many of them are outpatients?",
+         "SELECT COUNT(*) FROM patients_personal_details WHERE patient_type = 'outpatient';")
+
+
+class StubLLM:
+    """Answers SQL requests with the recorded completion and prediction requests from the corpus"""
+
+    def __init__(self, conversations, latency_ms, accuracy, seed):
+        self.responses = {turn["question"]: turn["response"] for c in conversations for turn in c["turns"]}
+        # question -> (next question, its SQL)
+        self.next_turn = {}
+        for conversation in conversations:
+            for turn, following in zip(conversation["turns"], conversation["turns"][1:]):
+                self.next_turn[turn["question"]] = (following["question"], following["expected_sql"])
+        self.latency_ms = latency_ms
+        self.accuracy = accuracy
+        self.rng = random.Random(seed)
+        self.calls = {"sql": 0, "predict": 0}
+
+    def create(self, messages, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        prompt = messages[-1]["content"]
+        if prompt.rstrip().endswith("SQL:"):
+            self.calls["sql"] += 1
+            content = self.responses[prompt.rsplit('Question: "', 1)[-1].split('"\nSQL:')[0]]
+        else:
+            self.calls["predict"] += 1
+            history_text = prompt.split("\n\nPredict the", 1)[0]
+            last_question = re.findall(r'^Q: (.+)$', history_text, re.MULTILINE)[-1]
+            predictions = [DECOY]
+            following = self.next_turn.get(last_question)
+            if following and self.rng.random() < self.accuracy:
+                predictions.insert(0, (f"Can you tell me: {following[0].lower()}", following[1]))
+            content = "\n".join(f"Q: {question}\nSQL: {sql.rstrip(';')};" for question, sql in predictions)
+        if kwargs.get("stream"):
+            return iter([{"choices": [{"delta": {"content": content}}]}])
+        return {"choices": [{"message": {"content": content}}], "usage": {}}
+
+
+def run_mode(prefetch, conversations, pool, catalog, think_ms):
+    latencies, prefetch_stats = [], []
+    for conversation in conversations:
+        assistant = nlp_to_sql.ConversationalSQLAssistant(
+            pool=pool, sql_cache=False, query_results_cache=False, schema_catalog=catalog,
+            history_store=False, prefetch=prefetch
+        )
+        for turn in conversation["turns"]:
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                assistant.process_query(turn["question"])
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(think_ms / 1000)
+        if assistant.prefetcher:
+            assistant.prefetcher.wait()
+            prefetch_stats.append(assistant.prefetcher.get_stats())
+            assistant.prefetcher.close()
+    return latencies, prefetch_stats
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-ms", type=float, default=400)
+    parser.add_argument("--think-ms", type=float, default=1500, help="pause between questions")
+    parser.add_argument("--accuracy", type=float, default=0.7, help="chance the stub predicts the next question")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as f:
+        conversations = json.load(f)["conversations"]
+    stub = StubLLM(conversations, args.llm_ms, args.accuracy, args.seed)
+    openai.ChatCompletion.create = stub.create
+
+    temp_dir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(temp_dir.name, "patients.db")
+    build_stand_in(db_path, args.rows, args.seed)
+    pool = ConnectionPool(lambda: sqlite3.connect(db_path, check_same_thread=False), size=2)
+    catalog = SchemaCatalog(refresh_seconds=float('inf'), fallback=SCHEMA)
+
+    print(f"LLM {args.llm_ms:g} ms, think time {args.think_ms:g} ms, prediction accuracy {args.accuracy:.0%}")
+    print(f"{'prefetch':<10}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'LLM calls':>11}")
+    try:
+        for name, prefetch in (("off", False), ("on", True)):
+            stub.calls = {"sql": 0, "predict": 0}
+            latencies, prefetch_stats = run_mode(prefetch, conversations, pool, catalog, args.think_ms)
+            print(f"{name:<10}{percentile(latencies, 0.5):>9.0f}{percentile(latencies, 0.95):>9.0f}"
+                  f"{statistics.mean(latencies):>9.0f}{stub.calls['sql'] + stub.calls['predict']:>11}")
+        totals = {key: sum(stats[key] for stats in prefetch_stats)
+                  for key in ("predicted", "executed", "hits", "misses", "wasted", "refused", "failed",
+                              "llm_seconds", "db_seconds", "wasted_db_seconds")}
+        lookups = totals["hits"] + totals["misses"]
+        print(f"\nprefetch: {totals['hits']}/{lookups} questions answered from a prefetch "
+              f"({totals['hits'] / lookups:.0%}), {totals['predicted']} follow-ups predicted, "
+              f"{totals['executed']} run, {totals['wasted']} unused ({totals['wasted'] / max(totals['executed'], 1):.0%}), "
+              f"{totals['refused']} refused, {totals['failed']} failed")
+        print(f"background work: {totals['llm_seconds']:.2f}s LLM, {totals['db_seconds']:.3f}s queries "
+              f"({totals['wasted_db_seconds']:.3f}s wasted)")
+    finally:
+        pool.close()
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Prompt tokens per question: the original natural_language_to_sql prompt vs sql_prompt.build_messages.
+
+Replays a scripted conversation (follow-up questions whose results include LONGTEXT
+symptoms/note values) and counts the prompt tokens of every LLM call. "original" is
+the old full-schema f-string with up to three raw result rows per past turn; "compact"
+is the cached compact schema plus history trimmed to PROMPT_HISTORY_TOKENS.
+Token counts use tiktoken when installed, otherwise a 4-characters-per-token estimate.
+
+Usage:
+    python -m benchmarks.bench_prompt_tokens [--text-kb 2] [--history-tokens 400]
+"""
+import argparse
+import time
+
+import sql_prompt
+from nlp_to_sql import compact_row
+from sql_prompt import build_messages, count_tokens
+
+SYSTEM_MESSAGE = ("You are a helpful assistant that writes SQL queries based on natural language "
+                  "and conversation context. Return only the SQL query.")
+
+# (question, generated SQL, row count)
+CONVERSATION = [
+    ("How many patients are there?", "SELECT COUNT(*) FROM patient_personal_details", 1),
+    ("Show me the female patients", "SELECT * FROM patient_personal_details WHERE gender = 'female'", 412),
+    ("Only those older than 60", "SELECT * FROM patient_personal_details WHERE gender = 'female' AND age > 60", 57),
+    ("What are their symptoms?", "SELECT name, symptoms FROM patient_personal_details WHERE gender = 'female' AND age > 60", 57),
+    ("Which of them have blood group O+?", "SELECT * FROM patient_personal_details WHERE gender = 'female' AND age > 60 AND blood = 'O+'", 9),
+    ("Add their notes", "SELECT name, blood, note FROM patient_personal_details WHERE gender = 'female' AND age > 60 AND blood = 'O+'", 9),
+    ("How many video sessions did they have?", "SELECT COUNT(*) FROM patient_personal_details WHERE gender = 'female' AND age > 60 AND blood = 'O+' AND session_type = 1", 1),
+    ("List inpatients in Delhi", "SELECT * FROM patient_personal_details WHERE patient_type = 'inpatient' AND location = 'Delhi'", 23),
+    ("Sort them by admission date", "SELECT * FROM patient_personal_details WHERE patient_type = 'inpatient' AND location = 'Delhi' ORDER BY date", 23),
+    ("Who is their doctor?", "SELECT name, doctor_id FROM patient_personal_details WHERE patient_type = 'inpatient' AND location = 'Delhi'", 23),
+]
+
+
+def fake_rows(sql, row_count, long_text):
+    """Up to three result rows shaped like what the query would return"""
+    if sql.startswith("SELECT COUNT"):
+        return [(row_count,)]
+    full_row = lambda i: (i, f"uuid-{i}", None, f"P{i:05d}", f"Patient {i}", 61 + i, 160, 70, None, "O+", "female",
+                          "2024-05-01", "Delhi", "inpatient", long_text, long_text, "10:00", "Metformin", "Gold",
+                          7, 1, 3, 2, "2024-05-01 10:00:00", "2024-05-02 09:00:00", None, 1, long_text, '{"a": 1}')
+    if sql.startswith("SELECT *"):
+        return [full_row(i) for i in range(min(3, row_count))]
+    return [(f"Patient {i}", long_text) for i in range(min(3, row_count))]
+
+
+def original_prompt(nl_query, history):
+    """The prompt natural_language_to_sql used to build (context from up to five raw turns)"""
+    context = ""
+    if history:
+        context = "\n\nPrevious conversation context:\n"
+        for i, entry in enumerate(history[-5:], 1):
+            context += f"{i}. User asked: '{entry['user_input']}'\n"
+            context += f"   Generated SQL: {entry['sql_query']}\n"
+            if entry['results_preview']:
+                preview = str(entry['results_preview'])
+                context += f"   Results: {preview + '...' if entry['row_count'] > len(entry['results_preview']) else preview}\n"
+            context += "\n"
+
+    prompt = f"""
+    You are an assistant that converts natural language into SQL queries.
+
+    Here is the database schema:
+
+    Table: patient_personal_details
+    - id (BIGINT, Primary Key, Auto Increment)
+    - uuid (VARCHAR): Unique universal identifier
+    - mob_db_id (VARCHAR): Mobile DB reference
+    - patient_id (VARCHAR): External or hospital patient ID
+    - name (VARCHAR): Patient's full name
+    - age (INT): Patient's age
+    - height (INT): Patient's height in cm
+    - weight (INT): Patient's weight in kg
+    - avatar (VARCHAR): URL to avatar/profile image
+    - blood (VARCHAR): Blood group (e.g., A+, B-)
+    - gender (VARCHAR): Gender of the patient
+    - date (VARCHAR): Visit or admission date
+    - location (VARCHAR): Physical location of the patient or visit
+    - patient_type (VARCHAR): Type/category of patient (e.g., outpatient, inpatient)
+    - symptoms (LONGTEXT): Symptoms described by the patient
+    - note (LONGTEXT): Additional medical or personal notes
+    - time_slot (VARCHAR): Appointment or session time slot
+    - current_medication (VARCHAR): Ongoing medications
+    - policy_enrolled (VARCHAR): Insurance or health policy details
+    - doctor_id (INT): Associated doctor's ID
+    - organisation_id (BIGINT): Related organization ID
+    - assign_to (INT): ID of assigned staff or system
+    - created_by_id (INT): ID of user who created the record
+    - created_at (TIMESTAMP): Record creation time
+    - updated_at (TIMESTAMP): Last update timestamp
+    - deleted_at (TIMESTAMP): Deletion timestamp (if soft deleted)
+    - session_type (INT): Type of session (e.g., 1 for video, 2 for audio)
+    - last_activity (LONGTEXT): Description of the last activity
+    - other_field_values (LONGTEXT): JSON or extended data fields
+
+    Additional Context:
+    - Use only this table when generating queries
+    - When user refers to "patients", interpret them directly as entries in this table
+    - If the user asks for "names", select the `name` column
+    - If the user asks about time, appointment, or sessions, refer to `date`, `time_slot`, and `session_type`
+    - If the user asks for filters like age, gender, or blood group, use corresponding fields
+    - If the user asks "how many", return a COUNT query
+    - Follow-up questions may refer to earlier queries, so include {context} if relevant
+    - Use standard SQL syntax
+    - Output only the SQL query—no explanations or commentary
+
+    {context}
+
+    Based on the schema and previous conversation context, convert the following natural language question into a SQL query.
+    Consider any references to previous queries or results.
+
+    Current Question: "{nl_query}"
+
+    SQL Query:
+    """
+    return [{"role": "system", "content": SYSTEM_MESSAGE}, {"role": "user", "content": prompt}]
+
+
+def compact_prompt(nl_query, history):
+    return build_messages(nl_query, history)[0]
+
+
+def message_tokens(messages):
+    return sum(count_tokens(message["content"]) for message in messages)
+
+
+def run(builder, long_text, compact_history):
+    history = []
+    tokens = []
+    start = time.perf_counter()
+    for question, sql, row_count in CONVERSATION:
+        tokens.append(message_tokens(builder(question, history)))
+        rows = fake_rows(sql, row_count, long_text)
+        if compact_history:
+            # What add_to_history keeps now: previews with long values cut short
+            rows = [compact_row(row) for row in rows]
+        history.append({"user_input": question, "sql_query": sql, "results_preview": rows,
+                        "row_count": row_count, "error": None})
+    return tokens, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text-kb", type=float, default=2, help="size of each LONGTEXT value")
+    parser.add_argument("--history-tokens", type=int, default=sql_prompt.PROMPT_HISTORY_TOKENS)
+    args = parser.parse_args()
+    sql_prompt.PROMPT_HISTORY_TOKENS = args.history_tokens
+    long_text = ("fever and persistent cough, " * int(args.text_kb * 1024 / 28 + 1))[:int(args.text_kb * 1024)]
+
+    original, original_seconds = run(original_prompt, long_text, compact_history=False)
+    compact, compact_seconds = run(compact_prompt, long_text, compact_history=True)
+
+    tokenizer = "tiktoken" if sql_prompt._encoder() is not None else "~4 chars/token estimate"
+    print(f"{len(CONVERSATION)} questions, {args.text_kb:g} KB LONGTEXT values, history budget "
+          f"{args.history_tokens} tokens ({tokenizer})")
+    print(f"{'turn':<6}{'original':>10}{'compact':>10}{'saved':>8}")
+    for turn, (before, after) in enumerate(zip(original, compact), 1):
+        print(f"{turn:<6}{before:>10}{after:>10}{1 - after / before:>8.0%}")
+    print(f"{'total':<6}{sum(original):>10}{sum(compact):>10}{1 - sum(compact) / sum(original):>8.0%}")
+    print(f"build time: original {original_seconds * 1000:.2f} ms, compact {compact_seconds * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
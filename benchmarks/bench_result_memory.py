@@ -0,0 +1,96 @@
+"""
+Peak memory of a large SELECT: fetchall() vs streaming batches.
+
+Builds a synthetic SQLite copy of patients_personal_details with LONGTEXT-sized
+symptoms/note values, then runs "SELECT *" once the old way (fetchall, full
+result kept in history) and once through ConversationalSQLAssistant's
+streaming execute_sql_query (fetchmany batches, row cap, preview-only history).
+Printed output goes to /dev/null so only fetching and retention are measured.
+
+Usage:
+    python -m benchmarks.bench_result_memory [--rows 50000] [--text-kb 2] [--max-rows 1000]
+"""
+import argparse
+import contextlib
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import nlp_to_sql
+from db_pool import ConnectionPool
+
+QUERY = "SELECT * FROM patients_personal_details"
+
+
+def build_table(path, rows, text_kb):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE patients_personal_details (
+        id INTEGER PRIMARY KEY, name TEXT, age INT, gender TEXT, symptoms TEXT, note TEXT)""")
+    long_text = "lorem ipsum dolor sit amet " * (text_kb * 1024 // 27)
+    conn.executemany(
+        "INSERT INTO patients_personal_details (name, age, gender, symptoms, note) VALUES (?, ?, ?, ?, ?)",
+        ((f"Patient {i}", 20 + i % 60, "F" if i % 2 else "M", long_text, long_text) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def fetchall_path(connect):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    rows = cursor.fetchall()
+    for row in rows:
+        print(" | ".join(f"{str(val):15}" for val in row))
+    cursor.close()
+    conn.close()
+    # The old history entry kept every row
+    return [{"results": rows}]
+
+
+def streaming_path(connect):
+    assistant = nlp_to_sql.ConversationalSQLAssistant(pool=ConnectionPool(connect, size=1), sql_cache=False,
+                                                   history_store=False)
+    results = assistant.execute_sql_query(QUERY)
+    assistant.add_to_history("show all patients", QUERY, results)
+    return assistant.conversation_history
+
+
+def measure(func, connect):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        history = func(connect)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del history
+    return peak / 1e6, retained / 1e6, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--text-kb", type=int, default=2)
+    parser.add_argument("--max-rows", type=int, default=nlp_to_sql.MAX_RESULT_ROWS)
+    args = parser.parse_args()
+    nlp_to_sql.MAX_RESULT_ROWS = args.max_rows
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        build_table(path, args.rows, args.text_kb)
+        connect = lambda: sqlite3.connect(path, check_same_thread=False)
+        print(f"{args.rows} rows with 2 x {args.text_kb} KB text columns, row cap {args.max_rows}")
+        print(f"{'path':<12}{'peak MB':>10}{'retained MB':>14}{'seconds':>10}")
+        for name, func in (("fetchall", fetchall_path), ("streaming", streaming_path)):
+            peak, retained, elapsed = measure(func, connect)
+            print(f"{name:<12}{peak:>10.1f}{retained:>14.1f}{elapsed:>10.2f}")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
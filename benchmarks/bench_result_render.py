@@ -0,0 +1,116 @@
+"""
+Memory, render time and summary stats: list-of-tuples results vs the columnar ResultSet.
+
+Generates patients_personal_details-like rows in fetchmany-sized batches and
+keeps them once as a list of tuples (the old execute_sql_query result) and
+once through ResultSetBuilder. For each size it reports the memory held by
+the result (tracemalloc), the time to print it (old: every row, new: the
+first page plus the "N rows" note) and the time for per-column count/min/
+max/mean (old: Python loops over the rows, new: ResultSet.summary()).
+Printed output goes to /dev/null.
+
+Usage:
+    python -m benchmarks.bench_result_render [--sizes 10000,100000,1000000] [--batch-size 500]
+"""
+import argparse
+import contextlib
+import gc
+import os
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from result_set import RESULT_PAGE_ROWS, ResultSetBuilder
+
+COLUMNS = ["id", "name", "age", "weight", "blood", "created_at"]
+BLOOD_GROUPS = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
+
+
+def row_batches(rows, batch_size, seed=7):
+    """Rows as a MySQL cursor returns them (ints, str, Decimal, datetime; some NULLs), batch by batch"""
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    for offset in range(0, rows, batch_size):
+        yield [
+            (index, f"Patient {index}", rng.randint(1, 95),
+             Decimal(f"{rng.uniform(40, 120):.2f}") if index % 17 else None,
+             rng.choice(BLOOD_GROUPS), start + timedelta(minutes=index))
+            for index in range(offset, min(offset + batch_size, rows))
+        ]
+
+
+def collect_rows(rows, batch_size):
+    result = []
+    for batch in row_batches(rows, batch_size):
+        result.extend(batch)
+    return result
+
+
+def collect_columnar(rows, batch_size):
+    builder = ResultSetBuilder(COLUMNS)
+    for batch in row_batches(rows, batch_size):
+        builder.add_rows(batch)
+    return builder.build()
+
+
+def render_rows(rows):
+    for row in rows:
+        print(" | ".join(f"{str(val):15}" for val in row))
+    print(f"({len(rows)} rows)")
+
+
+def render_columnar(result):
+    print(result.render_page(0, RESULT_PAGE_ROWS))
+    print(f"({len(result)} rows, showing the first {RESULT_PAGE_ROWS})")
+
+
+def summarize_rows(rows):
+    stats = []
+    for index, name in enumerate(COLUMNS):
+        values = [row[index] for row in rows if row[index] is not None]
+        entry = {"column": name, "count": len(values), "min": min(values), "max": max(values)}
+        if isinstance(values[0], (int, float, Decimal)):
+            entry["mean"] = float(sum(values)) / len(values)
+        stats.append(entry)
+    return stats
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(collect, render, summarize, rows, batch_size):
+    gc.collect()
+    tracemalloc.start()
+    result = collect(rows, batch_size)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    render_ms = timed(render, result)
+    summary_ms = timed(summarize, result)
+    del result
+    return retained / 1e6, peak / 1e6, render_ms, summary_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'result':<9}{'held MB':>10}{'peak MB':>10}{'render ms':>12}{'summary ms':>12}")
+    for rows in (int(size) for size in args.sizes.split(",")):
+        for name, collect, render, summarize in (
+            ("tuples", collect_rows, render_rows, summarize_rows),
+            ("columnar", collect_columnar, render_columnar, lambda result: result.summary()),
+        ):
+            held, peak, render_ms, summary_ms = measure(collect, render, summarize, rows, args.batch_size)
+            print(f"{rows:>9} {name:<9}{held:>10.1f}{peak:>10.1f}{render_ms:>12.1f}{summary_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Sharded execution check: the same queries on one database and on organisation_id shards.
+
+Builds the seeded SQLite stand-in of patients_personal_details, splits its rows
+by organisation_id into --shards SQLite databases (described by a DB_SHARDS_PATH
+file, as in production), and runs the corpus's expected SQL plus queries covering
+COUNT/SUM/AVG/MIN/MAX, GROUP BY, DISTINCT, SELECT *, ORDER BY and LIMIT/OFFSET through
+execute_sql_query on the shards. Each merged result (rows and column names) is
+compared with the result of the unsharded database, and the time of both is reported.
+
+Usage:
+    python -m benchmarks.bench_sharded_sql [--shards 3] [--rows 50000]
+"""
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import nlp_to_sql
+from benchmarks.bench_nl2sql import CORPUS_PATH, build_stand_in, comparable
+from schema_catalog import SchemaCatalog
+from sharding import ShardingError, create_shard_router_from_env
+from sql_guard import apply_row_limit
+from sql_prompt import SCHEMA
+
+TABLE = "patients_personal_details"
+QUERIES = [
+    f"SELECT COUNT(*), SUM(weight), AVG(age), MIN(height), MAX(created_at) FROM {TABLE}",
+    f"SELECT COUNT(*) FROM {TABLE} WHERE organisation_id = 2",
+    f"SELECT name, age FROM {TABLE} WHERE organisation_id IN (1, 4) AND age > 90 ORDER BY age DESC, id",
+    f"SELECT organisation_id, COUNT(*) AS patients, AVG(weight) AS avg_weight FROM {TABLE} GROUP BY organisation_id ORDER BY organisation_id",
+    f"SELECT location, gender, COUNT(*) FROM {TABLE} WHERE deleted_at IS NULL GROUP BY location, gender ORDER BY COUNT(*) DESC, location, gender",
+    f"SELECT COUNT(*) FROM {TABLE} GROUP BY blood ORDER BY blood",
+    f"SELECT DISTINCT location FROM {TABLE} ORDER BY location LIMIT 3 OFFSET 1",
+    f"SELECT id, name FROM {TABLE} ORDER BY weight DESC, id LIMIT 10",
+    f"SELECT id FROM {TABLE} ORDER BY created_at, id LIMIT 5, 5",
+    f"SELECT doctor_id, MAX(age) AS oldest FROM {TABLE} WHERE patient_type = 'inpatient' GROUP BY doctor_id ORDER BY oldest DESC, doctor_id LIMIT 3",
+    f"SELECT name FROM {TABLE} WHERE organisation_id = 3 OR organisation_id = 5 ORDER BY id LIMIT 20",
+    f"SELECT COUNT(DISTINCT blood) FROM {TABLE}",
+    f"SELECT * FROM {TABLE} WHERE age > 90",
+    f"SELECT * FROM {TABLE} WHERE age > 90 ORDER BY weight DESC, id LIMIT 15",
+    f"SELECT p.* FROM {TABLE} p WHERE p.organisation_id IN (2, 3) ORDER BY p.created_at, p.id LIMIT 10",
+    f"SELECT *, age * 2 AS double_age FROM {TABLE} WHERE height > 195 ORDER BY double_age, id",
+]
+
+
+def build_shards(source_path, directory, shard_count):
+    """Copy the stand-in's rows into one database per shard; organisation n goes to shard (n - 1) % shard_count"""
+    shards = []
+    for index in range(shard_count):
+        path = os.path.join(directory, f"shard{index + 1}.db")
+        organisation_ids = [org for org in range(1, 6) if (org - 1) % shard_count == index]
+        conn = sqlite3.connect(path)
+        conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+        conn.execute(f"CREATE TABLE {TABLE} AS SELECT * FROM source.{TABLE} WHERE 0")
+        conn.execute(f"INSERT INTO {TABLE} SELECT * FROM source.{TABLE} WHERE organisation_id IN "
+                     f"({', '.join(str(org) for org in organisation_ids)})")
+        conn.commit()
+        conn.close()
+        shards.append({"name": f"shard{index + 1}", "organisation_ids": organisation_ids, "sqlite": path})
+    shards_path = os.path.join(directory, "shards.json")
+    with open(shards_path, "w") as f:
+        json.dump({"shards": shards}, f)
+    return shards_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as f:
+        corpus = json.load(f)
+    queries = [turn["expected_sql"] for c in corpus["conversations"] for turn in c["turns"]] + QUERIES
+
+    temp_dir = tempfile.TemporaryDirectory()
+    source_path = os.path.join(temp_dir.name, "patients.db")
+    build_stand_in(source_path, args.rows, args.seed)
+    os.environ["DB_SHARDS_PATH"] = build_shards(source_path, temp_dir.name, args.shards)
+    router = create_shard_router_from_env(nlp_to_sql.create_db_pool)
+    assistant = nlp_to_sql.ConversationalSQLAssistant(
+        pool=router.primary_pool, sql_cache=False, query_results_cache=False, history_store=False,
+        schema_catalog=SchemaCatalog(refresh_seconds=float('inf'), fallback=SCHEMA), shards=router
+    )
+    single = sqlite3.connect(source_path)
+
+    print(f"{args.rows} rows in {args.shards} shards")
+    failures, single_ms, sharded_ms, routed = [], [], [], {"one shard": 0, "fan-out": 0, "refused": 0}
+    try:
+        for sql in queries:
+            limited = apply_row_limit(sql, nlp_to_sql.MAX_RESULT_ROWS)
+            start = time.perf_counter()
+            cursor = single.execute(limited)
+            expected = cursor.fetchall()
+            expected_columns = [description[0] for description in cursor.description]
+            single_ms.append((time.perf_counter() - start) * 1000)
+
+            try:
+                route = router.route(limited)
+                routed["fan-out" if route.merge else "one shard"] += 1
+            except ShardingError:
+                routed["refused"] += 1
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                rows = assistant.execute_sql_query(sql)
+            sharded_ms.append((time.perf_counter() - start) * 1000)
+
+            ordered = " order by " in sql.lower()
+            if not ordered and len(expected) == nlp_to_sql.MAX_RESULT_ROWS:
+                # Which rows a capped query without ORDER BY returns is up to the database: any of them will do
+                full = set(comparable(single.execute(sql).fetchall(), False))
+                matches = rows is not None and len(rows) == len(expected) and set(comparable(rows, False)) <= full
+            else:
+                matches = rows is not None and comparable(rows, ordered) == comparable(expected, ordered)
+            # Column names too, so a * that lost its expansion is caught
+            matches = matches and list(rows.columns) == expected_columns
+            if rows is None:
+                print(f"  not run on shards: {sql}")
+            elif not matches:
+                failures.append(sql)
+                print(f"  MISMATCH: {sql}")
+    finally:
+        single.close()
+        router.close()
+        temp_dir.cleanup()
+
+    print(f"{len(queries)} queries: {routed['one shard']} on one shard, {routed['fan-out']} fanned out and merged, "
+          f"{routed['refused']} refused; {len(failures)} mismatches")
+    print(f"{'':<10}{'p50 ms':>9}{'max ms':>9}")
+    for name, timings in (("single", single_ms), ("sharded", sharded_ms)):
+        print(f"{name:<10}{statistics.median(timings):>9.1f}{max(timings):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Queries/sec with and without connection pooling.
+
+By default runs against a SQLite stand-in whose connect() sleeps for
+--connect-latency-ms to model the TCP + auth handshake of a MySQL server.
+Pass --mysql to run against DB_CONFIG from nlp_to_sql instead.
+
+Usage:
+    python -m benchmarks.bench_sql_pool [--mysql] [--queries 2000] [--threads 8]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_pool import ConnectionPool
+
+QUERY = "SELECT COUNT(*) FROM patients_personal_details WHERE age > 40"
+
+
+def sqlite_stand_in(connect_latency_ms):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE patients_personal_details (id INTEGER PRIMARY KEY, name TEXT, age INT)")
+    conn.executemany("INSERT INTO patients_personal_details (name, age) VALUES (?, ?)",
+                     [(f"Patient {i}", 20 + i % 60) for i in range(10000)])
+    conn.commit()
+    conn.close()
+
+    def connect():
+        time.sleep(connect_latency_ms / 1000)
+        return sqlite3.connect(path, check_same_thread=False)
+    return connect, path
+
+
+def run_query(conn):
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    cursor.fetchall()
+    cursor.close()
+
+
+def unpooled(connect):
+    def query():
+        conn = connect()
+        try:
+            run_query(conn)
+        finally:
+            conn.close()
+    return query
+
+
+def pooled(pool):
+    def query():
+        with pool.connection() as conn:
+            run_query(conn)
+    return query
+
+
+def measure(query, total, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: query(), range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mysql", action="store_true")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--connect-latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    cleanup = None
+    if args.mysql:
+        import mysql.connector
+        from nlp_to_sql import DB_CONFIG
+        connect = lambda: mysql.connector.connect(**DB_CONFIG)
+    else:
+        connect, cleanup = sqlite_stand_in(args.connect_latency_ms)
+
+    pool = ConnectionPool(connect, size=args.threads)
+    try:
+        without_pool = measure(unpooled(connect), args.queries, args.threads)
+        with_pool = measure(pooled(pool), args.queries, args.threads)
+    finally:
+        pool.close()
+        if cleanup:
+            os.unlink(cleanup)
+
+    print(f"{args.queries} queries on {args.threads} threads ({'MySQL' if args.mysql else 'SQLite stand-in'})")
+    print(f"without pooling: {without_pool:10.1f} queries/s")
+    print(f"with pooling:    {with_pool:10.1f} queries/s  ({with_pool / without_pool:.1f}x)")
+    print(f"pool stats: {pool.stats}")
+
+
+if __name__ == "__main__":
+    main()
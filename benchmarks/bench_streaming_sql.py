@@ -0,0 +1,170 @@
+"""
+Time to first row: waiting for the whole completion vs streaming with early execution.
+
+Starts a local fake of the OpenAI chat completions API that "generates" the
+recorded answers from nl2sql_corpus.json token by token (--ttft-ms before the
+first token, --token-ms per token), wrapped in a code fence and followed by
+--tail-tokens of explanation, as chat models tend to add. The corpus is then
+replayed through process_query against the seeded SQLite stand-in twice: with
+LLM_STREAMING off (the SQL runs after the last token) and on (the SQL runs as
+soon as its terminating semicolon arrives and the stream is dropped).
+
+Usage:
+    python -m benchmarks.bench_streaming_sql [--ttft-ms 300] [--token-ms 20] [--tail-tokens 60]
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+
+import nlp_to_sql
+from benchmarks.bench_nl2sql import CORPUS_PATH, build_stand_in
+from db_pool import ConnectionPool
+from schema_catalog import SchemaCatalog
+from sql_prompt import SCHEMA
+
+EXPLANATION = ("This query selects the matching rows from the patients table using the conditions "
+               "from your question and the previous conversation turns. ")
+
+
+def fake_completion_tokens(sql, tail_tokens):
+    """The completion as ~4-character tokens: fenced SQL followed by an explanation"""
+    text = f"```sql\n{sql.rstrip(';')};\n```\n\n" + (EXPLANATION * (tail_tokens // 20 + 1))
+    tokens = re.findall(r'.{1,4}', text, re.DOTALL)
+    sql_tokens = len(re.findall(r'.{1,4}', f"```sql\n{sql.rstrip(';')};", re.DOTALL))
+    return tokens[:sql_tokens + tail_tokens]
+
+
+def make_handler(answers, args, stats):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        def log_message(self, *_):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = body["messages"][-1]["content"]
+            question = prompt.rsplit('Question: "', 1)[-1].split('"\nSQL:')[0]
+            tokens = fake_completion_tokens(answers.get(question, "SELECT 1"), args.tail_tokens)
+            time.sleep(args.ttft_ms / 1000)
+
+            if not body.get("stream"):
+                time.sleep(len(tokens) * args.token_ms / 1000)
+                payload = json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion", "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(tokens)},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                stats["tokens_sent"] += len(tokens)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                for token in tokens:
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": body["model"],
+                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    stats["tokens_sent"] += 1
+                    time.sleep(args.token_ms / 1000)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client has what it needs and closed the stream
+                pass
+
+    return FakeOpenAIHandler
+
+
+class TimedAssistant(nlp_to_sql.ConversationalSQLAssistant):
+    """Notes when the result header is printed, i.e. when the first rows are about to be shown"""
+
+    first_row_at = None
+
+    def print_results_header(self, columns):
+        if self.first_row_at is None:
+            self.first_row_at = time.perf_counter()
+        super().print_results_header(columns)
+
+
+def run_mode(streaming, conversations, pool, catalog):
+    nlp_to_sql.LLM_STREAMING = streaming
+    first_row, total, llm = [], [], []
+    for conversation in conversations:
+        assistant = TimedAssistant(pool=pool, sql_cache=False, query_results_cache=False,
+                                   schema_catalog=catalog, history_store=False)
+        for turn in conversation["turns"]:
+            assistant.first_row_at = None
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                assistant.process_query(turn["question"])
+            total.append((time.perf_counter() - start) * 1000)
+            llm.append(assistant.stage_timings.get("llm", 0.0) * 1000)
+            if assistant.first_row_at is not None:
+                first_row.append((assistant.first_row_at - start) * 1000)
+    return first_row, total, llm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ttft-ms", type=float, default=300, help="fake time to first token")
+    parser.add_argument("--token-ms", type=float, default=20, help="fake time per generated token")
+    parser.add_argument("--tail-tokens", type=int, default=60, help="tokens generated after the SQL")
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH) as f:
+        conversations = json.load(f)["conversations"]
+    answers = {turn["question"]: turn["expected_sql"] for c in conversations for turn in c["turns"]}
+
+    stats = {"tokens_sent": 0}
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(answers, args, stats))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    openai.api_base = f"http://127.0.0.1:{port}/v1"
+    openai.api_key = "sk-fake"
+
+    temp_dir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(temp_dir.name, "patients.db")
+    build_stand_in(db_path, args.rows, seed=42)
+    pool = ConnectionPool(lambda: sqlite3.connect(db_path, check_same_thread=False), size=2)
+    catalog = SchemaCatalog(refresh_seconds=float('inf'), fallback=SCHEMA)
+
+    print(f"fake LLM: {args.ttft_ms:g} ms to first token, {args.token_ms:g} ms/token, "
+          f"{args.tail_tokens} tokens after the SQL")
+    print(f"{'mode':<10}{'first row p50':>15}{'p95':>10}{'LLM p50':>10}{'total p50':>11}{'tokens sent':>13}")
+    try:
+        for name, streaming in (("full", False), ("stream", True)):
+            stats["tokens_sent"] = 0
+            first_row, total, llm = run_mode(streaming, conversations, pool, catalog)
+            ordered = sorted(first_row)
+            p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+            print(f"{name:<10}{statistics.median(first_row):>13.0f}ms{p95:>8.0f}ms"
+                  f"{statistics.median(llm):>8.0f}ms{statistics.median(total):>9.0f}ms{stats['tokens_sent']:>13}")
+    finally:
+        server.shutdown()
+        pool.close()
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
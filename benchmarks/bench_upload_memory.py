@@ -0,0 +1,98 @@
+"""
+Peak RSS per concurrent upload, before and after streaming upload handling.
+
+"before" reads each whole upload into memory and parses it from a BytesIO,
+as /extract used to; "after" spools it to disk in chunks and parses it with
+doc_parsers.extract_text_from_path (memory-mapped PDFs, incremental TXT
+decoding). Each mode runs in its own subprocess so the peak RSS figures do
+not mix.
+
+Usage:
+    python -m benchmarks.bench_upload_memory --concurrency 16 --size-mb 20 [--pdf]
+"""
+import argparse
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_document(kind, size_mb):
+    if kind == "pdf":
+        from benchmarks.bench_pdf_extraction import build_synthetic_pdf
+        data = build_synthetic_pdf(page_count=max(1, size_mb * 250))
+    else:
+        line = b"Patient Name: John Smith  DOB: 01/15/1985  follow-up notes and history.\n"
+        data = line * (size_mb * 1024 * 1024 // len(line))
+    fd, path = tempfile.mkstemp(suffix=f".{kind}")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def run_before(filename, path):
+    import doc_parsers
+    with open(path, "rb") as upload:
+        data = upload.read()
+    if filename.endswith(".txt"):
+        return data.decode("utf-8")
+    return doc_parsers.extract_text_from_pdf(io.BytesIO(data), max_chars=0)
+
+
+def run_after(filename, path):
+    import doc_parsers
+    import title_generation
+    with open(path, "rb") as upload:
+        spooled_path, _ = title_generation.spool_file(upload)
+    try:
+        return doc_parsers.extract_text_from_path(spooled_path)
+    finally:
+        os.unlink(spooled_path)
+
+
+def run_mode(mode, kind, concurrency, size_mb):
+    import title_generation  # noqa: F401  (import cost is part of the baseline, not the measurement)
+    path = build_document(kind, size_mb)
+    baseline = peak_rss_mb()
+    handler = run_before if mode == "before" else run_after
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda _: handler(f"upload.{kind}", path), range(concurrency)))
+    finally:
+        os.unlink(path)
+    growth = peak_rss_mb() - baseline
+    print(f"{mode:<8} peak RSS growth {growth:9.1f} MB  ({growth / concurrency:7.2f} MB per concurrent upload)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size-mb", type=int, default=20)
+    parser.add_argument("--pdf", action="store_true", help="Upload generated PDFs instead of TXT files")
+    parser.add_argument("--mode", choices=["before", "after"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    kind = "pdf" if args.pdf else "txt"
+
+    if args.mode:
+        run_mode(args.mode, kind, args.concurrency, args.size_mb)
+        return
+
+    print(f"{args.concurrency} concurrent {kind.upper()} uploads of ~{args.size_mb} MB")
+    for mode in ("before", "after"):
+        command = [sys.executable, "-m", "benchmarks.bench_upload_memory", "--mode", mode,
+                   "--concurrency", str(args.concurrency), "--size-mb", str(args.size_mb)]
+        if args.pdf:
+            command.append("--pdf")
+        subprocess.run(command, check=True)
+
+
+if __name__ == "__main__":
+    main()
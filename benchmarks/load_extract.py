@@ -0,0 +1,82 @@
+"""
+Load test for the /extract endpoint.
+
+Sends a steady stream of small TXT uploads and measures their latency, first on
+an idle server and then while large PDFs are being uploaded and parsed in the
+background. With parsing off the event loop the p99 of the small requests
+should stay roughly flat between the two phases.
+
+Usage:
+    uvicorn title_generation:app --port 8000
+    python -m benchmarks.load_extract path/to/large.pdf --requests 200 --concurrency 16
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SMALL_DOC = b"Patient Name: John Smith\nDOB: 01/15/1985\n"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def timed_small_request(url):
+    start = time.perf_counter()
+    response = requests.post(url, files={"file": ("small.txt", SMALL_DOC, "text/plain")})
+    response.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+def run_phase(url, total, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda _: timed_small_request(url), range(total)))
+
+
+def upload_large_pdf(url, pdf_bytes, stop_event):
+    while not stop_event.is_set():
+        requests.post(url, files={"file": ("large.pdf", pdf_bytes, "application/pdf")})
+
+
+def report(label, latencies):
+    print(f"{label:<28} n={len(latencies):<5} "
+          f"p50={statistics.median(latencies):8.1f}ms "
+          f"p99={percentile(latencies, 99):8.1f}ms "
+          f"max={max(latencies):8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("large_pdf", help="Large PDF to parse in the background")
+    parser.add_argument("--url", default="http://localhost:8000/extract")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--background-uploaders", type=int, default=2)
+    args = parser.parse_args()
+
+    with open(args.large_pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    report("idle", run_phase(args.url, args.requests, args.concurrency))
+
+    stop_event = threading.Event()
+    uploaders = [
+        threading.Thread(target=upload_large_pdf, args=(args.url, pdf_bytes, stop_event), daemon=True)
+        for _ in range(args.background_uploaders)
+    ]
+    for thread in uploaders:
+        thread.start()
+    try:
+        report("while parsing large PDF", run_phase(args.url, args.requests, args.concurrency))
+    finally:
+        stop_event.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Load test for the multi-session SQL assistant server (sql_server.py).
+
+Opens N sessions and has each one ask a scripted conversation over HTTP, all
+concurrently, then reports throughput and latency percentiles per question.
+Rate-limited answers (429) are counted separately and retried after Retry-After.
+
+With --simulate the server is started in-process against a SQLite stand-in of
+patients_personal_details, with the OpenAI call replaced by a fixed-latency fake,
+so the run measures the server itself (sessions, event loop, threadpool bridge,
+connection pool) rather than OpenAI or MySQL.
+
+Usage:
+    uvicorn sql_server:app --port 8001
+    python -m benchmarks.load_sql_server --url http://localhost:8001 --sessions 50 --questions 6
+
+    python -m benchmarks.load_sql_server --simulate --sessions 200 --llm-ms 300
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# (question, SQL the fake LLM answers with)
+CONVERSATION = [
+    ("How many patients are there?", "SELECT COUNT(*) FROM patients_personal_details"),
+    ("Show me the female patients", "SELECT id, name, age FROM patients_personal_details WHERE gender = 'F'"),
+    ("Only those older than 60", "SELECT id, name, age FROM patients_personal_details WHERE gender = 'F' AND age > 60"),
+    ("How many of them are there?", "SELECT COUNT(*) FROM patients_personal_details WHERE gender = 'F' AND age > 60"),
+    ("List patients with blood group O+", "SELECT id, name FROM patients_personal_details WHERE blood = 'O+'"),
+    ("What is their average age?", "SELECT AVG(age) FROM patients_personal_details WHERE blood = 'O+'"),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE patients_personal_details (
+        id INTEGER PRIMARY KEY, name TEXT, age INT, gender TEXT, blood TEXT)""")
+    conn.executemany(
+        "INSERT INTO patients_personal_details (name, age, gender, blood) VALUES (?, ?, ?, ?)",
+        ((f"Patient {i}", 20 + i % 70, "F" if i % 2 else "M", ("A+", "B+", "O+", "AB-")[i % 4]) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def start_simulated_server(args, db_path):
+    """Run sql_server in a background thread with a SQLite pool and a fake LLM; returns its base URL"""
+    os.environ.setdefault("SQL_CACHE_ENABLED", "0" if args.no_sql_cache else "1")
+    os.environ.setdefault("SQL_CACHE_PATH", os.path.join(os.path.dirname(db_path), "sql_cache.json"))
+    os.environ.setdefault("SESSION_RATE_PER_MINUTE", str(args.rate_per_minute))
+    os.environ.setdefault("SCHEMA_CACHE_PATH", "")
+    os.environ.setdefault("HISTORY_STORE_PATH", os.path.join(os.path.dirname(db_path), "history.db"))
+
+    import openai
+    import uvicorn
+    import nlp_to_sql
+    import sql_server
+    from db_pool import ConnectionPool
+
+    answers = dict(CONVERSATION)
+
+    async def fake_acreate(messages, stream=False, **kwargs):
+        await asyncio.sleep(args.llm_ms / 1000)
+        question = messages[-1]["content"].rsplit('Question: "', 1)[-1].split('"\nSQL:')[0]
+        content = answers.get(question, "SELECT 1")
+        if not stream:
+            return {"choices": [{"message": {"content": content}}]}
+
+        async def chunks():
+            yield {"choices": [{"delta": {"content": content + ";"}}]}
+        return chunks()
+
+    openai.ChatCompletion.acreate = fake_acreate
+    nlp_to_sql.db_pool = ConnectionPool(lambda: sqlite3.connect(db_path, check_same_thread=False),
+                                        size=nlp_to_sql.DB_POOL_SIZE)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(sql_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+def run_session(base_url, questions, think_seconds):
+    """One simulated analyst; returns (latencies in ms, rate-limited count, failures)"""
+    http = requests.Session()
+    latencies, limited, failed = [], 0, 0
+    response = http.post(f"{base_url}/sessions")
+    response.raise_for_status()
+    session_id = response.json()["session_id"]
+
+    for index in range(questions):
+        question = CONVERSATION[index % len(CONVERSATION)][0]
+        while True:
+            start = time.perf_counter()
+            response = http.post(f"{base_url}/sessions/{session_id}/query", json={"question": question})
+            if response.status_code != 429:
+                break
+            limited += 1
+            time.sleep(float(response.headers.get("Retry-After", "1")))
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200 or response.json().get("error"):
+            failed += 1
+        time.sleep(think_seconds)
+
+    http.delete(f"{base_url}/sessions/{session_id}")
+    return latencies, limited, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--sessions", type=int, default=50, help="concurrent simulated sessions")
+    parser.add_argument("--questions", type=int, default=len(CONVERSATION), help="questions per session")
+    parser.add_argument("--think-ms", type=float, default=0, help="pause between a session's questions")
+    parser.add_argument("--simulate", action="store_true", help="serve in-process with a fake LLM and SQLite")
+    parser.add_argument("--llm-ms", type=float, default=300, help="fake LLM latency (--simulate)")
+    parser.add_argument("--rows", type=int, default=10000, help="rows in the SQLite table (--simulate)")
+    parser.add_argument("--rate-per-minute", type=float, default=600, help="per-session rate limit (--simulate)")
+    parser.add_argument("--no-sql-cache", action="store_true", help="send every question to the LLM (--simulate)")
+    args = parser.parse_args()
+
+    base_url, server, temp_dir = args.url, None, None
+    if args.simulate:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "patients.db")
+        build_database(db_path, args.rows)
+        base_url, server = start_simulated_server(args, db_path)
+
+    try:
+        start = time.perf_counter()
+        # The in-process server logs every query; keep that out of the report
+        quiet = open(os.devnull, "w") if args.simulate else None
+        with contextlib.redirect_stdout(quiet or sys.stdout), ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            outcomes = list(executor.map(
+                lambda _: run_session(base_url, args.questions, args.think_ms / 1000), range(args.sessions)
+            ))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.should_exit = True
+            quiet.close()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    latencies = [latency for session_latencies, _, _ in outcomes for latency in session_latencies]
+    limited = sum(outcome[1] for outcome in outcomes)
+    failed = sum(outcome[2] for outcome in outcomes)
+    print(f"{args.sessions} sessions x {args.questions} questions in {elapsed:.2f}s "
+          f"-> {len(latencies) / elapsed:.1f} questions/s ({failed} failed, {limited} rate-limited retries)")
+    print(f"latency p50={statistics.median(latencies):.1f}ms p95={percentile(latencies, 95):.1f}ms "
+          f"p99={percentile(latencies, 99):.1f}ms max={max(latencies):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections created by a connect() factory.
+    Idle connections are health-checked before reuse and replaced when they have dropped.
+    """
+
+    def __init__(self, connect, size=5, timeout=30, health_check_interval=30):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # (connection, time it was returned to the pool); used LIFO to keep a warm core of connections in use
+        self._idle = []
+        self._created = 0
+        self._lock = threading.Lock()
+        # Signalled whenever a connection is returned or a slot is freed, so waiters can take either
+        self._available = threading.Condition(self._lock)
+        self.stats = {"created": 0, "reused": 0, "replaced": 0}
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._lock:
+            self.stats["created"] += 1
+        return conn
+
+    @staticmethod
+    def is_healthy(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _rollback_quietly(conn):
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _free_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _checkout(self):
+        """An idle (connection, returned_at) pair, or (None, None) after reserving a slot for a new one"""
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(f"No database connection available within {self.timeout}s")
+                self._available.wait(remaining)
+
+    def acquire(self):
+        conn, returned_at = self._checkout()
+        if conn is None:
+            try:
+                return self._new_connection()
+            except Exception:
+                self._free_slot()
+                raise
+
+        if time.monotonic() - returned_at > self.health_check_interval and not self.is_healthy(conn):
+            self._close_quietly(conn)
+            with self._lock:
+                self.stats["replaced"] += 1
+            try:
+                return self._new_connection()
+            except Exception:
+                self._free_slot()
+                raise
+        with self._lock:
+            self.stats["reused"] += 1
+        return conn
+
+    def release(self, conn, broken=False):
+        """Return a connection to the pool; broken connections are closed and their slot freed"""
+        if not broken:
+            # End the transaction the statement opened (autocommit is off), so the next user of the
+            # connection gets a fresh snapshot instead of the data as of this connection's first query
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._close_quietly(conn)
+            self._free_slot()
+            return
+        with self._available:
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            # The statement may have failed because the connection dropped; only keep it if it still works
+            self._rollback_quietly(conn)
+            self.release(conn, broken=not self.is_healthy(conn))
+            raise
+        except GeneratorExit:
+            # A streaming generator was closed early; it is responsible for draining its cursor
+            self.release(conn)
+            raise
+        except BaseException:
+            # Interrupted mid-statement (KeyboardInterrupt, cancelled generator): state is unknown
+            self.release(conn, broken=True)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
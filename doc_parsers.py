@@ -0,0 +1,278 @@
+import os
+import re
+import mmap
+import codecs
+import zipfile
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+from extraction_cache import PROMPT_TEXT_CHARS
+
+# PDF parsing stops after this many characters / pages (0 means no limit)
+PDF_MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', str(PROMPT_TEXT_CHARS)))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '0'))
+# TXT decoding stops after this many characters (0 means no limit)
+TXT_MAX_CHARS = int(os.getenv('TXT_MAX_CHARS', str(PROMPT_TEXT_CHARS)))
+TXT_CHUNK_BYTES = 1024 * 1024
+
+PDF = "application/pdf"
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+ODT = "application/vnd.oasis.opendocument.text"
+RTF = "application/rtf"
+HTML = "text/html"
+TEXT = "text/plain"
+
+# Short names used by the PARSER_BACKEND_<FORMAT> overrides
+FORMAT_NAMES = {PDF: "PDF", DOCX: "DOCX", ODT: "ODT", RTF: "RTF", HTML: "HTML", TEXT: "TXT"}
+
+# MIME type -> list of (priority, backend name, parse function); higher priority is faster
+PARSERS = {}
+
+
+class UnsupportedFormatError(ValueError):
+    """Raised when a document's format cannot be parsed"""
+
+
+def register_parser(mime_type, name, priority=0):
+    """Register a parse function (path -> text) as a backend for a MIME type"""
+    def decorator(func):
+        PARSERS.setdefault(mime_type, []).append((priority, name, func))
+        PARSERS[mime_type].sort(key=lambda backend: -backend[0])
+        return func
+    return decorator
+
+
+def sniff_mime_type(path: str) -> str:
+    """Detect a document's MIME type from its leading bytes rather than its filename"""
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+
+    if head.startswith(b'%PDF-'):
+        return PDF
+    if head.startswith(b'{\\rtf'):
+        return RTF
+    if head.startswith(b'PK\x03\x04'):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+                if 'mimetype' in names and archive.read('mimetype').strip() == ODT.encode():
+                    return ODT
+                if 'word/document.xml' in names:
+                    return DOCX
+        except zipfile.BadZipFile:
+            pass
+        return "application/zip"
+
+    stripped = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if stripped.startswith(b'<!doctype html') or stripped.startswith(b'<html') or b'<body' in stripped:
+        return HTML
+    try:
+        # The 4 KB sample may end mid-character, so only the complete prefix has to decode
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return TEXT
+    except UnicodeDecodeError:
+        return "application/octet-stream"
+
+
+def iter_pdf_page_text(file, max_pages: int = 0):
+    """Yield the text of each non-empty page, parsing pages one at a time"""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(file)
+    for index, page in enumerate(reader.pages):
+        if max_pages and index >= max_pages:
+            break
+        text = page.extract_text()
+        if text:
+            yield text
+
+
+def collect_page_text(pages, max_chars: int = PDF_MAX_CHARS) -> str:
+    """Join page texts, stopping as soon as max_chars characters have been collected"""
+    collected_pages = []
+    collected = 0
+    for text in pages:
+        collected_pages.append(text)
+        collected += len(text) + 1
+        if max_chars and collected >= max_chars:
+            break
+    return "\n".join(collected_pages)
+
+
+def extract_text_from_pdf(file, max_chars: int = PDF_MAX_CHARS, max_pages: int = PDF_MAX_PAGES) -> str:
+    """Extract PDF text with PyPDF2, stopping as soon as max_chars characters have been collected"""
+    return collect_page_text(iter_pdf_page_text(file, max_pages), max_chars)
+
+
+def extract_text_from_txt(file, max_chars: int = TXT_MAX_CHARS) -> str:
+    """Decode UTF-8 text chunk by chunk, stopping once max_chars characters have been decoded"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parts = []
+    collected = 0
+    while True:
+        chunk = file.read(TXT_CHUNK_BYTES)
+        text = decoder.decode(chunk, final=not chunk)
+        parts.append(text)
+        collected += len(text)
+        if not chunk or (max_chars and collected >= max_chars):
+            break
+    return "".join(parts)
+
+
+@contextmanager
+def mapped_file(path: str):
+    """
+    Read-only memory map of a file, so large PDFs are paged in by the OS instead of copied onto the heap.
+    Yields None for an empty file, which cannot be mapped.
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield None
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+@register_parser(PDF, "pymupdf", priority=30)
+def parse_pdf_pymupdf(path: str) -> str:
+    import fitz
+    with fitz.open(path) as doc:
+        pages = (page.get_text() for index, page in enumerate(doc) if not PDF_MAX_PAGES or index < PDF_MAX_PAGES)
+        return collect_page_text((text for text in pages if text), PDF_MAX_CHARS)
+
+
+@register_parser(PDF, "pypdf", priority=20)
+def parse_pdf_pypdf(path: str) -> str:
+    import pypdf
+    # Given a path, PdfReader reads the whole file into a BytesIO; a stream is used as is
+    with mapped_file(path) as mapped:
+        if mapped is None:
+            return ""
+        reader = pypdf.PdfReader(mapped)
+        pages = (page.extract_text() for index, page in enumerate(reader.pages) if not PDF_MAX_PAGES or index < PDF_MAX_PAGES)
+        return collect_page_text((text for text in pages if text), PDF_MAX_CHARS)
+
+
+@register_parser(PDF, "pypdf2", priority=10)
+def parse_pdf_pypdf2(path: str) -> str:
+    with mapped_file(path) as mapped:
+        return extract_text_from_pdf(mapped) if mapped is not None else ""
+
+
+@register_parser(DOCX, "python-docx")
+def parse_docx(path: str) -> str:
+    from docx import Document
+    doc = Document(path)
+    return "\n".join([para.text for para in doc.paragraphs])
+
+
+@register_parser(TEXT, "utf-8")
+def parse_txt(path: str) -> str:
+    with open(path, 'rb') as f:
+        return extract_text_from_txt(f)
+
+
+@register_parser(RTF, "striprtf", priority=10)
+def parse_rtf_striprtf(path: str) -> str:
+    from striprtf.striprtf import rtf_to_text
+    with open(path, encoding='latin-1') as f:
+        return rtf_to_text(f.read())
+
+
+@register_parser(RTF, "builtin-rtf")
+def parse_rtf_builtin(path: str) -> str:
+    """Minimal RTF stripper: drops control groups and words, keeps the plain text runs"""
+    with open(path, encoding='latin-1') as f:
+        rtf = f.read()
+    rtf = re.sub(r'\{\\\*[^{}]*\}|\{\\(?:fonttbl|colortbl|stylesheet|info)[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', '', rtf)
+    rtf = re.sub(r"\\'([0-9a-fA-F]{2})", lambda m: bytes.fromhex(m.group(1)).decode('cp1252'), rtf)
+    rtf = re.sub(r'\\(?:par|line)\b ?', '\n', rtf)
+    rtf = re.sub(r'\\[a-zA-Z]+-?\d* ?|[{}]', '', rtf)
+    return rtf.replace('\\\\', '\\').strip()
+
+
+class _HTMLTextExtractor(HTMLParser):
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'section'}
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+@register_parser(HTML, "html.parser")
+def parse_html(path: str) -> str:
+    extractor = _HTMLTextExtractor()
+    with open(path, encoding='utf-8', errors='replace') as f:
+        extractor.feed(f.read())
+    extractor.close()
+    return re.sub(r'\n\s*\n+', '\n', "".join(extractor.parts)).strip()
+
+
+@register_parser(ODT, "odf-xml")
+def parse_odt(path: str) -> str:
+    text_ns = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+    paragraphs = []
+    with zipfile.ZipFile(path) as archive, archive.open('content.xml') as content:
+        for _, element in ElementTree.iterparse(content):
+            if element.tag in (f'{text_ns}p', f'{text_ns}h'):
+                paragraphs.append("".join(element.itertext()))
+                element.clear()
+    return "\n".join(paragraphs)
+
+
+def backend_available(mime_type: str, name: str) -> bool:
+    """Whether the optional library a backend depends on can be imported"""
+    required_module = {
+        "pymupdf": "fitz", "pypdf": "pypdf", "pypdf2": "PyPDF2",
+        "python-docx": "docx", "striprtf": "striprtf",
+    }.get(name)
+    if required_module is None:
+        return True
+    try:
+        __import__(required_module)
+        return True
+    except ImportError:
+        return False
+
+
+def select_backends() -> dict:
+    """
+    Pick the fastest importable backend per MIME type.
+    A specific backend can be forced with PARSER_BACKEND_<FORMAT>, e.g. PARSER_BACKEND_PDF=pypdf2.
+    """
+    selected = {}
+    for mime_type, backends in PARSERS.items():
+        forced = os.getenv(f"PARSER_BACKEND_{FORMAT_NAMES.get(mime_type, '')}")
+        for _, name, func in backends:
+            if forced and name != forced:
+                continue
+            if backend_available(mime_type, name):
+                selected[mime_type] = (name, func)
+                break
+    return selected
+
+
+ACTIVE_BACKENDS = select_backends()
+
+
+def extract_text_from_path(path: str) -> str:
+    """Sniff a spooled document's type and parse it with the selected backend"""
+    mime_type = sniff_mime_type(path)
+    backend = ACTIVE_BACKENDS.get(mime_type)
+    if backend is None:
+        raise UnsupportedFormatError(f"Unsupported file format: {mime_type}")
+    return backend[1](path)
@@ -2,16 +2,20 @@ import os
 import requests
 from dotenv import load_dotenv
 
+import http_client
+
 load_dotenv()
 
+ELEVENLABS_API_BASE = os.getenv('ELEVENLABS_API_BASE', 'https://api.elevenlabs.io/v1')
+
 def get_agent_data(agent_id, api_key):
-    url = f"https://api.elevenlabs.io/v1/convai/agents/{agent_id}"
+    url = f"{ELEVENLABS_API_BASE}/convai/agents/{agent_id}"
     headers = {
         "Accept": "application/json",
         "xi-api-key": api_key
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = http_client.request("GET", url, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -95,7 +99,7 @@ def update_agent_prompt():
     """.format(user=user)
 
    
-    url = f"https://api.elevenlabs.io/v1/convai/agents/{agent_id}"
+    url = f"{ELEVENLABS_API_BASE}/convai/agents/{agent_id}"
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json",
@@ -112,7 +116,7 @@ def update_agent_prompt():
 
 
     try:
-        response = requests.patch(url, headers=headers, json=payload)
+        response = http_client.request("PATCH", url, headers=headers, json=payload)
         response.raise_for_status()
         print("Prompt updated successfully!")
 
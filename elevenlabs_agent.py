@@ -8,12 +8,16 @@ from elevenlabs.conversational_ai.conversation import Conversation
 from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
 from dotenv import load_dotenv
 
+import http_client
+
 load_dotenv()
 
 class ElevenLabsAgentAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url=None, session=None):
         self.api_key = api_key
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.base_url = base_url or os.getenv('ELEVENLABS_API_BASE', 'https://api.elevenlabs.io/v1')
+        # Pooled keep-alive session shared with the rest of the process unless one is given
+        self.session = session or http_client.get_session()
         self.headers = {
             "Accept": "application/json",
             "Content-Type": "application/json",
@@ -24,7 +28,7 @@ class ElevenLabsAgentAPI:
         """Get agent configuration data"""
         url = f"{self.base_url}/convai/agents/{agent_id}"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = http_client.request("GET", url, session=self.session, headers=self.headers)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -35,7 +39,7 @@ class ElevenLabsAgentAPI:
         """Update agent configuration using PATCH endpoint"""
         url = f"{self.base_url}/convai/agents/{agent_id}"
         try:
-            response = requests.patch(url, headers=self.headers, json=agent_config)
+            response = http_client.request("PATCH", url, session=self.session, headers=self.headers, json=agent_config)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -59,7 +63,7 @@ class ElevenLabsAgentAPI:
     def conversation_detail(self, conversation_id):
         url = f"{self.base_url}/convai/conversations/{conversation_id}"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = http_client.request("GET", url, session=self.session, headers=self.headers)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
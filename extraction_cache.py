@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Number of leading characters of a document that get_title_from_doc sends to the model
+PROMPT_TEXT_CHARS = 2000
+
+
+def hash_prompt_text(text: str) -> str:
+    """Cache key for the normalized slice of text that actually reaches the prompt"""
+    normalized = re.sub(r'\s+', ' ', text[:PROMPT_TEXT_CHARS]).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL and a maximum entry count"""
+
+    def __init__(self, max_entries=10000, ttl_seconds=86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk cache that survives restarts, evicting least recently used entries past max_entries"""
+
+    def __init__(self, path="extraction_cache.db", max_entries=100000, ttl_seconds=30 * 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl_seconds, now)
+            )
+            self._conn.execute(
+                """DELETE FROM cache WHERE key IN (
+                    SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ExtractionCache:
+    """Two-level result cache: by uploaded file bytes, then by the normalized prompt text"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        # Lookups and writes do disk I/O and commits, so async callers should run them in a thread
+        self.blocking = isinstance(backend, SQLiteCache)
+        self.stats = {
+            "file": {"hits": 0, "misses": 0},
+            "text": {"hits": 0, "misses": 0},
+        }
+
+    def _lookup(self, level, key):
+        value = self.backend.get(f"{level}:{key}")
+        self.stats[level]["hits" if value is not None else "misses"] += 1
+        return value
+
+    def get_by_file(self, file_key):
+        return self._lookup("file", file_key)
+
+    def get_by_text(self, text_key):
+        return self._lookup("text", text_key)
+
+    def set(self, result, file_key=None, text_key=None):
+        if file_key:
+            self.backend.set(f"file:{file_key}", result)
+        if text_key:
+            self.backend.set(f"text:{text_key}", result)
+
+    def get_stats(self):
+        stats = {"backend": type(self.backend).__name__, "entries": len(self.backend)}
+        for level, counters in self.stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            stats[level] = dict(counters, hit_rate=round(counters["hits"] / lookups, 4) if lookups else 0.0)
+        return stats
+
+
+def create_cache_from_env():
+    """Build the cache configured by EXTRACTION_CACHE_* variables, or None when disabled"""
+    backend_name = os.getenv('EXTRACTION_CACHE_BACKEND', 'memory').lower()
+    max_entries = int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', '10000'))
+    ttl_seconds = int(os.getenv('EXTRACTION_CACHE_TTL_SECONDS', '86400'))
+
+    if backend_name in ('none', 'off', ''):
+        return None
+    if backend_name == 'sqlite':
+        path = os.getenv('EXTRACTION_CACHE_PATH', 'extraction_cache.db')
+        return ExtractionCache(SQLiteCache(path, max_entries=max_entries, ttl_seconds=ttl_seconds))
+    if backend_name == 'memory':
+        return ExtractionCache(MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds))
+    raise ValueError(f"Unknown EXTRACTION_CACHE_BACKEND: {backend_name}")
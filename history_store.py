@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+
+
+def hash_results(rows) -> str:
+    """Fingerprint of a full result set, so identical answers can be recognised without storing them"""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(repr(tuple(row)).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class HistoryStore:
+    """
+    SQLite-backed conversation history for the SQL assistant, one row per turn.
+    Entries are compact (question, SQL, row count and result hash) and indexed by session and
+    time, so sessions can be resumed and read back page by page. Result previews are patient data
+    and stay in memory unless store_previews is set.
+    """
+
+    def __init__(self, path="sql_history.db", store_previews=False):
+        self.store_previews = store_previews
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                user_input TEXT NOT NULL,
+                sql_query TEXT,
+                row_count INTEGER,
+                result_hash TEXT,
+                results_preview TEXT,
+                error TEXT
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_session ON history (session_id, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history (created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _entry(row) -> dict:
+        entry = dict(row)
+        entry["timestamp"] = datetime.fromtimestamp(entry.pop("created_at")).isoformat()
+        entry["results_preview"] = json.loads(entry["results_preview"]) if entry["results_preview"] else []
+        return entry
+
+    def add_entry(self, session_id, user_input, sql_query, row_count=None, result_hash=None,
+                  results_preview=None, error=None, created_at=None):
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO history (session_id, created_at, user_input, sql_query, row_count,
+                                        result_hash, results_preview, error)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (session_id, created_at or time.time(), user_input, sql_query, row_count, result_hash,
+                 json.dumps(results_preview, default=str) if results_preview and self.store_previews else None,
+                 error)
+            )
+            self._conn.commit()
+
+    def recent_entries(self, session_id, limit) -> list:
+        """The session's last `limit` turns, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM history WHERE session_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [self._entry(row) for row in reversed(rows)]
+
+    def entries(self, session_id, limit=100, offset=0) -> list:
+        """One page of the session's turns, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM history WHERE session_id = ? ORDER BY created_at, id LIMIT ? OFFSET ?",
+                (session_id, limit, offset)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def iter_entries(self, session_id, page_size=100):
+        """All of the session's turns, oldest first, read one page at a time"""
+        offset = 0
+        while True:
+            page = self.entries(session_id, page_size, offset)
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    def has_session(self, session_id) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM history WHERE session_id = ? LIMIT 1", (session_id,)).fetchone()
+        return row is not None
+
+    def sessions(self, limit=20) -> list:
+        """Most recently active sessions with their number of turns"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT session_id, COUNT(*) AS turns, MAX(created_at) AS last_active
+                   FROM history GROUP BY session_id ORDER BY last_active DESC LIMIT ?""",
+                (limit,)
+            ).fetchall()
+        return [
+            {"session_id": row["session_id"], "turns": row["turns"],
+             "last_active": datetime.fromtimestamp(row["last_active"]).isoformat()}
+            for row in rows
+        ]
+
+    def clear_session(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def delete_older_than(self, seconds) -> int:
+        """Drop turns older than the retention period; returns how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM history WHERE created_at < ?", (time.time() - seconds,))
+            self._conn.commit()
+        return cursor.rowcount
+
+
+def create_history_store_from_env():
+    """
+    History store at HISTORY_STORE_PATH, or None when it is empty (history then lives in memory only).
+    HISTORY_STORE_PREVIEWS=1 also persists the result preview rows of each turn.
+    """
+    path = os.getenv('HISTORY_STORE_PATH', 'sql_history.db')
+    if not path:
+        return None
+    store = HistoryStore(path, store_previews=os.getenv('HISTORY_STORE_PREVIEWS', '0') == '1')
+    retention_days = float(os.getenv('HISTORY_RETENTION_DAYS', '0'))
+    if retention_days:
+        store.delete_older_than(retention_days * 86400)
+    return store
@@ -0,0 +1,108 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Counter
+
+# Keep-alive connections kept per host, and connect / read timeouts in seconds
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+# Retries of throttled (429) and failed (5xx, connection error) calls, with jittered exponential
+# backoff: the n-th wait is random between 0 and min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**n) seconds
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '4'))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.5'))
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '20'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Methods that are safe to send again after a 5xx or a dropped connection. PATCH is included because
+# the agent config PATCHes only set fields, so repeating one has the same effect
+RETRY_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'PATCH'}
+
+HTTP_REQUESTS_TOTAL = Counter(
+    "http_client_requests_total", "Outgoing HTTP calls by method and final status (or error)",
+    ["method", "status"]
+)
+HTTP_RETRIES_TOTAL = Counter(
+    "http_client_retries_total", "Outgoing HTTP attempts that were retried, by reason", ["reason"]
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size=HTTP_POOL_SIZE) -> requests.Session:
+    """Session whose connections stay open between calls, so each host costs one TLS handshake"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """The session shared by every API client in the process"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def backoff_delay(attempt: int, base=HTTP_BACKOFF_BASE, cap=HTTP_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff, so throttled clients do not retry in lockstep"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_seconds(response):
+    """Wait asked for by a Retry-After header (seconds or HTTP date), or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def request(method, url, session=None, max_retries=HTTP_MAX_RETRIES, timeout=None, **kwargs) -> requests.Response:
+    """
+    session.request() with default timeouts and retries. Throttled (429) calls are retried for every
+    method, 5xx responses and connection errors only for RETRY_METHODS. Waits follow Retry-After when
+    the server sends one (capped at HTTP_BACKOFF_MAX), otherwise backoff_delay(). The last response is
+    returned as is, so callers keep using raise_for_status(); the last connection error is raised.
+    """
+    session = session or get_session()
+    method = method.upper()
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == max_retries or method not in RETRY_METHODS:
+                HTTP_REQUESTS_TOTAL.inc(1, method, type(e).__name__)
+                raise
+            HTTP_RETRIES_TOTAL.inc(1, type(e).__name__)
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        retryable = response.status_code == 429 or (
+            response.status_code in RETRY_STATUSES and method in RETRY_METHODS
+        )
+        if not retryable or attempt == max_retries:
+            HTTP_REQUESTS_TOTAL.inc(1, method, response.status_code)
+            return response
+        HTTP_RETRIES_TOTAL.inc(1, response.status_code)
+        wait = retry_after_seconds(response)
+        response.close()
+        time.sleep(min(wait, HTTP_BACKOFF_MAX) if wait is not None else backoff_delay(attempt))
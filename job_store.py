@@ -0,0 +1,82 @@
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStore:
+    """SQLite-backed state for /jobs so queued work and results survive restarts"""
+
+    def __init__(self, path="jobs.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                path TEXT,
+                file_key TEXT,
+                callback_url TEXT,
+                result TEXT,
+                source TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def create_job(self, filename, path, file_key, callback_url=None) -> str:
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, status, filename, path, file_key, callback_url, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, filename, path, file_key, callback_url, time.time())
+        )
+        return job_id
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def mark_running(self, job_id):
+        self._execute("UPDATE jobs SET status = ? WHERE id = ?", (RUNNING, job_id))
+
+    def mark_done(self, job_id, result, source):
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, source = ?, path = NULL, finished_at = ? WHERE id = ?",
+            (DONE, json.dumps(result), source, time.time(), job_id)
+        )
+
+    def mark_failed(self, job_id, error):
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, path = NULL, finished_at = ? WHERE id = ?",
+            (FAILED, error, time.time(), job_id)
+        )
+
+    def unfinished_job_ids(self):
+        """Jobs that were queued or running when the service last stopped, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row["id"] for row in rows]
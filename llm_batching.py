@@ -0,0 +1,62 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Collects items submitted within a short window and hands them to an async
+    handler as one batch; each submitter gets back its own result.
+    The handler receives a list of items and must return results in the same order.
+    """
+
+    def __init__(self, handler, max_batch_size=8, max_wait_ms=50):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self._pending = []
+        self._timer = None
+        # The event loop only keeps weak references to tasks, so in-flight batches are held here
+        self._tasks = set()
+        self.stats = {"batches": 0, "items": 0, "failed_batches": 0}
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.stats["batches"] += 1
+        self.stats["items"] += len(batch)
+        try:
+            results = await self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self):
+        batches = self.stats["batches"]
+        return dict(self.stats, average_batch_size=round(self.stats["items"] / batches, 2) if batches else 0.0)
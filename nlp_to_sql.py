@@ -4,6 +4,20 @@ import os
 import mysql.connector
 from datetime import datetime
 import json
+import re
+import time
+from contextlib import contextmanager
+import uuid
+from sql_cache import create_result_cache_from_env, create_sql_cache_from_env
+from db_pool import ConnectionPool, PoolTimeoutError
+from metrics import Histogram
+from sql_guard import apply_row_limit, check_query, estimate_examined_rows, first_complete_statement
+from sql_prompt import SCHEMA, build_messages, count_tokens, render_history
+from schema_catalog import create_schema_catalog_from_env
+from history_store import create_history_store_from_env, hash_results
+from result_set import RESULT_PAGE_ROWS, ResultSet, ResultSetBuilder, format_row, render_summary
+from prefetch import FollowUpPrefetcher
+from sharding import ShardingError, create_shard_router_from_env, merge_results, merged_columns
 
 load_dotenv()
 
@@ -18,229 +32,560 @@ DB_CONFIG = {
     "database": "employee_data"
 }
 
-# Define your database schema
-schema_description = """
-You are an assistant that converts natural language into SQL queries.
-
-Here is the database schema:
-Table: patients_personal_details
-    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
-    uuid VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    mob_db_id VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    patient_id VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    name VARCHAR(255) COLLATE utf8mb4_unicode_ci NOT NULL,
-    age INT,
-    height INT,
-    weight INT,
-    avatar VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    blood VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    gender VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    date VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    location VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    patient_type VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    symptoms LONGTEXT COLLATE utf8mb4_unicode_ci,
-    note LONGTEXT COLLATE utf8mb4_unicode_ci,
-    time_slot VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    current_medication VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    policy_enrolled VARCHAR(255) COLLATE utf8mb4_unicode_ci,
-    doctor_id INT,
-    organisation_id BIGINT UNSIGNED,
-    assign_to INT,
-    created_by_id INT,
-    created_at TIMESTAMP NULL,
-    updated_at TIMESTAMP NULL,
-    deleted_at TIMESTAMP NULL,
-    session_type INT,
-    last_activity LONGTEXT COLLATE utf8mb4_unicode_ci,
-    other_field_values LONGTEXT COLLATE utf8mb4_unicode_ci
-
-Additional Context:
-- When user refers to "patients", they likely mean "patient_personal_details" (assuming this is for a healthcare organization)
-- When user asks follow-up questions, consider the previous context and queries
-"""
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', '30'))
+
+# Result fetching: rows per fetchmany() batch, the most rows a query may return
+# (enforced with an injected LIMIT), and rows / characters per value kept in history
+FETCH_BATCH_SIZE = int(os.getenv('FETCH_BATCH_SIZE', '500'))
+MAX_RESULT_ROWS = int(os.getenv('MAX_RESULT_ROWS', '1000'))
+HISTORY_PREVIEW_ROWS = int(os.getenv('HISTORY_PREVIEW_ROWS', '3'))
+HISTORY_PREVIEW_CHARS = int(os.getenv('HISTORY_PREVIEW_CHARS', '100'))
+# Stream completions and run the SQL as soon as its statement is complete, dropping the rest of the stream.
+# Off by default: streamed completions report no token usage (see log_streamed_usage)
+LLM_STREAMING = os.getenv('LLM_STREAMING', '0') == '1'
+# Turns kept in memory for prompts and follow-up detection; older ones are only in the history store
+HISTORY_WINDOW = int(os.getenv('HISTORY_WINDOW', '10'))
+# Predict and pre-run likely follow-up questions in the background after each answer (see prefetch)
+SQL_PREFETCH = os.getenv('SQL_PREFETCH', '0') == '1'
+
+# Errors that mean the connection itself dropped, so the query is retried once on a fresh one
+CONNECTION_ERRORS = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+SQL_STAGE_SECONDS = Histogram(
+    "sql_assistant_stage_seconds", "Time spent in each stage of answering a question",
+    ["stage"]
+)
+
+db_pool = None
+db_shards = None
+schema_catalog = None
+history_store = None
+# SELECT results shared by every assistant in the process, invalidated by writes
+result_cache = create_result_cache_from_env()
+
+def create_db_pool(config=DB_CONFIG):
+    """Pool of MySQL connections shared by every assistant in the process"""
+    return ConnectionPool(
+        lambda: mysql.connector.connect(**config),
+        size=DB_POOL_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        health_check_interval=DB_HEALTH_CHECK_INTERVAL
+    )
+
+def get_db_shards():
+    """Shard router when DB_SHARDS_PATH lists databases split by organisation_id, otherwise False"""
+    global db_shards
+    if db_shards is None:
+        db_shards = create_shard_router_from_env(create_db_pool) or False
+    return db_shards
+
+def get_db_pool():
+    global db_pool
+    if db_pool is None:
+        shards = get_db_shards()
+        # Every shard has the same schema, so introspection reads the first one
+        db_pool = shards.primary_pool if shards else create_db_pool()
+    return db_pool
+
+def get_history_store():
+    """Persistent conversation history shared by every assistant, or None when disabled"""
+    global history_store
+    if history_store is None:
+        history_store = create_history_store_from_env() or False
+    return history_store
+
+def get_schema_catalog():
+    """Introspected schema shared by every assistant, loaded from its disk cache when present"""
+    global schema_catalog
+    if schema_catalog is None:
+        schema_catalog = create_schema_catalog_from_env(fallback=SCHEMA)
+    return schema_catalog
+
+def clean_sql_text(sql_query):
+    """Model output without markdown code fences or anything the model wrote after the statement"""
+    statement = first_complete_statement(sql_query)
+    if statement:
+        return statement
+    sql_query = sql_query.strip()
+    if sql_query.startswith('```sql'):
+        sql_query = sql_query.replace('```sql', '').replace('```', '').strip()
+    elif sql_query.startswith('```'):
+        sql_query = sql_query.replace('```', '').strip()
+    return sql_query
+
+def clean_sql_response(response):
+    """SQL text of a chat completion, without markdown code fences"""
+    usage = response.get('usage') or {}
+    if usage:
+        print(f"LLM usage: {usage.get('prompt_tokens')} prompt, {usage.get('completion_tokens')} completion tokens")
+    return clean_sql_text(response['choices'][0]['message']['content'])
+
+def chunk_text(chunk):
+    return chunk['choices'][0].get('delta', {}).get('content') or ""
+
+def log_streamed_usage(text):
+    """Streamed completions carry no usage, so report a local count of the completion text that was read"""
+    print(f"LLM usage: ~{count_tokens(text)} completion tokens (streamed, estimated)")
+
+def collect_streamed_sql(chunks):
+    """Read streamed completion chunks until the first statement is complete; the rest of the stream is dropped"""
+    text = ""
+    for chunk in chunks:
+        text += chunk_text(chunk)
+        sql_query = first_complete_statement(text)
+        if sql_query:
+            # Stop reading; the model's trailing output (closing fence, explanations) is not needed
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            log_streamed_usage(text)
+            return sql_query
+    log_streamed_usage(text)
+    return clean_sql_text(text)
+
+async def acollect_streamed_sql(chunks):
+    """collect_streamed_sql for the async stream of acreate(stream=True)"""
+    text = ""
+    async for chunk in chunks:
+        text += chunk_text(chunk)
+        sql_query = first_complete_statement(text)
+        if sql_query:
+            await chunks.aclose()
+            log_streamed_usage(text)
+            return sql_query
+    log_streamed_usage(text)
+    return clean_sql_text(text)
+
+def compact_row(row):
+    """Row preview for history: long text values are cut to HISTORY_PREVIEW_CHARS"""
+    return tuple(
+        value[:HISTORY_PREVIEW_CHARS] + "..." if isinstance(value, str) and len(value) > HISTORY_PREVIEW_CHARS else value
+        for value in row
+    )
 
 class ConversationalSQLAssistant:
-    def __init__(self):
-        self.conversation_history = []
-        self.query_results_cache = {}
+    def __init__(self, pool=None, sql_cache=None, query_results_cache=None, schema_catalog=None,
+                 history_store=None, session_id=None, prefetch=None, shards=None):
+        # Passing the id of an earlier session resumes it from the history store
+        self.session_id = session_id or uuid.uuid4().hex
+        self.history_store = history_store if history_store is not None else get_history_store()
+        self._recent_history = None
+        self.schema_catalog = schema_catalog if schema_catalog is not None else get_schema_catalog()
+        self.query_results_cache = query_results_cache if query_results_cache is not None else result_cache
+        self.pool = pool
+        # Shard router (False for a single database); queries then run on the shards they filter on
+        self.shards = shards if shards is not None else get_db_shards()
+        self.sql_cache = sql_cache if sql_cache is not None else create_sql_cache_from_env()
+        # Prompt size of every LLM call, for the 'cache' command
+        self.prompt_tokens = []
+        # Seconds per stage of the current question (cache_lookup, prompt_build, llm, guard, execute, render);
+        # render is also counted in execute
+        self.stage_timings = {}
+        # Last result and how many of its rows have been printed, for 'more' and 'summary'
+        self.last_result = None
+        self.shown_rows = 0
+        self.prefetcher = FollowUpPrefetcher(self) if (SQL_PREFETCH if prefetch is None else prefetch) else None
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_timings[stage] = self.stage_timings.get(stage, 0.0) + elapsed
+            SQL_STAGE_SECONDS.observe(elapsed, stage)
         
+    @property
+    def conversation_history(self):
+        """The last HISTORY_WINDOW turns, loaded from the history store on first use"""
+        if self._recent_history is None:
+            self._recent_history = (
+                self.history_store.recent_entries(self.session_id, HISTORY_WINDOW) if self.history_store else []
+            )
+        return self._recent_history
+
     def add_to_history(self, user_input, sql_query, results=None, error=None):
-        """Add interaction to conversation history"""
+        """Add interaction to conversation history, keeping only a short preview and a hash of the results"""
         history_entry = {
             "timestamp": datetime.now().isoformat(),
             "user_input": user_input,
             "sql_query": sql_query,
-            "results": results,
+            "results_preview": [compact_row(row) for row in results[:HISTORY_PREVIEW_ROWS]] if results else [],
+            "row_count": len(results) if results is not None else None,
+            "result_hash": hash_results(results) if results is not None else None,
             "error": error
         }
-        self.conversation_history.append(history_entry)
+        history = self.conversation_history
+        history.append(history_entry)
+        del history[:-HISTORY_WINDOW]
+
+        if self.history_store:
+            # The store keeps the preview rows (patient data) only when HISTORY_STORE_PREVIEWS is set
+            try:
+                self.history_store.add_entry(
+                    self.session_id, user_input, sql_query, history_entry["row_count"],
+                    history_entry["result_hash"], history_entry["results_preview"], error
+                )
+            except Exception as e:
+                print(f"Could not save history entry: {e}")
         
     def get_context_from_history(self):
-        """Generate context string from conversation history"""
-        if not self.conversation_history:
-            return ""
-            
-        context = "\n\nPrevious conversation context:\n"
-        for i, entry in enumerate(self.conversation_history[-5:], 1):  # Last 5 interactions
-            context += f"{i}. User asked: '{entry['user_input']}'\n"
-            context += f"   Generated SQL: {entry['sql_query']}\n"
-            if entry['results']:
-                # Limit results display for context
-                results_preview = str(entry['results'][:3]) + "..." if len(entry['results']) > 3 else str(entry['results'])
-                context += f"   Results: {results_preview}\n"
-            if entry['error']:
-                context += f"   Error: {entry['error']}\n"
-            context += "\n"
-        return context
+        """Recent turns for the prompt, trimmed to PROMPT_HISTORY_TOKENS"""
+        return render_history(self.conversation_history)
     
+    def refresh_schema(self):
+        """Re-read changed tables from INFORMATION_SCHEMA once the catalog is SCHEMA_REFRESH_SECONDS old"""
+        self.schema_catalog.refresh_if_stale(self.pool or get_db_pool())
+
+    def build_prompt(self, nl_query):
+        with self.timed("prompt_build"):
+            # Only the tables relevant to the question go into the prompt
+            schema, row_counts = self.schema_catalog.prompt_schema(nl_query, self.conversation_history)
+            messages, tokens = build_messages(nl_query, self.conversation_history, schema, row_counts)
+        self.prompt_tokens.append(tokens["total"])
+        print(f"Prompt: {tokens['total']} tokens (schema {tokens['schema']}, history {tokens['history']})")
+        return messages
+
     def natural_language_to_sql(self, nl_query):
         """Convert natural language to SQL with conversation context"""
-        context = self.get_context_from_history()
-        
-        prompt = f"""
-        You are an assistant that converts natural language into SQL queries.
-
-        Here is the database schema:
-
-        Table: patient_personal_details
-        - id (BIGINT, Primary Key, Auto Increment)
-        - uuid (VARCHAR): Unique universal identifier
-        - mob_db_id (VARCHAR): Mobile DB reference
-        - patient_id (VARCHAR): External or hospital patient ID
-        - name (VARCHAR): Patient's full name
-        - age (INT): Patient's age
-        - height (INT): Patient's height in cm
-        - weight (INT): Patient's weight in kg
-        - avatar (VARCHAR): URL to avatar/profile image
-        - blood (VARCHAR): Blood group (e.g., A+, B-)
-        - gender (VARCHAR): Gender of the patient
-        - date (VARCHAR): Visit or admission date
-        - location (VARCHAR): Physical location of the patient or visit
-        - patient_type (VARCHAR): Type/category of patient (e.g., outpatient, inpatient)
-        - symptoms (LONGTEXT): Symptoms described by the patient
-        - note (LONGTEXT): Additional medical or personal notes
-        - time_slot (VARCHAR): Appointment or session time slot
-        - current_medication (VARCHAR): Ongoing medications
-        - policy_enrolled (VARCHAR): Insurance or health policy details
-        - doctor_id (INT): Associated doctor's ID
-        - organisation_id (BIGINT): Related organization ID
-        - assign_to (INT): ID of assigned staff or system
-        - created_by_id (INT): ID of user who created the record
-        - created_at (TIMESTAMP): Record creation time
-        - updated_at (TIMESTAMP): Last update timestamp
-        - deleted_at (TIMESTAMP): Deletion timestamp (if soft deleted)
-        - session_type (INT): Type of session (e.g., 1 for video, 2 for audio)
-        - last_activity (LONGTEXT): Description of the last activity
-        - other_field_values (LONGTEXT): JSON or extended data fields
-
-        Additional Context:
-        - Use only this table when generating queries
-        - When user refers to "patients", interpret them directly as entries in this table
-        - If the user asks for "names", select the `name` column
-        - If the user asks about time, appointment, or sessions, refer to `date`, `time_slot`, and `session_type`
-        - If the user asks for filters like age, gender, or blood group, use corresponding fields
-        - If the user asks "how many", return a COUNT query
-        - Follow-up questions may refer to earlier queries, so include {context} if relevant
-        - Use standard SQL syntax
-        - Output only the SQL query—no explanations or commentary
-
-        {context}
-
-        Based on the schema and previous conversation context, convert the following natural language question into a SQL query.
-        Consider any references to previous queries or results.
-
-        Current Question: "{nl_query}"
-
-        SQL Query:
-        """
-
-        
+        messages = self.build_prompt(nl_query)
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that writes SQL queries based on natural language and conversation context. Return only the SQL query."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=200
-            )
-            
-            sql_query = response['choices'][0]['message']['content'].strip()
-            # Clean up the response to get only SQL
-            if sql_query.startswith('```sql'):
-                sql_query = sql_query.replace('```sql', '').replace('```', '').strip()
-            elif sql_query.startswith('```'):
-                sql_query = sql_query.replace('```', '').strip()
-                
-            return sql_query
+            with self.timed("llm"):
+                response = openai.ChatCompletion.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=200,
+                    stream=LLM_STREAMING
+                )
+                if LLM_STREAMING:
+                    return collect_streamed_sql(response)
+            return clean_sql_response(response)
             
         except Exception as e:
             print(f"Error generating SQL: {e}")
             return None
 
-    def execute_sql_query(self, sql_query):
-        """Execute SQL query and return results"""
+    async def anatural_language_to_sql(self, nl_query):
+        """natural_language_to_sql without blocking the event loop"""
+        messages = self.build_prompt(nl_query)
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
+            with self.timed("llm"):
+                response = await openai.ChatCompletion.acreate(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=200,
+                    stream=LLM_STREAMING
+                )
+                if LLM_STREAMING:
+                    return await acollect_streamed_sql(response)
+            return clean_sql_response(response)
+
+        except Exception as e:
+            print(f"Error generating SQL: {e}")
+            return None
+
+    def stream_sql_query(self, sql_query, batch_size=FETCH_BATCH_SIZE, pool=None):
+        """
+        Run a query on a pooled connection and yield (columns, rows) batches from an unbuffered
+        cursor, so rows stream from the server instead of being fetched all at once.
+        A query with a result set always yields at least one (possibly empty) batch;
+        statements without one are committed and yield nothing.
+        """
+        if self.shards and pool is None:
+            yield from self.stream_sharded_query(sql_query, batch_size)
+            return
+        pool = pool or self.pool or get_db_pool()
+        with pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(sql_query)
+            exhausted = False
+            try:
+                cursor.execute(sql_query)
+                if cursor.description is None:
+                    conn.commit()
+                    exhausted = True
+                    return
 
-            if cursor.with_rows:
-                rows = cursor.fetchall()
                 columns = [desc[0] for desc in cursor.description]
-                
-                print(f"\nQuery Results ({len(rows)} rows):")
-                print("-" * 50)
-                
-                # Print column headers
-                print(" | ".join(f"{col:15}" for col in columns))
-                print("-" * (len(columns) * 18))
-                
-                # Print rows
-                for row in rows:
-                    print(" | ".join(f"{str(val):15}" for val in row))
-                
-                return rows
-            else:
-                conn.commit()
-                print("Query executed successfully (no return rows).")
+                rows = cursor.fetchmany(batch_size)
+                yield columns, rows
+                while rows:
+                    rows = cursor.fetchmany(batch_size)
+                    if rows:
+                        yield columns, rows
+                exhausted = True
+            finally:
+                if not exhausted:
+                    # Unbuffered cursors must be read to the end before the connection can be reused
+                    try:
+                        while cursor.fetchmany(batch_size):
+                            pass
+                    except Exception:
+                        pass
+                cursor.close()
+
+    def stream_sharded_query(self, sql_query, batch_size=FETCH_BATCH_SIZE):
+        """
+        stream_sql_query over shards: a query filtering on one shard's organisations streams from it;
+        any other runs on every shard in parallel and yields the merged rows
+        """
+        route = self.shards.route(sql_query)
+        if route.merge is None:
+            yield from self.stream_sql_query(sql_query, batch_size, pool=route.shards[0].pool)
+            return
+
+        def fetch(shard):
+            columns, rows = None, []
+            for columns, batch in self.stream_sql_query(route.merge.shard_sql, batch_size, pool=shard.pool):
+                rows.extend(batch)
+            return columns, rows
+
+        results = self.shards.fan_out(route.shards, fetch)
+        print(f"(Merged from {len(route.shards)} shards: {', '.join(shard.name for shard in route.shards)})")
+        columns = merged_columns(route.merge, results[0][0])
+        rows = merge_results(route.merge, [rows for _, rows in results])
+        for start in range(0, max(len(rows), 1), batch_size):
+            yield columns, rows[start:start + batch_size]
+
+    def explain_query(self, sql_query, pool=None):
+        """EXPLAIN output for a query as dicts (MySQL plan columns such as table, type, rows, filtered)"""
+        if self.shards and pool is None:
+            try:
+                route = self.shards.route(sql_query)
+            except ShardingError:
+                # Reported when the query runs
                 return []
+            # The guard checks the costliest shard's plan
+            plans = self.shards.fan_out(route.shards, lambda shard: self.explain_query(sql_query, pool=shard.pool))
+            return max(plans, key=lambda plan: estimate_examined_rows(plan) or 0)
+        pool = pool or self.pool or get_db_pool()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"EXPLAIN {sql_query}")
+                columns = [desc[0] for desc in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
 
-        except mysql.connector.Error as err:
-            print("MySQL Error:", err)
-            return None
+    @staticmethod
+    def print_results_header(columns):
+        print("\nQuery Results:")
+        print("-" * 50)
+        
+        # Print column headers
+        print(format_row(columns))
+        print("-" * (len(columns) * 18))
+
+    @staticmethod
+    def print_rows(rows):
+        for row in rows:
+            print(format_row(row))
+
+    def finish_result(self, result, note=""):
+        """Remember a result for paging and print how much of it was shown"""
+        self.last_result = result
+        self.shown_rows = min(len(result), RESULT_PAGE_ROWS)
+        if self.shown_rows < len(result):
+            print(f"({len(result)} rows{note}, showing the first {self.shown_rows}; "
+                  f"'more' for the next page, 'summary' for column statistics)")
+        else:
+            print(f"({len(result)} rows{note})")
+        return result
+
+    def execute_sql_query(self, sql_query):
+        """
+        Execute SQL query, printing the first page of rows as they stream in, and return up to
+        MAX_RESULT_ROWS of them as a columnar ResultSet
+        """
+        sql_query = apply_row_limit(sql_query, MAX_RESULT_ROWS)
+        is_select = bool(re.match(r'(select|with)\b', sql_query, re.IGNORECASE))
+
+        if is_select and self.query_results_cache:
+            cached = self.query_results_cache.get(sql_query)
+            if cached is not None:
+                columns, rows = cached
+                with self.timed("render"):
+                    self.print_results_header(columns)
+                    self.print_rows(rows[:RESULT_PAGE_ROWS])
+                return self.finish_result(ResultSet.from_rows(columns, rows), ", cached")
+
+        for attempt in range(2):
+            builder = None
+            batches = self.stream_sql_query(sql_query)
+            try:
+                for columns, batch in batches:
+                    if builder is None:
+                        builder = ResultSetBuilder(columns)
+                        with self.timed("render"):
+                            self.print_results_header(columns)
+                    
+                    batch = batch[:MAX_RESULT_ROWS - builder.row_count]
+                    # Only the first page is printed; 'more' shows the rest
+                    if builder.row_count < RESULT_PAGE_ROWS:
+                        with self.timed("render"):
+                            self.print_rows(batch[:RESULT_PAGE_ROWS - builder.row_count])
+                    builder.add_rows(batch)
+                    if builder.row_count >= MAX_RESULT_ROWS:
+                        print(f"(Result capped at {MAX_RESULT_ROWS} rows)")
+                        break
+
+                if builder is None:
+                    print("Query executed successfully (no return rows).")
+                    # Writes make cached results of the touched tables stale
+                    if self.query_results_cache:
+                        self.query_results_cache.invalidate(sql_query)
+                    return []
+                result = self.finish_result(builder.build())
+                if self.query_results_cache:
+                    if is_select:
+                        self.query_results_cache.put(sql_query, columns, result)
+                    else:
+                        self.query_results_cache.invalidate(sql_query)
+                return result
+
+            except CONNECTION_ERRORS as err:
+                if attempt == 0 and not (builder and builder.row_count):
+                    print(f"MySQL connection lost ({err}), retrying on a fresh connection...")
+                    continue
+                print("MySQL Error:", err)
+                return None
+
+            except mysql.connector.Error as err:
+                print("MySQL Error:", err)
+                return None
+
+            except PoolTimeoutError as err:
+                print("Database busy:", err)
+                return None
 
+            except ShardingError as err:
+                print("Sharding Error:", err)
+                return None
+
+            finally:
+                batches.close()
+
+    def fetch_result(self, sql_query):
+        """Run a SELECT without printing anything and return up to MAX_RESULT_ROWS rows as a ResultSet"""
+        sql_query = apply_row_limit(sql_query, MAX_RESULT_ROWS)
+        builder = None
+        batches = self.stream_sql_query(sql_query)
+        try:
+            for columns, batch in batches:
+                if builder is None:
+                    builder = ResultSetBuilder(columns)
+                builder.add_rows(batch[:MAX_RESULT_ROWS - builder.row_count])
+                if builder.row_count >= MAX_RESULT_ROWS:
+                    break
         finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
+            batches.close()
+        if builder is None:
+            return None
+        result = builder.build()
+        # The same SQL generated for a differently phrased question then still skips the database
+        if self.query_results_cache:
+            self.query_results_cache.put(sql_query, columns, result)
+        return result
+
+    def answer_prefetched(self, user_input, entry):
+        """Show a follow-up's result that was prefetched in the background"""
+        result = entry["result"]
+        print(f"\nPrefetched SQL Query (predicted as \"{entry['question']}\"):\n{entry['sql']}")
+        with self.timed("render"):
+            self.print_results_header(result.columns)
+            self.print_rows(result[:RESULT_PAGE_ROWS])
+        self.finish_result(result, ", prefetched")
+        self.add_to_history(user_input, entry["sql"], result)
+        return result
+
+    def lookup_cached_sql(self, user_input):
+        """Cache key for a question and the SQL cached for it (or for an equivalent question), if any"""
+        if not self.sql_cache:
+            return None, None
+        with self.timed("cache_lookup"):
+            cache_key = self.sql_cache.make_key(user_input, self.conversation_history)
+            return cache_key, self.sql_cache.get(cache_key)
+
+    def run_generated_sql(self, user_input, sql_query, cache_key=None, generation_latency=None):
+        """
+        Guard-check and execute SQL for a question, then record the turn in history.
+        generation_latency is set when the SQL came from the LLM rather than the cache.
+        """
+        # Refuse writes and runaway queries before they reach the database
+        with self.timed("guard"):
+            check = check_query(sql_query, explain=self.explain_query)
+        if not check.allowed:
+            print(f"\nQuery refused: {check.reason}")
+            self.add_to_history(user_input, sql_query, None, f"Refused: {check.reason}")
+            return None
+        if check.reason:
+            print(f"\nNote: {check.reason}")
+        if check.rewritten:
+            print(f"\nRewritten SQL Query:\n{check.sql}")
+        generated_sql, sql_query = sql_query, check.sql
+        
+        # Execute query
+        with self.timed("execute"):
+            results = self.execute_sql_query(sql_query)
+
+        # Only cache SQL that actually ran
+        if self.sql_cache and generation_latency is not None and results is not None:
+            self.sql_cache.put(cache_key, generated_sql, generation_latency)
+        
+        # Add to history
+        error = None if results is not None else "Query execution failed"
+        self.add_to_history(user_input, sql_query, results, error)
+        
+        return results
 
     def process_query(self, user_input):
         """Process a user query with context awareness"""
         print(f"\n{'='*60}")
         print(f"Processing: {user_input}")
         print(f"{'='*60}")
+        self.stage_timings = {}
+
+        # A follow-up predicted after the last answer is served from its prefetched result
+        if self.prefetcher:
+            entry = self.prefetcher.take(user_input, self.conversation_history)
+            if entry is not None:
+                results = self.answer_prefetched(user_input, entry)
+                self.prefetcher.schedule()
+                return results
         
+        # Reuse SQL generated for the same (or an equivalent) question when possible
+        cache_key, sql_query = self.lookup_cached_sql(user_input)
+        from_cache = sql_query is not None
+        generation_latency = None
+
         # Generate SQL query
-        sql_query = self.natural_language_to_sql(user_input)
+        if not from_cache:
+            self.refresh_schema()
+            start = time.perf_counter()
+            sql_query = self.natural_language_to_sql(user_input)
+            generation_latency = time.perf_counter() - start
         
         if not sql_query:
             print("Failed to generate SQL query.")
             return
             
-        print(f"\nGenerated SQL Query:\n{sql_query}")
-        
-        # Execute query
-        results = self.execute_sql_query(sql_query)
-        
-        # Add to history
-        error = None if results is not None else "Query execution failed"
-        self.add_to_history(user_input, sql_query, results, error)
-        
+        print(f"\n{'Cached' if from_cache else 'Generated'} SQL Query:\n{sql_query}")
+        results = self.run_generated_sql(user_input, sql_query, cache_key, generation_latency)
+        if self.prefetcher:
+            self.prefetcher.schedule()
         return results
 
+    def history_entries(self):
+        """Every turn of the session, streamed from the history store when there is one"""
+        if self.history_store:
+            return self.history_store.iter_entries(self.session_id)
+        return iter(self.conversation_history)
+
     def show_history(self):
         """Display conversation history"""
         if not self.conversation_history:
@@ -248,36 +593,97 @@ class ConversationalSQLAssistant:
             return
             
         print("\n" + "="*80)
-        print("CONVERSATION HISTORY")
+        print(f"CONVERSATION HISTORY (session {self.session_id})")
         print("="*80)
         
-        for i, entry in enumerate(self.conversation_history, 1):
+        for i, entry in enumerate(self.history_entries(), 1):
             print(f"\n{i}. [{entry['timestamp']}]")
             print(f"   User: {entry['user_input']}")
             print(f"   SQL: {entry['sql_query']}")
-            if entry['results']:
-                result_count = len(entry['results']) if isinstance(entry['results'], list) else 0
-                print(f"   Results: {result_count} rows returned")
+            if entry['row_count']:
+                print(f"   Results: {entry['row_count']} rows returned")
             if entry['error']:
                 print(f"   Error: {entry['error']}")
 
+    def show_cache_stats(self):
+        """Display NL→SQL and result cache hit rates"""
+        if not self.sql_cache:
+            print("SQL cache is disabled.")
+        else:
+            stats = self.sql_cache.get_stats()
+            print(f"\nSQL cache: {stats['entries']} entries, hit rate {stats['hit_rate']:.1%} "
+                  f"({stats['exact_hits']} exact, {stats['fuzzy_hits']} fuzzy, {stats['misses']} misses), "
+                  f"{stats['latency_saved']:.2f}s of LLM latency saved")
+        if self.prompt_tokens:
+            print(f"Prompts: {len(self.prompt_tokens)} LLM calls, "
+                  f"{sum(self.prompt_tokens) / len(self.prompt_tokens):.0f} tokens on average")
+        if not self.query_results_cache:
+            print("Result cache is disabled.")
+        else:
+            stats = self.query_results_cache.get_stats()
+            print(f"Result cache: {stats['entries']} entries ({stats['bytes'] / 1024:.1f} KB), "
+                  f"hit rate {stats['hit_rate']:.1%}, {stats['invalidations']} invalidated by writes")
+        if self.prefetcher:
+            stats = self.prefetcher.get_stats()
+            print(f"Prefetch: {stats['predicted']} follow-ups predicted, {stats['executed']} run, "
+                  f"hit rate {stats['hit_rate']:.1%}, {stats['wasted']} results unused "
+                  f"({stats['wasted_db_seconds']:.2f}s of queries), {stats['llm_seconds']:.2f}s of LLM time")
+
+    def show_more(self):
+        """Print the next page of the last result"""
+        if self.last_result is None or self.shown_rows >= len(self.last_result):
+            print("No more rows.")
+            return
+        print(self.last_result.render_page(self.shown_rows, RESULT_PAGE_ROWS))
+        self.shown_rows = min(self.shown_rows + RESULT_PAGE_ROWS, len(self.last_result))
+
+    def show_summary(self):
+        """Column statistics of the last result, computed over the whole result rather than the printed page"""
+        if self.last_result is None:
+            print("No results yet.")
+            return
+        print(f"\n{len(self.last_result)} rows")
+        print(render_summary(self.last_result.summary()))
+
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
-        self.query_results_cache = {}
+        if self.history_store:
+            self.history_store.clear_session(self.session_id)
+        self._recent_history = []
         print("Conversation history cleared.")
 
+    def resume_session(self, session_id):
+        """Continue an earlier session; its recent turns are loaded on the next question"""
+        self.session_id = session_id
+        self._recent_history = None
+        print(f"Resumed session {session_id} ({len(self.conversation_history)} recent turns).")
+
+    def show_sessions(self):
+        """List the most recently active sessions in the history store"""
+        if not self.history_store:
+            print("History is not persisted (HISTORY_STORE_PATH is empty).")
+            return
+        for session in self.history_store.sessions():
+            current = " (current)" if session["session_id"] == self.session_id else ""
+            print(f"{session['session_id']}  {session['turns']:>4} turns, last active {session['last_active']}{current}")
+
 # Enhanced main function with interactive features
 def main():
-    assistant = ConversationalSQLAssistant()
+    # SQL_SESSION_ID resumes an earlier conversation
+    assistant = ConversationalSQLAssistant(session_id=os.getenv('SQL_SESSION_ID'))
+    assistant.refresh_schema()
     
     print("="*80)
     print("CONVERSATIONAL SQL ASSISTANT")
     print("="*80)
     print("Ask questions in natural language. I'll remember our conversation!")
+    print(f"Session: {assistant.session_id}")
     print("\nSpecial commands:")
     print("- 'history' : Show conversation history")
     print("- 'clear' : Clear conversation history")  
+    print("- 'cache' : Show SQL and result cache statistics")
+    print("- 'more' : Show the next page of the last result; 'summary' : its column statistics")
+    print("- 'sessions' : List earlier sessions; 'resume <session id>' continues one")
     print("- 'quit' or 'exit' : Exit the program")
     print("="*80)
     
@@ -298,6 +704,21 @@ def main():
             elif user_input.lower() == 'clear':
                 assistant.clear_history()
                 continue
+            elif user_input.lower() == 'cache':
+                assistant.show_cache_stats()
+                continue
+            elif user_input.lower() == 'more':
+                assistant.show_more()
+                continue
+            elif user_input.lower() == 'summary':
+                assistant.show_summary()
+                continue
+            elif user_input.lower() == 'sessions':
+                assistant.show_sessions()
+                continue
+            elif user_input.lower().startswith('resume '):
+                assistant.resume_session(user_input.split(maxsplit=1)[1])
+                continue
             
             # Process the query
             assistant.process_query(user_input)
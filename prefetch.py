@@ -0,0 +1,209 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from metrics import Counter
+from sql_cache import normalize_question, question_similarity
+from sql_guard import check_query, first_complete_statement, statement_type
+from sql_prompt import build_prediction_messages
+
+# Follow-ups predicted (and pre-run) after each answer, prefetched results kept, and for how long
+PREFETCH_FOLLOW_UPS = int(os.getenv('PREFETCH_FOLLOW_UPS', '2'))
+PREFETCH_MAX_ENTRIES = int(os.getenv('PREFETCH_MAX_ENTRIES', '10'))
+PREFETCH_TTL_SECONDS = float(os.getenv('PREFETCH_TTL_SECONDS', '600'))
+# How close a question must be to a predicted one. Lower than the SQL cache's threshold because the
+# prediction is phrased by the model, not the user; every non-filler word must still match
+PREFETCH_SIMILARITY = float(os.getenv('PREFETCH_SIMILARITY', '0.6'))
+
+SQL_PREFETCH_TOTAL = Counter(
+    "sql_prefetch_total", "Speculative follow-up queries by outcome (predicted, executed, hit, wasted, refused)",
+    ["outcome"]
+)
+
+PREDICTION_PATTERN = re.compile(r'^\s*Q:\s*(?P<question>.+?)\s*\n\s*SQL:\s*(?P<sql>.+?)(?=^\s*Q:|\Z)',
+                                re.MULTILINE | re.DOTALL)
+
+
+def history_fingerprint(history) -> str:
+    """Identifies the point of the conversation a prediction was made at, i.e. its last turn"""
+    if not history:
+        return ""
+    last = history[-1]
+    state = f"{len(history)}\n{last.get('timestamp')}\n{last.get('user_input')}\n{last.get('sql_query')}"
+    return hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+
+def parse_predictions(text: str) -> list:
+    """(question, sql) pairs from a 'Q: ... / SQL: ...;' answer"""
+    predictions = []
+    for match in PREDICTION_PATTERN.finditer(text):
+        sql = first_complete_statement(match.group('sql')) or match.group('sql').strip().rstrip(';').strip()
+        if sql:
+            predictions.append((match.group('question').strip(), sql))
+    return predictions
+
+
+class FollowUpPrefetcher:
+    """
+    Speculative follow-ups for one assistant. After each answer the likeliest next questions are
+    predicted by the LLM and their SQL is run on a single background thread; results are kept in a
+    small cache. A question matching a prediction is answered from it without an LLM call or a query.
+    Work for a conversation point is abandoned as soon as the next question arrives.
+    """
+
+    def __init__(self, assistant, follow_ups=PREFETCH_FOLLOW_UPS, max_entries=PREFETCH_MAX_ENTRIES,
+                 ttl_seconds=PREFETCH_TTL_SECONDS, similarity=PREFETCH_SIMILARITY):
+        self.assistant = assistant
+        self.follow_ups = follow_ups
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        # (history fingerprint, normalized question) -> {"question", "sql", "result", "db_seconds", "expires_at"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped whenever a question arrives, so in-flight work for the previous point is dropped
+        self._generation = 0
+        # One worker: prefetching never runs more than one query or LLM call at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-prefetch")
+        self.stats = {
+            "predicted": 0, "executed": 0, "hits": 0, "misses": 0, "wasted": 0, "refused": 0,
+            "cancelled": 0, "failed": 0, "llm_seconds": 0.0, "db_seconds": 0.0, "wasted_db_seconds": 0.0,
+            "last_error": None
+        }
+
+    def _count(self, outcome, amount=1):
+        with self._lock:
+            self.stats[outcome] += amount
+        if outcome in ("predicted", "executed", "hits", "wasted", "refused"):
+            SQL_PREFETCH_TOTAL.inc(amount, outcome)
+
+    def _discard(self, keep=None):
+        """Drop prefetched results other than `keep`, counting them as wasted. Call with the lock held"""
+        for key in [key for key in self._entries if key != keep]:
+            entry = self._entries.pop(key)
+            self.stats["wasted"] += 1
+            self.stats["wasted_db_seconds"] += entry["db_seconds"]
+            SQL_PREFETCH_TOTAL.inc(1, "wasted")
+
+    def take(self, question, history):
+        """
+        Prefetched entry for a question asked at this point of the conversation, or None.
+        Either way the other predictions for this point are now useless and are dropped.
+        """
+        fingerprint = history_fingerprint(history)
+        normalized = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            self._generation += 1
+            best_key, best_score = None, 0.0
+            for key, entry in self._entries.items():
+                if key[0] != fingerprint or entry["expires_at"] < now:
+                    continue
+                score = 1.0 if key[1] == normalized else question_similarity(normalized, key[1])
+                if score > best_score:
+                    best_key, best_score = key, score
+            entry = None
+            if best_key is not None and best_score >= self.similarity:
+                entry = self._entries.pop(best_key)
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            self._discard()
+        if entry is not None:
+            SQL_PREFETCH_TOTAL.inc(1, "hits")
+        return entry
+
+    def schedule(self):
+        """Predict and pre-run follow-ups of the conversation so far, in the background"""
+        history = list(self.assistant.conversation_history)
+        if not history or history[-1].get('error'):
+            return
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self._executor.submit(self._prefetch, generation, history)
+
+    def _is_current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def predict(self, history) -> list:
+        """The likeliest next questions and their SQL, from one LLM call"""
+        schema, row_counts = self.assistant.schema_catalog.prompt_schema(history[-1]['user_input'], history)
+        messages = build_prediction_messages(history, self.follow_ups, schema, row_counts)
+        response = openai.ChatCompletion.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.1,
+            max_tokens=120 * self.follow_ups
+        )
+        return parse_predictions(response['choices'][0]['message']['content'])[:self.follow_ups]
+
+    def _prefetch(self, generation, history):
+        fingerprint = history_fingerprint(history)
+        try:
+            start = time.perf_counter()
+            predictions = self.predict(history)
+            self._count("llm_seconds", time.perf_counter() - start)
+            for question, sql in predictions:
+                if not self._is_current(generation):
+                    self._count("cancelled")
+                    return
+                self._count("predicted")
+                # Only plain reads that pass the guard as they are; anything else waits for the user
+                check = check_query(sql, explain=self.assistant.explain_query)
+                if not check.allowed or check.rewritten or statement_type(check.sql) not in ("select", "with"):
+                    self._count("refused")
+                    continue
+
+                start = time.perf_counter()
+                result = self.assistant.fetch_result(check.sql)
+                elapsed = time.perf_counter() - start
+                self._count("executed")
+                self._count("db_seconds", elapsed)
+                if result is None:
+                    continue
+                with self._lock:
+                    if generation != self._generation:
+                        # The next question arrived while the query ran
+                        self.stats["wasted"] += 1
+                        self.stats["wasted_db_seconds"] += elapsed
+                        SQL_PREFETCH_TOTAL.inc(1, "wasted")
+                        return
+                    self._entries[(fingerprint, normalize_question(question))] = {
+                        "question": question, "sql": check.sql, "result": result, "db_seconds": elapsed,
+                        "expires_at": time.monotonic() + self.ttl_seconds
+                    }
+                    while len(self._entries) > self.max_entries:
+                        entry = self._entries.pop(next(iter(self._entries)))
+                        self.stats["wasted"] += 1
+                        self.stats["wasted_db_seconds"] += entry["db_seconds"]
+                        SQL_PREFETCH_TOTAL.inc(1, "wasted")
+        except Exception as e:
+            # Prefetching is best effort and runs behind the prompt, so errors are only counted
+            with self._lock:
+                self.stats["failed"] += 1
+                self.stats["last_error"] = str(e)
+
+    def wait(self):
+        """Block until queued prefetch work is done (for tests and benchmarks)"""
+        self._executor.submit(lambda: None).result()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["waste_rate"] = round(stats["wasted"] / stats["executed"], 4) if stats["executed"] else 0.0
+        for key in ("llm_seconds", "db_seconds", "wasted_db_seconds"):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,207 @@
+import os
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+
+# Rows printed per page of a result, and the width of a printed column (longer values are cut)
+RESULT_PAGE_ROWS = int(os.getenv('RESULT_PAGE_ROWS', '20'))
+RESULT_COLUMN_WIDTH = int(os.getenv('RESULT_COLUMN_WIDTH', '15'))
+
+# Rows converted back to tuples at a time when a result set is iterated
+ITER_CHUNK_ROWS = 4096
+
+
+def column_array(values) -> np.ma.MaskedArray:
+    """
+    Typed array for one column of a batch: int64, float64 and datetime64 where the values allow it,
+    otherwise object. DECIMAL values stay Decimal objects so they come back exactly as fetched. NULLs are masked.
+    """
+    present = [value for value in values if value is not None]
+    mask = np.ma.nomask if len(present) == len(values) else np.fromiter(
+        (value is None for value in values), dtype=bool, count=len(values))
+    kinds = {type(value) for value in present}
+    if not kinds:
+        return np.ma.masked_all(len(values), dtype=object)
+
+    dtype = object
+    if kinds == {int}:
+        dtype = np.int64
+    elif kinds <= {int, float}:
+        dtype = np.float64
+    elif kinds == {datetime} and all(value.tzinfo is None for value in present):
+        dtype = 'datetime64[us]'
+    elif kinds == {date}:
+        dtype = 'datetime64[D]'
+
+    if dtype is not object:
+        fill = 0 if dtype in (np.int64, np.float64) else 'NaT'
+        try:
+            data = np.array([fill if value is None else value for value in values], dtype=dtype)
+        except (OverflowError, ValueError, TypeError):
+            # e.g. BIGINT UNSIGNED beyond int64
+            dtype = object
+    if dtype is object:
+        data = np.empty(len(values), dtype=object)
+        data[:] = values
+    return np.ma.MaskedArray(data, mask=mask)
+
+
+def concat_columns(chunks) -> np.ma.MaskedArray:
+    """Join the per-batch arrays of a column, settling on one dtype (object when batches disagree)"""
+    if not chunks:
+        return np.ma.masked_all(0, dtype=object)
+    dtypes = {chunk.dtype for chunk in chunks if chunk.count()}
+    if len(dtypes) == 1:
+        dtype = dtypes.pop()
+    elif dtypes and dtypes <= {np.dtype(np.int64), np.dtype(np.float64)}:
+        dtype = np.dtype(np.float64)
+    else:
+        dtype = np.dtype(object)
+    return np.ma.concatenate([
+        chunk.astype(dtype) if chunk.count() else np.ma.masked_all(len(chunk), dtype=dtype)
+        for chunk in chunks
+    ])
+
+
+def summary_value(value):
+    """Plain Python value for a summary statistic"""
+    if value is np.ma.masked:
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def is_decimal_column(values) -> bool:
+    """Object column holding DECIMAL values (possibly mixed with ints), which summaries treat as numbers"""
+    return bool(values) and any(isinstance(value, Decimal) for value in values) and all(
+        isinstance(value, (Decimal, int)) and not isinstance(value, bool) for value in values)
+
+
+def format_cell(value, width: int = RESULT_COLUMN_WIDTH) -> str:
+    text = str(value)
+    if len(text) > width:
+        text = text[:width - 3] + "..."
+    return f"{text:{width}}"
+
+
+def format_row(row, width: int = RESULT_COLUMN_WIDTH) -> str:
+    return " | ".join(format_cell(value, width) for value in row)
+
+
+class ResultSet:
+    """
+    A query result stored column by column in typed (masked) NumPy arrays instead of a list of row tuples.
+    It still reads like a sequence of rows (len, indexing, slicing and iteration give tuples), so callers
+    that expect rows keep working, while stats run vectorized over the columns.
+    """
+
+    def __init__(self, columns, arrays):
+        self.columns = list(columns)
+        self.arrays = list(arrays)
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        builder = ResultSetBuilder(columns)
+        builder.add_rows(list(rows))
+        return builder.build()
+
+    def __len__(self):
+        return len(self.arrays[0]) if self.arrays else 0
+
+    def rows(self, start=0, stop=None) -> list:
+        """Rows start..stop as tuples (NULLs as None)"""
+        return list(zip(*(array[start:stop].tolist() for array in self.arrays)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                return self.rows()[index]
+            return self.rows(index.start, index.stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("result row index out of range")
+        return self.rows(index, index + 1)[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), ITER_CHUNK_ROWS):
+            yield from self.rows(start, start + ITER_CHUNK_ROWS)
+
+    def to_rows(self) -> list:
+        return self.rows()
+
+    def column(self, name) -> np.ma.MaskedArray:
+        return self.arrays[self.columns.index(name)]
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the column buffers plus the Python objects referenced by object columns"""
+        size = 0
+        for array in self.arrays:
+            size += array.data.nbytes + (array.mask.nbytes if array.mask is not np.ma.nomask else 0)
+            if array.dtype == object:
+                size += sum(sys.getsizeof(value) for value in array.compressed())
+        return size
+
+    def summary(self) -> list:
+        """Per column: type, non-NULL count, NULLs, and min/max (plus mean/std for numbers)"""
+        stats = []
+        for name, array in zip(self.columns, self.arrays):
+            count = int(array.count())
+            entry = {"column": name, "type": str(array.dtype), "count": count, "nulls": len(array) - count}
+            if count and array.dtype.kind in "iuf":
+                entry.update(min=summary_value(array.min()), max=summary_value(array.max()),
+                             mean=summary_value(array.mean()), std=summary_value(array.std()))
+            elif count and array.dtype.kind == "M":
+                entry.update(min=summary_value(array.min()), max=summary_value(array.max()))
+            elif count:
+                values = array.compressed().tolist()
+                if is_decimal_column(values):
+                    # min/max keep the exact values; mean/std are computed in float
+                    numbers = np.array(values, dtype=np.float64)
+                    entry.update(type="decimal", min=min(values), max=max(values),
+                                 mean=float(numbers.mean()), std=float(numbers.std()))
+                else:
+                    entry["distinct"] = len(set(values))
+            stats.append(entry)
+        return stats
+
+    def render_page(self, start=0, count=RESULT_PAGE_ROWS, width: int = RESULT_COLUMN_WIDTH) -> str:
+        """Header and rows start..start+count as fixed-width text, with a note on what is left"""
+        lines = [format_row(self.columns, width), "-" * (len(self.columns) * (width + 3))]
+        lines += [format_row(row, width) for row in self.rows(start, start + count)]
+        shown = min(start + count, len(self))
+        if shown < len(self):
+            lines.append(f"(rows {start + 1}-{shown} of {len(self)})")
+        return "\n".join(lines)
+
+
+def render_summary(summary: list) -> str:
+    lines = []
+    for entry in summary:
+        details = ", ".join(
+            f"{key} {value:.6g}" if isinstance(value, float) else f"{key} {value}"
+            for key, value in entry.items() if key not in ("column", "type")
+        )
+        lines.append(f"{entry['column']} ({entry['type']}): {details}")
+    return "\n".join(lines)
+
+
+class ResultSetBuilder:
+    """Collects fetched batches into per-column arrays, so the rows never exist as one big list of tuples"""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._chunks = [[] for _ in self.columns]
+        self.row_count = 0
+
+    def add_rows(self, rows):
+        if not rows:
+            return
+        for chunks, values in zip(self._chunks, zip(*rows)):
+            chunks.append(column_array(values))
+        self.row_count += len(rows)
+
+    def build(self) -> ResultSet:
+        return ResultSet(self.columns, [concat_columns(chunks) for chunks in self._chunks])
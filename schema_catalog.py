@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import time
+import threading
+from sql_cache import referenced_tables
+
+# Tables whose columns/indexes changed are re-read when the catalog is older than this
+SCHEMA_REFRESH_SECONDS = float(os.getenv('SCHEMA_REFRESH_SECONDS', '300'))
+# Most tables put into one prompt
+SCHEMA_MAX_TABLES = int(os.getenv('SCHEMA_MAX_TABLES', '5'))
+
+# Per-table fingerprint of the column and index definitions, used to find tables that changed
+CHECKSUM_QUERIES = (
+    """SELECT TABLE_NAME, MD5(GROUP_CONCAT(CONCAT_WS(':', COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY, COLUMN_COMMENT)
+                                  ORDER BY ORDINAL_POSITION SEPARATOR ','))
+       FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = %s GROUP BY TABLE_NAME""",
+    """SELECT TABLE_NAME, MD5(GROUP_CONCAT(CONCAT_WS(':', INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE)
+                                  ORDER BY INDEX_NAME, SEQ_IN_INDEX SEPARATOR ','))
+       FROM INFORMATION_SCHEMA.STATISTICS WHERE TABLE_SCHEMA = %s GROUP BY TABLE_NAME""",
+)
+
+
+def name_words(name: str) -> set:
+    """Lower-cased words of an identifier or question, with plain plurals also in singular form"""
+    words = set(re.findall(r'[a-z0-9]+', name.lower().replace('_', ' ')))
+    return words | {word[:-1] for word in words if len(word) > 3 and word.endswith('s')}
+
+
+def introspect_tables(cursor, database, table_names=None) -> dict:
+    """Columns, indexes and foreign keys of the given tables (all tables when None) from INFORMATION_SCHEMA"""
+    where = "TABLE_SCHEMA = %s"
+    params = [database]
+    if table_names is not None:
+        if not table_names:
+            return {}
+        where += f" AND TABLE_NAME IN ({', '.join(['%s'] * len(table_names))})"
+        params += list(table_names)
+
+    tables = {}
+    cursor.execute(
+        f"""SELECT TABLE_NAME, COLUMN_NAME, UPPER(DATA_TYPE), COLUMN_KEY, COLUMN_COMMENT
+            FROM INFORMATION_SCHEMA.COLUMNS WHERE {where} ORDER BY TABLE_NAME, ORDINAL_POSITION""", params
+    )
+    for table, column, data_type, key, comment in cursor.fetchall():
+        tables.setdefault(table, {"columns": [], "indexes": {}, "references": []})
+        tables[table]["columns"].append([column, data_type, key or "", comment or ""])
+
+    cursor.execute(
+        f"""SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE
+            FROM INFORMATION_SCHEMA.STATISTICS WHERE {where} ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX""", params
+    )
+    for table, index, column, non_unique in cursor.fetchall():
+        if table in tables:
+            entry = tables[table]["indexes"].setdefault(index, {"columns": [], "unique": not non_unique})
+            entry["columns"].append(column)
+
+    cursor.execute(
+        f"""SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE WHERE {where} AND REFERENCED_TABLE_NAME IS NOT NULL""", params
+    )
+    for table, column, referenced_table, referenced_column in cursor.fetchall():
+        if table in tables:
+            tables[table]["references"].append([column, referenced_table, referenced_column])
+    return tables
+
+
+class SchemaCatalog:
+    """
+    Database schema read from INFORMATION_SCHEMA, kept in memory and in a JSON file.
+    Refreshes are incremental: row estimates are always updated, but columns and indexes
+    are only re-read for tables whose definition checksum changed.
+    """
+
+    def __init__(self, path=None, refresh_seconds=SCHEMA_REFRESH_SECONDS, fallback=None):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        # Used until the first successful introspection, e.g. when the database is unreachable
+        self.fallback = fallback or {}
+        self.database = None
+        # table -> {"columns": [[name, type, key, comment]], "indexes": {name: {"columns", "unique"}},
+        #           "references": [[column, table, column]], "rows": int, "checksum": str}
+        self.tables = {}
+        # time.monotonic() of the last refresh attempt; None until the first one
+        self.checked_at = None
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load schema cache from {self.path}: {e}")
+            return
+        self.database = data.get("database")
+        self.tables = data.get("tables", {})
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"database": self.database, "tables": self.tables}, f)
+        os.replace(temp_path, self.path)
+
+    def refresh(self, conn):
+        """Bring the catalog up to date from an open connection; returns the names of re-read tables"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT DATABASE()")
+            database = cursor.fetchone()[0]
+            cursor.execute("SET SESSION group_concat_max_len = 1048576")
+
+            cursor.execute(
+                "SELECT TABLE_NAME, TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES "
+                "WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'", (database,)
+            )
+            row_counts = dict(cursor.fetchall())
+            checksums = {table: "" for table in row_counts}
+            for query in CHECKSUM_QUERIES:
+                cursor.execute(query, (database,))
+                for table, checksum in cursor.fetchall():
+                    if table in checksums:
+                        checksums[table] += checksum or ""
+
+            current = self.tables if database == self.database else {}
+            changed = [table for table, checksum in checksums.items()
+                       if table not in current or current[table].get("checksum") != checksum]
+            tables = {table: current[table] for table in checksums if table not in changed}
+            tables.update(introspect_tables(cursor, database, changed))
+        finally:
+            cursor.close()
+
+        for table, info in tables.items():
+            info["rows"] = int(row_counts.get(table) or 0)
+            info["checksum"] = checksums[table]
+        with self._lock:
+            self.database, self.tables = database, tables
+            self.checked_at = time.monotonic()
+        if self.path:
+            self.save()
+        return changed
+
+    def is_stale(self) -> bool:
+        """Due for a refresh: never checked (unless refresh_seconds is infinite, i.e. refreshing is off) or checked too long ago"""
+        if self.checked_at is None:
+            return self.refresh_seconds != float('inf')
+        return time.monotonic() - self.checked_at >= self.refresh_seconds
+
+    def refresh_if_stale(self, pool):
+        """Refresh from a pooled connection when refresh_seconds have passed since the last check"""
+        if not self.is_stale():
+            return
+        with self._lock:
+            if not self.is_stale():
+                return
+            # Failed refreshes are not retried on every question either
+            self.checked_at = time.monotonic()
+        try:
+            with pool.connection() as conn:
+                changed = self.refresh(conn)
+            if changed:
+                print(f"Schema loaded for {len(changed)} table(s): {', '.join(sorted(changed))}")
+        except Exception as e:
+            print(f"Schema introspection failed, using the {'cached' if self.tables else 'built-in'} schema: {e}")
+
+    def relevant_tables(self, question, conversation_history=(), max_tables=SCHEMA_MAX_TABLES) -> list:
+        """
+        Tables a question most likely needs: name matches count most, then column matches and tables
+        used by the last two turns (for follow-ups). Tables they reference by foreign key are added if room.
+        """
+        tables = self.tables
+        if len(tables) <= max_tables:
+            return list(tables)
+
+        question_words = name_words(question)
+        recent = set()
+        for entry in conversation_history[-2:]:
+            recent |= referenced_tables(entry.get('sql_query') or "")
+
+        scores = {}
+        for table, info in tables.items():
+            score = 3 * len(question_words & name_words(table))
+            score += sum(1 for column in info["columns"] if name_words(column[0]) & question_words)
+            score += 2 if table.lower() in recent else 0
+            if score:
+                scores[table] = score
+
+        selected = sorted(scores, key=lambda table: (-scores[table], -tables[table].get("rows", 0)))[:max_tables]
+        if not selected:
+            return sorted(tables, key=lambda table: -tables[table].get("rows", 0))[:max_tables]
+        for table in list(selected):
+            for _, referenced_table, _ in tables[table].get("references", []):
+                if len(selected) < max_tables and referenced_table in tables and referenced_table not in selected:
+                    selected.append(referenced_table)
+        return selected
+
+    def prompt_schema(self, question, conversation_history=(), max_tables=SCHEMA_MAX_TABLES):
+        """
+        (schema, row_counts) for sql_prompt.build_messages, limited to the relevant tables.
+        Column notes come from column comments, falling back to the built-in descriptions.
+        """
+        if not self.tables:
+            return self.fallback, None
+
+        schema, row_counts = {}, {}
+        for table in self.relevant_tables(question, conversation_history, max_tables):
+            info = self.tables[table]
+            known_notes = {name: note for name, _, note in self.fallback.get(table, [])}
+            indexed = {index["columns"][0] for index in info["indexes"].values()}
+            references = {column: f"{ref_table}.{ref_column}" for column, ref_table, ref_column in info.get("references", [])}
+
+            columns = []
+            for name, data_type, key, comment in info["columns"]:
+                notes = []
+                if key == "PRI":
+                    notes.append("PK")
+                elif key == "UNI":
+                    notes.append("unique")
+                elif name in indexed:
+                    notes.append("indexed")
+                if name in references:
+                    notes.append(f"-> {references[name]}")
+                description = comment or known_notes.get(name, "")
+                if description and description != "primary key":
+                    notes.append(description)
+                columns.append((name, data_type, ", ".join(notes)))
+            schema[table] = columns
+            row_counts[table] = info.get("rows", 0)
+        return schema, row_counts
+
+
+def create_schema_catalog_from_env(fallback=None):
+    """Schema catalog cached in SCHEMA_CACHE_PATH (empty disables the file cache)"""
+    return SchemaCatalog(
+        path=os.getenv('SCHEMA_CACHE_PATH', 'schema_cache.json') or None,
+        refresh_seconds=SCHEMA_REFRESH_SECONDS,
+        fallback=fallback
+    )
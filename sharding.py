@@ -0,0 +1,434 @@
+import os
+import re
+import json
+import sqlite3
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from db_pool import ConnectionPool
+from sql_guard import COMMENT_PATTERN
+
+# Column the patient data is split by, and how many shards a fanned-out query runs on at once
+SHARD_KEY = os.getenv('SHARD_KEY', 'organisation_id')
+SHARD_FANOUT_WORKERS = int(os.getenv('SHARD_FANOUT_WORKERS', '8'))
+
+# String literals and comments; backtick identifiers are left alone
+LITERAL_OR_COMMENT_PATTERN = re.compile(
+    r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|""" + COMMENT_PATTERN.pattern, re.DOTALL
+)
+CLAUSE_PATTERN = re.compile(r'\b(select(?:\s+distinct)?|from|where|group\s+by|having|order\s+by|limit)\b', re.IGNORECASE)
+AGGREGATE_PATTERN = re.compile(r'\b(count|sum|min|max|avg|group_concat|std\w*|var\w*|bit_\w+|json_\w*agg)\s*\(', re.IGNORECASE)
+ALIAS_PATTERN = re.compile(r'^(?P<expr>.*?[\w)`\'"\]*])(?:\s+as\s+|\s+)(?P<alias>`[^`]+`|\w+)$', re.IGNORECASE | re.DOTALL)
+LIMIT_CLAUSE_PATTERN = re.compile(r'^(\d+)(?:\s*,\s*(\d+)|\s+offset\s+(\d+))?$', re.IGNORECASE)
+
+
+class ShardingError(Exception):
+    """Raised for a query that spans shards but whose results cannot be merged correctly"""
+
+
+def mask_sql(sql: str) -> str:
+    """
+    Same-length copy of sql with literals, comments and the inside of parentheses blanked,
+    so top-level keywords, commas and predicates can be found with plain regexes
+    """
+    flat = LITERAL_OR_COMMENT_PATTERN.sub(lambda match: " " * len(match.group()), sql)
+    chars, depth = [], 0
+    for char in flat:
+        if char == '(':
+            chars.append('(' if depth == 0 else ' ')
+            depth += 1
+        elif char == ')':
+            depth = max(depth - 1, 0)
+            chars.append(')' if depth == 0 else ' ')
+        else:
+            chars.append(char if depth == 0 else ' ')
+    return "".join(chars)
+
+
+def split_top_level(text: str, separator=',') -> list:
+    masked = mask_sql(text)
+    parts, start = [], 0
+    for index, char in enumerate(masked):
+        if char == separator:
+            parts.append(text[start:index].strip())
+            start = index + 1
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+def split_clauses(sql: str) -> dict:
+    """Top-level clauses of a SELECT: select, distinct, from, where, group by, having, order by, limit"""
+    sql = sql.strip().rstrip(';').rstrip()
+    masked = mask_sql(sql)
+    matches = list(CLAUSE_PATTERN.finditer(masked))
+    if not matches or not matches[0].group(1).lower().startswith('select') or masked[:matches[0].start()].strip():
+        raise ShardingError("only SELECT statements can be merged across shards")
+    if re.search(r'\b(union|intersect|except)\b', masked, re.IGNORECASE):
+        raise ShardingError("UNION queries cannot be merged across shards")
+
+    clauses = {"distinct": False}
+    for match, following in zip(matches, matches[1:] + [None]):
+        name = re.sub(r'\s+', ' ', match.group(1).lower())
+        if name.startswith('select'):
+            clauses["distinct"] = name != 'select'
+            name = 'select'
+        if name in clauses:
+            raise ShardingError(f"unexpected second {name.upper()} clause")
+        clauses[name] = sql[match.end():following.start() if following else len(sql)].strip()
+    return clauses
+
+
+def normalize_expr(expr: str) -> str:
+    return re.sub(r'\s+', '', expr.replace('`', '')).lower()
+
+
+def shard_key_values(sql: str, key: str = SHARD_KEY) -> Optional[set]:
+    """
+    Values of the shard key a statement is restricted to by a top-level `key = n` or `key IN (...)`
+    predicate of its WHERE clause. None when it is not restricted: no such predicate, or an OR at the
+    top level (the predicate may then not apply to every row).
+    """
+    masked = mask_sql(sql)
+    where = re.search(r'\bwhere\b', masked, re.IGNORECASE)
+    if not where:
+        return None
+    end = re.search(r'\b(group\s+by|having|order\s+by|limit)\b', masked[where.end():], re.IGNORECASE)
+    stop = where.end() + end.start() if end else len(sql)
+    clause, masked_clause = sql[where.end():stop], masked[where.end():stop]
+    if re.search(r'\b(or|xor)\b|\|\|', masked_clause, re.IGNORECASE):
+        return None
+
+    values = None
+    pattern = re.compile(rf'(?<![\w.`])(?:[`\w]+\.)?`?{re.escape(key)}`?\s*(?:(=)|\b(in)\b\s*\()', re.IGNORECASE)
+    for match in pattern.finditer(masked_clause):
+        if re.search(r'\bnot\s*$', masked_clause[:match.start()], re.IGNORECASE):
+            continue
+        if match.group(1):
+            literal = re.match(r"\s*'?(-?\d+)'?(?!\s*[-+*/%])", clause[match.end():])
+            found = {int(literal.group(1))} if literal else None
+        else:
+            close = masked_clause.index(')', match.end() - 1)
+            items = [item.strip().strip("'") for item in clause[match.end():close].split(',')]
+            found = {int(item) for item in items} if all(re.fullmatch(r'-?\d+', item) for item in items) else None
+        if found is not None:
+            # Several restricting predicates (AND) must all hold
+            values = found if values is None else values & found
+    return values
+
+
+@dataclass
+class SelectItem:
+    expr: str
+    alias: Optional[str] = None
+    # "key" for plain values, or the aggregate merged across shards: count, sum, min, max, avg
+    kind: str = "key"
+    hidden: bool = False
+
+    @property
+    def star(self) -> bool:
+        """* or t.*, which stands for as many shard columns as the table has"""
+        return self.expr == '*' or self.expr.endswith('.*')
+
+    def shard_sql(self) -> list:
+        if self.kind == "avg":
+            inner = self.expr[self.expr.index('(') + 1:self.expr.rindex(')')]
+            return [f"SUM({inner})", f"COUNT({inner})"]
+        return [f"{self.expr} AS {self.alias}" if self.alias else self.expr]
+
+
+def parse_select_item(text: str, hidden=False) -> SelectItem:
+    masked = mask_sql(text)
+    match = ALIAS_PATTERN.match(masked)
+    alias = None
+    if match and match.group('alias').lower() not in ('asc', 'desc', 'end') and not re.search(r'\bas$', match.group('expr'), re.IGNORECASE):
+        expr_end = match.end('expr')
+        expr, alias = text[:expr_end].strip(), text[match.start('alias'):].strip()
+    else:
+        expr = text.strip()
+    masked_expr = mask_sql(expr)
+
+    kind = "key"
+    whole = re.fullmatch(r'(count|sum|min|max|avg)\s*\(\s*\)', masked_expr.strip(), re.IGNORECASE)
+    if whole:
+        kind = whole.group(1).lower()
+        inner = expr[expr.index('(') + 1:expr.rindex(')')]
+        if re.match(r'\s*distinct\b', inner, re.IGNORECASE):
+            raise ShardingError(f"{kind.upper()}(DISTINCT ...) cannot be merged across shards")
+    elif AGGREGATE_PATTERN.search(LITERAL_OR_COMMENT_PATTERN.sub("''", expr)):
+        raise ShardingError(f"'{expr}' combines aggregates and cannot be merged across shards")
+    return SelectItem(expr, alias, kind, hidden)
+
+
+@dataclass
+class MergePlan:
+    """How to run a SELECT on several shards and combine what they return"""
+    shard_sql: str
+    items: list
+    aggregating: bool
+    distinct: bool
+    group_items: list
+    # (item index, descending)
+    order: list
+    limit: Optional[int]
+    offset: int
+
+
+def parse_limit(text: str) -> tuple:
+    match = LIMIT_CLAUSE_PATTERN.match(text.strip())
+    if not match:
+        raise ShardingError(f"unsupported LIMIT clause: {text}")
+    if match.group(2):
+        return int(match.group(2)), int(match.group(1))
+    return int(match.group(1)), int(match.group(3) or 0)
+
+
+def plan_merge(sql: str) -> MergePlan:
+    """
+    Per-shard query and merge steps for a SELECT that spans shards. Aggregates are combined per group
+    (COUNT/SUM add up, MIN/MAX of the shard values, AVG from per-shard SUM and COUNT); ORDER BY and
+    LIMIT/OFFSET are applied again to the merged rows. Shapes that cannot be merged raise ShardingError.
+    """
+    if len(re.findall(r'\bselect\b', LITERAL_OR_COMMENT_PATTERN.sub("''", sql), re.IGNORECASE)) > 1:
+        raise ShardingError("subqueries cannot be merged across shards")
+    if re.search(r'\bover\s*\(', sql, re.IGNORECASE):
+        raise ShardingError("window functions cannot be merged across shards")
+    clauses = split_clauses(sql)
+    if 'from' not in clauses:
+        raise ShardingError("queries without FROM do not need to run on every shard")
+
+    items = [parse_select_item(text) for text in split_top_level(clauses['select'])]
+    stars = sum(item.star for item in items)
+    if stars and any(item.kind != "key" for item in items):
+        raise ShardingError("* cannot be combined with aggregates across shards")
+    if stars > 1:
+        raise ShardingError("more than one * cannot be merged across shards")
+    group_exprs = split_top_level(clauses.get('group by', ''))
+    aggregating = bool(group_exprs) or any(item.kind != "key" for item in items)
+    if aggregating and 'having' in clauses:
+        raise ShardingError("HAVING cannot be applied across shards")
+
+    def find_item(expr):
+        target = normalize_expr(expr)
+        if re.fullmatch(r'\d+', target) and stars:
+            # The position counts the columns * expands to, which are only known from the result
+            raise ShardingError("positional GROUP BY / ORDER BY cannot be combined with * across shards")
+        if re.fullmatch(r'\d+', target) and 1 <= int(target) <= len(items):
+            return int(target) - 1
+        for index, item in enumerate(items):
+            if not item.hidden and target in (normalize_expr(item.alias or ""), normalize_expr(item.expr)):
+                return index
+        return None
+
+    def item_for(expr):
+        index = find_item(expr)
+        if index is None:
+            items.append(parse_select_item(expr, hidden=True))
+            index = len(items) - 1
+        return index
+
+    group_items = [item_for(expr) for expr in group_exprs]
+    order = []
+    for term in split_top_level(clauses.get('order by', '')):
+        direction = re.search(r'\s+(asc|desc)$', term, re.IGNORECASE)
+        expr = term[:direction.start()] if direction else term
+        order.append((item_for(expr), bool(direction) and direction.group(1).lower() == 'desc'))
+    limit, offset = parse_limit(clauses['limit']) if 'limit' in clauses else (None, 0)
+
+    columns = [sql for item in items for sql in item.shard_sql()]
+    parts = [f"SELECT {'DISTINCT ' if clauses['distinct'] else ''}{', '.join(columns)}", f"FROM {clauses['from']}"]
+    if 'where' in clauses:
+        parts.append(f"WHERE {clauses['where']}")
+    if group_exprs:
+        parts.append(f"GROUP BY {clauses['group by']}")
+    if not aggregating:
+        # Plain rows: each shard only needs its own first offset + limit rows in the final order
+        if 'having' in clauses:
+            parts.append(f"HAVING {clauses['having']}")
+        if 'order by' in clauses:
+            parts.append(f"ORDER BY {clauses['order by']}")
+        if limit is not None:
+            parts.append(f"LIMIT {limit + offset}")
+    return MergePlan(" ".join(parts), items, aggregating, clauses['distinct'], group_items, order, limit, offset)
+
+
+def combine(kind, current, value):
+    if kind == "key":
+        return current
+    if kind == "avg":
+        return (add(current[0], value[0]), add(current[1], value[1]))
+    if value is None:
+        return current
+    if current is None:
+        return value
+    if kind in ("count", "sum"):
+        return current + value
+    return min(current, value) if kind == "min" else max(current, value)
+
+
+def add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def sort_key(value):
+    # NULLs first as in MySQL; strings compare case-insensitively like MySQL's default collations
+    if value is None:
+        return (0, 0)
+    return (1, value.casefold() if isinstance(value, str) else value)
+
+
+def item_positions(plan: MergePlan, width: int) -> list:
+    """
+    Columns of a shard result (width columns wide) holding each item: two for AVG (SUM and COUNT),
+    whatever is left over for a * item, one otherwise
+    """
+    fixed = sum(len(item.shard_sql()) for item in plan.items if not item.star)
+    positions, start = [], 0
+    for item in plan.items:
+        count = width - fixed if item.star else len(item.shard_sql())
+        positions.append(list(range(start, start + count)))
+        start += count
+    return positions
+
+
+def merge_results(plan: MergePlan, shard_rows: list) -> list:
+    """Combine the per-shard rows of plan.shard_sql into the rows the original query would return"""
+    first = next((rows[0] for rows in shard_rows if rows), None)
+    if first is None:
+        return []
+    positions = item_positions(plan, len(first))
+
+    def item_values(row):
+        return [tuple(row[position] for position in item_columns) if item.kind == "avg" or item.star
+                else row[item_columns[0]]
+                for item, item_columns in zip(plan.items, positions)]
+
+    rows = [item_values(row) for rows in shard_rows for row in rows]
+    if plan.aggregating:
+        groups = {}
+        for values in rows:
+            group = tuple(values[index] for index in plan.group_items)
+            merged = groups.get(group)
+            if merged is None:
+                groups[group] = values
+            else:
+                groups[group] = [combine(item.kind, current, value)
+                                 for item, current, value in zip(plan.items, merged, values)]
+        rows = []
+        for values in groups.values():
+            rows.append([
+                (value[0] / value[1] if value[1] else None) if item.kind == "avg" else value
+                for item, value in zip(plan.items, values)
+            ])
+
+    # Sort by the last key first; stable sorts leave earlier keys deciding
+    for index, descending in reversed(plan.order):
+        rows.sort(key=lambda values: sort_key(values[index]), reverse=descending)
+
+    visible = [(index, item.star) for index, item in enumerate(plan.items) if not item.hidden]
+    result = []
+    seen = set()
+    for values in rows:
+        row = tuple(value for index, star in visible for value in (values[index] if star else (values[index],)))
+        if plan.distinct:
+            if row in seen:
+                continue
+            seen.add(row)
+        result.append(row)
+    end = plan.offset + plan.limit if plan.limit is not None else None
+    return result[plan.offset:end]
+
+
+def merged_columns(plan: MergePlan, shard_columns: list) -> list:
+    """Column names of the merged result: the shard's names, or the alias / expression for AVG"""
+    columns = []
+    for item, positions in zip(plan.items, item_positions(plan, len(shard_columns))):
+        if item.hidden:
+            continue
+        if item.kind == "avg":
+            columns.append((item.alias or item.expr).strip('`'))
+        else:
+            columns += [shard_columns[position] for position in (positions if item.star else positions[:1])]
+    return columns
+
+
+@dataclass
+class Shard:
+    name: str
+    organisation_ids: set
+    pool: ConnectionPool
+
+
+@dataclass
+class ShardRoute:
+    shards: list
+    # Set when the statement runs on several shards and their results must be merged
+    merge: Optional[MergePlan] = None
+
+
+class ShardRouter:
+    """
+    Routes statements to the databases holding the organisations their WHERE clause filters on.
+    Anything not restricted to one shard fans out to all matching shards in parallel.
+    """
+
+    def __init__(self, shards, key=SHARD_KEY, workers=SHARD_FANOUT_WORKERS):
+        if not shards:
+            raise ValueError("at least one shard is required")
+        self.shards = list(shards)
+        self.key = key
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-fanout")
+
+    @property
+    def primary_pool(self) -> ConnectionPool:
+        """Pool of the first shard, for schema introspection (every shard has the same schema)"""
+        return self.shards[0].pool
+
+    def route(self, sql: str) -> ShardRoute:
+        values = shard_key_values(sql, self.key)
+        targets = self.shards
+        if values is not None:
+            targets = [shard for shard in self.shards if shard.organisation_ids & values] or self.shards
+        if len(targets) == 1:
+            return ShardRoute(targets)
+        if not re.match(r'\s*select\b', sql, re.IGNORECASE):
+            raise ShardingError(f"only plain SELECT statements can run across shards; filter on a single {self.key}")
+        return ShardRoute(targets, plan_merge(sql))
+
+    def fan_out(self, shards, func) -> list:
+        """func(shard) for every shard in parallel, results in shard order; the first error is raised"""
+        return list(self._executor.map(func, shards))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for shard in self.shards:
+            shard.pool.close()
+
+
+def create_shard_router_from_env(create_pool):
+    """
+    Router for the shards listed in the JSON file at DB_SHARDS_PATH, or None when it is not set.
+    The file holds {"shards": [{"name", "organisation_ids", and MySQL connection settings or "sqlite": path}]};
+    create_pool(config) builds the pool of a MySQL shard.
+    """
+    path = os.getenv('DB_SHARDS_PATH', '')
+    if not path:
+        return None
+    with open(path) as f:
+        config = json.load(f)
+    shards = []
+    for entry in config["shards"]:
+        entry = dict(entry)
+        name = entry.pop("name")
+        organisation_ids = set(entry.pop("organisation_ids"))
+        sqlite_path = entry.pop("sqlite", None)
+        if sqlite_path:
+            pool = ConnectionPool(lambda p=sqlite_path: sqlite3.connect(p, check_same_thread=False))
+        else:
+            pool = create_pool(entry)
+        shards.append(Shard(name, organisation_ids, pool))
+    return ShardRouter(shards, key=config.get("key", SHARD_KEY))
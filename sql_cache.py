@@ -0,0 +1,313 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+# Words that make a question depend on earlier turns ("give me their names")
+FOLLOW_UP_WORDS = {
+    'their', 'them', 'they', 'those', 'these', 'it', 'its', 'that', 'this', 'same',
+    'previous', 'above', 'earlier', 'last', 'also', 'too', 'instead', 'among', 'ones', 'he', 'she', 'his', 'her'
+}
+
+# Filler words that can differ between two phrasings of the same question
+FILLER_WORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'there', 'what', 'which', 'me', 'us', 'please',
+    'give', 'show', 'list', 'display', 'get', 'find', 'tell', 'can', 'could', 'you', 'i', 'we',
+    'do', 'does', 'have', 'has', 'of', 'in', 'for', 'to', 'all', 'exist', 'currently', 'now'
+}
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def context_fingerprint(normalized_question: str, conversation_history) -> str:
+    """
+    Fingerprint of the conversation context a question depends on.
+    Stand-alone questions get an empty fingerprint so they hit regardless of history;
+    follow-ups are keyed by the SQL of the previous two turns.
+    """
+    if not conversation_history or not FOLLOW_UP_WORDS.intersection(normalized_question.split()):
+        return ""
+    recent_sql = "\n".join(entry.get('sql_query') or "" for entry in conversation_history[-2:])
+    return hashlib.sha1(recent_sql.encode('utf-8')).hexdigest()
+
+
+def question_similarity(a: str, b: str) -> float:
+    """
+    difflib ratio of two normalized questions. Character similarity alone would match "male patients"
+    with "female patients", so questions must also share every non-filler word.
+    """
+    if set(a.split()) - FILLER_WORDS != set(b.split()) - FILLER_WORDS:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def embed_text(text: str) -> list:
+    import openai
+    response = openai.Embedding.create(model="text-embedding-3-small", input=text)
+    return response['data'][0]['embedding']
+
+
+def cosine_similarity(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+    return dot / norm if norm else 0.0
+
+
+class SQLQueryCache:
+    """
+    Maps a normalized question (plus context fingerprint) to previously generated SQL.
+    Exact matches are a dict lookup; otherwise the closest cached question with the same
+    fingerprint is used if it is similar enough (difflib ratio, or embeddings when enabled).
+    New entries are written to the JSON file at most once per save_interval seconds (0 saves on every put),
+    and once more when the process exits.
+    """
+
+    def __init__(self, path=None, max_entries=1000, similarity_threshold=0.8, use_embeddings=False,
+                 save_interval=5.0):
+        self.path = path
+        self.save_interval = save_interval
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.use_embeddings = use_embeddings
+        # (fingerprint, normalized question) -> {"sql", "latency", "embedding"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        # Set by put() until the next save; the timer runs that save once save_interval has passed
+        self._dirty = False
+        self._save_timer = None
+        self.stats = {"exact_hits": 0, "fuzzy_hits": 0, "misses": 0, "latency_saved": 0.0}
+        if path and os.path.exists(path):
+            self.load()
+        if path:
+            atexit.register(self.flush)
+
+    def make_key(self, question, conversation_history):
+        normalized = normalize_question(question)
+        return context_fingerprint(normalized, conversation_history), normalized
+
+    def _similarity(self, key, entry_key, entry, query_embedding):
+        if query_embedding is not None and entry.get("embedding"):
+            return cosine_similarity(query_embedding, entry["embedding"])
+        return question_similarity(key[1], entry_key[1])
+
+    def get(self, key):
+        """Cached SQL for the question key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                self.stats["latency_saved"] += entry["latency"]
+                return entry["sql"]
+            candidates = [(k, e) for k, e in self._entries.items() if k[0] == key[0]]
+
+        best_key, best_entry, best_score = None, None, 0.0
+        query_embedding = embed_text(key[1]) if self.use_embeddings and candidates else None
+        for entry_key, entry in candidates:
+            score = self._similarity(key, entry_key, entry, query_embedding)
+            if score > best_score:
+                best_key, best_entry, best_score = entry_key, entry, score
+
+        with self._lock:
+            if best_entry is not None and best_score >= self.similarity_threshold:
+                if best_key in self._entries:
+                    self._entries.move_to_end(best_key)
+                self.stats["fuzzy_hits"] += 1
+                self.stats["latency_saved"] += best_entry["latency"]
+                return best_entry["sql"]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, sql, latency):
+        """Remember SQL that was generated (in latency seconds) and ran successfully"""
+        embedding = embed_text(key[1]) if self.use_embeddings else None
+        with self._lock:
+            self._entries[key] = {"sql": sql, "latency": latency, "embedding": embedding}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            schedule = self.path and self.save_interval > 0 and self._save_timer is None
+            if schedule:
+                self._save_timer = threading.Timer(self.save_interval, self.flush)
+                self._save_timer.daemon = True
+        if schedule:
+            self._save_timer.start()
+        elif self.path and self.save_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """Write pending entries to the file now"""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+            dirty, self._dirty = self._dirty, False
+        if timer is not None:
+            timer.cancel()
+        if dirty and self.path:
+            self.save()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load SQL cache from {self.path}: {e}")
+            return
+        with self._lock:
+            for item in data.get("entries", [])[-self.max_entries:]:
+                key = (item["fingerprint"], item["question"])
+                self._entries[key] = {"sql": item["sql"], "latency": item["latency"], "embedding": item.get("embedding")}
+
+    def save(self):
+        with self._lock:
+            entries = [
+                {"fingerprint": key[0], "question": key[1], **entry}
+                for key, entry in self._entries.items()
+            ]
+        temp_path = f"{self.path}.tmp"
+        # Sessions served from the threadpool can save at the same time; they must not share the temp file
+        with self._save_lock:
+            with open(temp_path, "w") as f:
+                json.dump({"entries": entries}, f)
+            os.replace(temp_path, self.path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+        self.flush()
+
+    def get_stats(self):
+        hits = self.stats["exact_hits"] + self.stats["fuzzy_hits"]
+        lookups = hits + self.stats["misses"]
+        return dict(
+            self.stats,
+            entries=len(self._entries),
+            hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            latency_saved=round(self.stats["latency_saved"], 3)
+        )
+
+
+def create_sql_cache_from_env():
+    """Build the NL→SQL cache configured by SQL_CACHE_* variables, or None when disabled"""
+    if os.getenv('SQL_CACHE_ENABLED', '1') == '0':
+        return None
+    return SQLQueryCache(
+        path=os.getenv('SQL_CACHE_PATH', 'sql_cache.json'),
+        max_entries=int(os.getenv('SQL_CACHE_MAX_ENTRIES', '1000')),
+        similarity_threshold=float(os.getenv('SQL_CACHE_SIMILARITY', '0.8')),
+        use_embeddings=os.getenv('SQL_CACHE_EMBEDDINGS', '0') == '1',
+        save_interval=float(os.getenv('SQL_CACHE_SAVE_SECONDS', '5'))
+    )
+
+
+TABLE_PATTERN = re.compile(r'\b(?:from|join|update|into|table)\s+`?(\w+)`?(?:\s*\.\s*`?(\w+)`?)?', re.IGNORECASE)
+STRING_LITERAL_PATTERN = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and drop the trailing semicolon, leaving string literals untouched"""
+    parts = STRING_LITERAL_PATTERN.split(sql.strip().rstrip(';'))
+    return "".join(part if index % 2 else re.sub(r'\s+', ' ', part) for index, part in enumerate(parts)).strip()
+
+
+def referenced_tables(sql: str) -> set:
+    """Lower-cased names of the tables a statement reads from or writes to"""
+    return {(table or schema_or_table).lower()
+            for schema_or_table, table in TABLE_PATTERN.findall(STRING_LITERAL_PATTERN.sub("''", sql))}
+
+
+def estimate_rows_size(rows) -> int:
+    return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows)
+
+
+class QueryResultCache:
+    """
+    SELECT results keyed by normalized SQL, with a TTL and a memory budget.
+    Rows are stored as tuples; write statements invalidate entries for the tables they touch.
+    """
+
+    def __init__(self, ttl_seconds=60, max_bytes=64 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # normalized sql -> (columns, rows, tables, size, expires_at)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def get(self, sql):
+        """(columns, rows) for a cached SELECT, or None"""
+        key = normalize_sql(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[4] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0], entry[1]
+
+    def put(self, sql, columns, rows):
+        rows = tuple(tuple(row) for row in rows)
+        size = estimate_rows_size(rows)
+        if size > self.max_bytes:
+            return
+        key = normalize_sql(sql)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (tuple(columns), rows, referenced_tables(sql), size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, sql):
+        """Drop cached results that read any table written by sql (everything if none can be identified)"""
+        tables = referenced_tables(sql)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if not tables or entry[2] & tables]
+            for key in stale:
+                self._remove(key)
+            self.stats["invalidations"] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(
+            self.stats,
+            entries=len(self._entries),
+            bytes=self._bytes,
+            hit_rate=round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        )
+
+
+def create_result_cache_from_env():
+    """Build the SELECT result cache configured by RESULT_CACHE_* variables, or None when disabled"""
+    if os.getenv('RESULT_CACHE_ENABLED', '1') == '0':
+        return None
+    return QueryResultCache(
+        ttl_seconds=float(os.getenv('RESULT_CACHE_TTL', '60')),
+        max_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    )
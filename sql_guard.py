@@ -0,0 +1,187 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# What to do with LLM-generated statements that are not read-only:
+# "reject" refuses them, "dry_run" turns UPDATE/DELETE into a SELECT of the affected rows,
+# "allow" runs them as generated
+SQL_WRITE_POLICY = os.getenv('SQL_WRITE_POLICY', 'reject').lower()
+# Queries whose EXPLAIN estimate exceeds this many examined rows are refused ("reject")
+# or have their result capped at SQL_AUTO_LIMIT_ROWS ("limit")
+SQL_MAX_ESTIMATED_ROWS = int(os.getenv('SQL_MAX_ESTIMATED_ROWS', '1000000'))
+SQL_COST_POLICY = os.getenv('SQL_COST_POLICY', 'limit').lower()
+SQL_AUTO_LIMIT_ROWS = int(os.getenv('SQL_AUTO_LIMIT_ROWS', '100'))
+
+# EXPLAIN is left out: EXPLAIN ANALYZE runs the statement it wraps, writes included
+READ_ONLY_KEYWORDS = {'select', 'with', 'show', 'describe', 'desc'}
+# DESCRIBE is a synonym of EXPLAIN in MySQL, so only its table form (DESCRIBE tbl [column]) counts as read-only
+DESCRIBE_TABLE_PATTERN = re.compile(
+    r"^desc(?:ribe)?\s+(?!(?:analyze|format|extended|partitions|select|with|table|insert|update|delete|replace|for)\b)"
+    r"[\w.`']+(?:\s+[\w.`'%]+)?\s*;?$",
+    re.IGNORECASE
+)
+# Data-modifying statements a MySQL CTE (WITH ...) can end in
+WRITE_KEYWORD_PATTERN = re.compile(r'\b(insert|update|delete)\b', re.IGNORECASE)
+STRING_LITERAL_PATTERN = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+COMMENT_PATTERN = re.compile(r'--[^\n]*|#[^\n]*|/\*.*?\*/', re.DOTALL)
+# A code fence, things a statement terminator can hide in (complete first, then still-open forms) and the terminator
+STATEMENT_END_PATTERN = re.compile(
+    r"""(?P<fence>```)"""
+    r"""|(?P<skip>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`|/\*.*?\*/|(?:--|#)[^\n]*\n)"""
+    r"""|(?P<open>['"`]|/\*|--|#)"""
+    r"""|(?P<end>;)""",
+    re.DOTALL
+)
+# Literals (kept as they are) and comments, for finding the comments that end a statement
+LITERAL_OR_COMMENT_PATTERN = re.compile(
+    r"""(?P<literal>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)|(?P<comment>--[^\n]*|#[^\n]*|/\*.*?\*/)""",
+    re.DOTALL
+)
+LIMIT_PATTERN = re.compile(r'\blimit\s+(\d+)(?:\s*,\s*(\d+))?(?:\s+offset\s+\d+)?\s*$', re.IGNORECASE)
+
+
+@dataclass
+class GuardResult:
+    allowed: bool
+    sql: str
+    reason: Optional[str] = None
+    estimated_rows: Optional[int] = None
+    rewritten: bool = False
+
+
+def strip_trailing_comments(sql: str) -> str:
+    """SQL without the comments (and semicolons) at its end, so text appended to it is not commented out"""
+    sql = sql.strip().rstrip(';').rstrip()
+    while True:
+        trailing = [match for match in LITERAL_OR_COMMENT_PATTERN.finditer(sql)
+                    if match.group('comment') and not sql[match.end():].strip()]
+        if not trailing:
+            return sql
+        sql = sql[:trailing[-1].start()].strip().rstrip(';').rstrip()
+
+
+def apply_row_limit(sql_query, max_rows):
+    """Add a LIMIT to SELECT statements that lack one, and lower any LIMIT above max_rows"""
+    sql_query = strip_trailing_comments(sql_query)
+    if not max_rows or statement_type(sql_query) not in ('select', 'with'):
+        return sql_query
+
+    match = LIMIT_PATTERN.search(sql_query)
+    if not match:
+        return f"{sql_query} LIMIT {max_rows}"
+
+    # MySQL's "LIMIT offset, count" form puts the row count second
+    count_group = 2 if match.group(2) else 1
+    if int(match.group(count_group)) <= max_rows:
+        return sql_query
+    start, end = match.span(count_group)
+    return sql_query[:start] + str(max_rows) + sql_query[end:]
+
+
+def strip_sql(sql: str) -> str:
+    """SQL with comments removed and string literals blanked, for keyword inspection only"""
+    masked = STRING_LITERAL_PATTERN.sub("''", sql)
+    return COMMENT_PATTERN.sub(" ", masked).strip()
+
+
+def first_complete_statement(text: str) -> Optional[str]:
+    """
+    The first statement of streamed model output once it is known to be complete, i.e. ended by a
+    semicolon outside literals and comments or by the closing code fence. None while it may still grow.
+    """
+    body = re.sub(r'^\s*```[a-zA-Z]*', '', text)
+    fenced = len(body) != len(text)
+    for match in STATEMENT_END_PATTERN.finditer(body):
+        if match.group('open'):
+            # A literal or comment that has not been closed yet
+            return None
+        if match.group('end') or (match.group('fence') and fenced):
+            statement = body[:match.start()].strip().lstrip(';').strip()
+            if statement:
+                return statement
+    return None
+
+
+def statement_type(sql: str) -> str:
+    match = re.match(r'[\s(]*(\w+)', strip_sql(sql))
+    return match.group(1).lower() if match else ""
+
+
+def rewrite_as_dry_run(sql: str) -> Optional[str]:
+    """SELECT the rows an UPDATE/DELETE would touch, so the user can review them instead"""
+    sql = sql.strip().rstrip(';')
+    delete = re.match(r'\s*delete\s+from\s+([`\w.]+)(.*)$', sql, re.IGNORECASE | re.DOTALL)
+    if delete:
+        return f"SELECT * FROM {delete.group(1)}{delete.group(2)}"
+    update = re.match(r'\s*update\s+([`\w.]+)\s+set\s+.*?(\bwhere\b.*)?$', sql, re.IGNORECASE | re.DOTALL)
+    if update:
+        return f"SELECT * FROM {update.group(1)} {update.group(2) or ''}".rstrip()
+    return None
+
+
+def estimate_examined_rows(plan) -> Optional[int]:
+    """
+    Rows MySQL expects to examine, from EXPLAIN output rows (dicts).
+    Tables joined within one SELECT multiply; separate SELECTs (subqueries, unions) add up.
+    """
+    per_select = {}
+    for step in plan:
+        rows = step.get('rows')
+        if rows is None:
+            continue
+        filtered = step.get('filtered')
+        per_select.setdefault(step.get('id'), []).append(int(rows) * (float(filtered) / 100 if filtered else 1))
+    if not per_select:
+        return None
+
+    total = 0
+    for estimates in per_select.values():
+        product = 1
+        for estimate in estimates:
+            product *= max(estimate, 1)
+        total += product
+    return int(total)
+
+
+def check_query(sql: str, explain=None) -> GuardResult:
+    """
+    Validate an LLM-generated statement before it runs.
+    explain: optional callable returning EXPLAIN rows (as dicts) for a SELECT.
+    """
+    stripped = strip_sql(sql)
+    if ';' in stripped.rstrip(';'):
+        return GuardResult(False, sql, "Multiple statements are not allowed")
+
+    kind = statement_type(sql)
+    rewritten = False
+    if kind in ('describe', 'desc') and not DESCRIBE_TABLE_PATTERN.match(stripped):
+        return GuardResult(False, sql, "EXPLAIN statements are not allowed; only DESCRIBE <table> is")
+    if kind not in READ_ONLY_KEYWORDS or (kind == 'with' and WRITE_KEYWORD_PATTERN.search(stripped)):
+        if SQL_WRITE_POLICY == 'allow':
+            return GuardResult(True, sql)
+        dry_run = rewrite_as_dry_run(sql) if SQL_WRITE_POLICY == 'dry_run' else None
+        if dry_run is None:
+            return GuardResult(False, sql, f"{kind.upper() or 'This'} statements are not allowed; only read-only queries run")
+        sql, rewritten = dry_run, True
+    elif re.search(r'\binto\s+(outfile|dumpfile)\b|\bfor\s+update\b|\block\s+in\s+share\s+mode\b', stripped, re.IGNORECASE):
+        return GuardResult(False, sql, "SELECT ... INTO OUTFILE and locking reads are not allowed")
+
+    if explain is None or statement_type(sql) not in ('select', 'with'):
+        return GuardResult(True, sql, rewritten=rewritten)
+
+    try:
+        estimated_rows = estimate_examined_rows(explain(sql))
+    except Exception as e:
+        print(f"EXPLAIN failed, skipping cost check: {e}")
+        return GuardResult(True, sql, rewritten=rewritten)
+
+    if estimated_rows is not None and estimated_rows > SQL_MAX_ESTIMATED_ROWS:
+        if SQL_COST_POLICY == 'reject':
+            return GuardResult(False, sql, f"Query would examine about {estimated_rows:,} rows "
+                                           f"(limit {SQL_MAX_ESTIMATED_ROWS:,})", estimated_rows)
+        limited = apply_row_limit(sql, SQL_AUTO_LIMIT_ROWS)
+        return GuardResult(True, limited, f"Query would examine about {estimated_rows:,} rows; "
+                                          f"result limited to {SQL_AUTO_LIMIT_ROWS} rows",
+                           estimated_rows, rewritten=rewritten or limited != sql)
+    return GuardResult(True, sql, estimated_rows=estimated_rows, rewritten=rewritten)
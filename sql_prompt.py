@@ -0,0 +1,195 @@
+import os
+from functools import lru_cache
+
+# Token budget for the conversation history part of the prompt, and how many past turns are considered
+PROMPT_HISTORY_TOKENS = int(os.getenv('PROMPT_HISTORY_TOKENS', '400'))
+PROMPT_HISTORY_TURNS = int(os.getenv('PROMPT_HISTORY_TURNS', '5'))
+# Characters per result value and result rows shown for a past turn
+PROMPT_VALUE_CHARS = int(os.getenv('PROMPT_VALUE_CHARS', '40'))
+PROMPT_PREVIEW_ROWS = int(os.getenv('PROMPT_PREVIEW_ROWS', '2'))
+
+# Built-in schema, used until the database has been introspected (see schema_catalog), and
+# descriptions for columns without a comment. Table -> [(column, type, note)]; notes are only
+# given where the column name is ambiguous
+SCHEMA = {
+    "patients_personal_details": [
+        ("id", "BIGINT", "primary key"),
+        ("uuid", "VARCHAR", ""),
+        ("mob_db_id", "VARCHAR", "mobile DB reference"),
+        ("patient_id", "VARCHAR", "external/hospital patient ID"),
+        ("name", "VARCHAR", "full name"),
+        ("age", "INT", ""),
+        ("height", "INT", "cm"),
+        ("weight", "INT", "kg"),
+        ("avatar", "VARCHAR", "image URL"),
+        ("blood", "VARCHAR", "blood group, e.g. A+"),
+        ("gender", "VARCHAR", ""),
+        ("date", "VARCHAR", "visit/admission date"),
+        ("location", "VARCHAR", ""),
+        ("patient_type", "VARCHAR", "e.g. outpatient, inpatient"),
+        ("symptoms", "LONGTEXT", ""),
+        ("note", "LONGTEXT", ""),
+        ("time_slot", "VARCHAR", "appointment slot"),
+        ("current_medication", "VARCHAR", ""),
+        ("policy_enrolled", "VARCHAR", "insurance policy"),
+        ("doctor_id", "INT", ""),
+        ("organisation_id", "BIGINT", ""),
+        ("assign_to", "INT", "assigned staff ID"),
+        ("created_by_id", "INT", ""),
+        ("created_at", "TIMESTAMP", ""),
+        ("updated_at", "TIMESTAMP", ""),
+        ("deleted_at", "TIMESTAMP", "set when soft deleted"),
+        ("session_type", "INT", "1 video, 2 audio"),
+        ("last_activity", "LONGTEXT", ""),
+        ("other_field_values", "LONGTEXT", "JSON"),
+    ]
+}
+
+RULES = """Rules:
+- Use only the tables and columns above; "patients" means patient records
+- "names" means the name column; "how many" means a COUNT query
+- Appointments/sessions: date, time_slot, session_type
+- Follow-up questions may refer to the previous turns below
+- Use standard SQL and output only the SQL query, ending with a semicolon, no explanations"""
+
+
+@lru_cache(maxsize=None)
+def _encoder():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise the usual ~4 characters per token estimate"""
+    encoder = _encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+def format_row_count(rows) -> str:
+    """Row estimate rounded to two significant digits, so small changes keep the prompt (and its cache) stable"""
+    if not rows:
+        return "0"
+    digits = len(str(int(rows)))
+    return str(round(int(rows), -max(digits - 2, 0)))
+
+
+def render_schema(schema: dict, row_counts: dict = None) -> str:
+    """One compact line per table: name ~rows(column TYPE [note], ...)"""
+    lines = []
+    for table, columns in schema.items():
+        rendered = ", ".join(
+            f"{name} {col_type} [{note}]" if note else f"{name} {col_type}"
+            for name, col_type, note in columns
+        )
+        size = f" ~{format_row_count(row_counts[table])} rows" if row_counts and table in row_counts else ""
+        lines.append(f"{table}{size}({rendered})")
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=256)
+def _static_prompt(schema_text: str) -> tuple:
+    prompt = (
+        "You convert natural language questions into SQL queries.\n\n"
+        f"Schema:\n{schema_text}\n\n{RULES}"
+    )
+    return prompt, count_tokens(prompt)
+
+
+def static_prompt(schema: dict = None, row_counts: dict = None) -> tuple:
+    """System prompt (schema + rules) and its token count; built once per schema and reused"""
+    return _static_prompt(render_schema(schema if schema is not None else SCHEMA, row_counts))
+
+
+def shorten(value, max_chars: int = PROMPT_VALUE_CHARS):
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "..."
+    return value
+
+
+def render_turn(entry: dict, preview_rows: int = PROMPT_PREVIEW_ROWS) -> str:
+    """A past turn as question, SQL and a short outcome line"""
+    lines = [f"Q: {entry['user_input']}", f"SQL: {entry['sql_query']}"]
+    if entry.get('error'):
+        lines.append(f"Error: {shorten(entry['error'], 120)}")
+    elif entry.get('row_count') is not None:
+        outcome = f"{entry['row_count']} rows"
+        preview = entry.get('results_preview') or []
+        if preview_rows and preview:
+            rows = "; ".join(str(tuple(shorten(value) for value in row)) for row in preview[:preview_rows])
+            outcome += f", e.g. {rows}"
+        lines.append(f"Result: {outcome}")
+    return "\n".join(lines)
+
+
+def render_history(history: list, budget: int = PROMPT_HISTORY_TOKENS, turns: int = PROMPT_HISTORY_TURNS) -> str:
+    """
+    Fit the most recent turns into a token budget. Newest turns are kept in full (dropping their result
+    preview if that is what it takes); once the budget runs out, older turns are reduced to their question.
+    """
+    if not history or budget <= 0 or turns <= 0:
+        return ""
+
+    kept = []
+    used = 0
+    full_turns = True
+    for entry in reversed(history[-turns:]):
+        candidates = (render_turn(entry), render_turn(entry, preview_rows=0)) if full_turns else ()
+        for text in candidates + (f"Q: {entry['user_input']}",):
+            cost = count_tokens(text) + 1
+            if used + cost <= budget:
+                kept.append(text)
+                used += cost
+                break
+        else:
+            break
+        # Once a turn had to be cut down, older turns only get their question
+        full_turns = full_turns and text == candidates[0]
+
+    if not kept:
+        return ""
+    return "Previous turns (oldest first):\n" + "\n\n".join(reversed(kept))
+
+
+def build_messages(nl_query: str, history: list, schema: dict = None, row_counts: dict = None) -> tuple:
+    """
+    Chat messages for one question: the cached static prompt as system message, the budgeted
+    history and the question as user message. Also returns the prompt's token counts.
+    """
+    system_prompt, system_tokens = static_prompt(schema, row_counts)
+    history_text = render_history(history)
+    question = f'Question: "{nl_query}"\nSQL:'
+    user_prompt = f"{history_text}\n\n{question}" if history_text else question
+
+    history_tokens = count_tokens(history_text) if history_text else 0
+    tokens = {
+        "schema": system_tokens,
+        "history": history_tokens,
+        "total": system_tokens + count_tokens(user_prompt),
+    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+    return messages, tokens
+
+
+def build_prediction_messages(history: list, count: int, schema: dict = None, row_counts: dict = None) -> list:
+    """
+    Messages asking for the `count` likeliest next questions of a conversation, each with its SQL.
+    The system message is the same cached static prompt as for normal questions.
+    """
+    system_prompt, _ = static_prompt(schema, row_counts)
+    instruction = (
+        f"Predict the {count} follow-up questions the user is most likely to ask next, most likely first, "
+        "with the SQL for each. Answer only in this format:\nQ: <question>\nSQL: <query>;"
+    )
+    history_text = render_history(history)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"{history_text}\n\n{instruction}" if history_text else instruction},
+    ]
@@ -0,0 +1,306 @@
+import os
+import time
+import json
+import uuid
+import asyncio
+from typing import Optional
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+from nlp_to_sql import ConversationalSQLAssistant, get_db_pool, get_history_store, get_schema_catalog
+from sql_cache import create_sql_cache_from_env
+from result_set import ResultSet
+from metrics import render_metrics
+
+# Sessions unused for this long are dropped, checked every SESSION_SWEEP_SECONDS
+SESSION_IDLE_SECONDS = float(os.getenv('SESSION_IDLE_SECONDS', '900'))
+SESSION_SWEEP_SECONDS = float(os.getenv('SESSION_SWEEP_SECONDS', '60'))
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', '1000'))
+# Per-session token bucket: sustained questions per minute and how many may come back to back
+SESSION_RATE_PER_MINUTE = float(os.getenv('SESSION_RATE_PER_MINUTE', '30'))
+SESSION_RATE_BURST = int(os.getenv('SESSION_RATE_BURST', '5'))
+# Maximum number of OpenAI requests in flight across all sessions
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '16'))
+
+app = FastAPI()
+
+# One NL→SQL cache for every session in the process
+sql_cache = create_sql_cache_from_env()
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+server_stats = {"sessions_created": 0, "sessions_evicted": 0, "sessions_resumed": 0, "questions": 0, "rate_limited": 0, "failed": 0}
+sweeper_task = None
+
+
+class QuestionRequest(BaseModel):
+    question: str
+
+
+class RateLimiter:
+    """Token bucket refilled at rate_per_minute, holding at most burst tokens"""
+
+    def __init__(self, rate_per_minute=SESSION_RATE_PER_MINUTE, burst=SESSION_RATE_BURST):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """Take a token; returns 0 on success, otherwise the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate else float('inf')
+
+
+class SessionAssistant(ConversationalSQLAssistant):
+    """Assistant whose results are returned to the client instead of printed"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.last_columns = None
+
+    def print_results_header(self, columns):
+        self.last_columns = list(columns)
+
+    def print_rows(self, rows):
+        pass
+
+
+class Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.assistant = SessionAssistant(sql_cache=sql_cache, session_id=session_id)
+        self.limiter = RateLimiter()
+        # Turns of one session run one at a time so history stays in order
+        self.lock = asyncio.Lock()
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS, max_sessions=MAX_SESSIONS):
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.sessions = {}
+
+    def create(self, session_id=None) -> Session:
+        if len(self.sessions) >= self.max_sessions:
+            self.evict_idle()
+        if len(self.sessions) >= self.max_sessions:
+            raise HTTPException(status_code=503, detail="Too many active sessions")
+        session = Session(session_id or uuid.uuid4().hex)
+        self.sessions[session.id] = session
+        server_stats["sessions_created"] += 1
+        return session
+
+    def get(self, session_id) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            # Evicted sessions and sessions from before a restart are resumed from the history store
+            store = get_history_store()
+            if not store or not store.has_session(session_id):
+                raise HTTPException(status_code=404, detail="Session not found")
+            session = self.create(session_id)
+            server_stats["sessions_resumed"] += 1
+        session.last_used = time.monotonic()
+        return session
+
+    def remove(self, session_id) -> bool:
+        return self.sessions.pop(session_id, None) is not None
+
+    def evict_idle(self) -> int:
+        """Drop sessions idle for longer than idle_seconds, skipping ones with a question in flight"""
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [
+            session_id for session_id, session in self.sessions.items()
+            if session.last_used < cutoff and not session.lock.locked()
+        ]
+        for session_id in idle:
+            del self.sessions[session_id]
+        server_stats["sessions_evicted"] += len(idle)
+        return len(idle)
+
+
+sessions = SessionManager()
+
+
+async def answer_question(session: Session, question: str) -> dict:
+    """One conversational turn: cached or LLM-generated SQL, executed on a pooled connection in the threadpool"""
+    retry_after = session.limiter.try_acquire()
+    if retry_after:
+        server_stats["rate_limited"] += 1
+        raise HTTPException(status_code=429, detail="Rate limit exceeded",
+                            headers={"Retry-After": str(max(1, round(retry_after)))})
+
+    async with session.lock:
+        start = time.perf_counter()
+        assistant = session.assistant
+        assistant.last_columns = None
+        assistant.stage_timings = {}
+        server_stats["questions"] += 1
+
+        cache_key, sql_query = await run_in_threadpool(assistant.lookup_cached_sql, question)
+        from_cache = sql_query is not None
+        generation_latency = None
+        if not from_cache:
+            await run_in_threadpool(assistant.refresh_schema)
+            async with llm_semaphore:
+                generation_start = time.perf_counter()
+                sql_query = await assistant.anatural_language_to_sql(question)
+                generation_latency = time.perf_counter() - generation_start
+        if not sql_query:
+            server_stats["failed"] += 1
+            raise HTTPException(status_code=502, detail="Failed to generate SQL query")
+
+        results = await run_in_threadpool(
+            assistant.run_generated_sql, question, sql_query, cache_key, generation_latency
+        )
+        session.last_used = time.monotonic()
+        entry = assistant.conversation_history[-1]
+        if entry["error"]:
+            server_stats["failed"] += 1
+        return jsonable_encoder({
+            "session_id": session.id,
+            "question": question,
+            "sql": entry["sql_query"],
+            "from_cache": from_cache,
+            "columns": assistant.last_columns,
+            "rows": results.to_rows() if isinstance(results, ResultSet) else results,
+            "summary": results.summary() if isinstance(results, ResultSet) else None,
+            "row_count": entry["row_count"],
+            "error": entry["error"],
+            "seconds": round(time.perf_counter() - start, 4),
+            "stage_seconds": {stage: round(seconds, 4) for stage, seconds in assistant.stage_timings.items()}
+        })
+
+
+async def sweep_idle_sessions():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        evicted = sessions.evict_idle()
+        if evicted:
+            print(f"Evicted {evicted} idle sessions, {len(sessions.sessions)} active")
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    global sweeper_task
+    sweeper_task = asyncio.create_task(sweep_idle_sessions())
+    # Introspect the schema before the first question rather than during it
+    await run_in_threadpool(get_schema_catalog().refresh_if_stale, get_db_pool())
+
+
+@app.on_event("shutdown")
+async def stop_session_sweeper():
+    if sweeper_task is not None:
+        sweeper_task.cancel()
+    if sql_cache:
+        await run_in_threadpool(sql_cache.flush)
+
+
+@app.post("/sessions", status_code=201)
+async def create_session():
+    """Start a conversation with its own history"""
+    session = sessions.create()
+    return JSONResponse(status_code=201, content={"session_id": session.id})
+
+
+@app.post("/sessions/{session_id}/query")
+async def query(session_id: str, request: QuestionRequest):
+    """Ask a question in the context of the session's earlier questions"""
+    return JSONResponse(content=await answer_question(sessions.get(session_id), request.question))
+
+
+@app.get("/sessions/{session_id}/history")
+async def history(session_id: str, limit: int = 100, offset: int = 0):
+    """One page of the session's turns, oldest first"""
+    session = sessions.get(session_id)
+    store = session.assistant.history_store
+    if store:
+        entries = await run_in_threadpool(store.entries, session_id, limit, offset)
+    else:
+        entries = session.assistant.conversation_history[offset:offset + limit]
+    return JSONResponse(content=jsonable_encoder(entries))
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a session and delete its stored history"""
+    store = get_history_store()
+    stored = bool(store) and store.has_session(session_id)
+    if not sessions.remove(session_id) and not stored:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if stored:
+        await run_in_threadpool(store.clear_session, session_id)
+    return JSONResponse(content={"deleted": session_id})
+
+
+def parse_ws_question(message: str) -> Optional[str]:
+    """The question of a WebSocket message (plain text or {"question": ...}), or None when there is no usable one"""
+    try:
+        payload = json.loads(message)
+    except ValueError:
+        payload = None
+    question = payload.get("question") if isinstance(payload, dict) else message
+    if not isinstance(question, str) or not question.strip():
+        return None
+    return question
+
+
+@app.websocket("/ws")
+async def websocket_session(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    Conversational session over a WebSocket. Resumes session_id when given, otherwise starts one.
+    Each message is a question (plain text or {"question": ...}); each reply is the query result as JSON.
+    """
+    await websocket.accept()
+    try:
+        session = sessions.get(session_id) if session_id else sessions.create()
+    except HTTPException as e:
+        await websocket.send_json({"error": e.detail, "status": e.status_code})
+        await websocket.close()
+        return
+    await websocket.send_json({"session_id": session.id})
+
+    try:
+        while True:
+            message = await websocket.receive_text()
+            question = parse_ws_question(message)
+            if question is None:
+                await websocket.send_json({"error": 'Expected a non-empty question: plain text or {"question": "..."}',
+                                           "status": 400})
+                continue
+            session.last_used = time.monotonic()
+            try:
+                await websocket.send_json(await answer_question(session, question))
+            except HTTPException as e:
+                await websocket.send_json({"error": e.detail, "status": e.status_code})
+            except Exception as e:
+                # Keep the socket open; the client gets the failure as a frame like any other error
+                print(f"Error answering WebSocket question: {e}")
+                server_stats["failed"] += 1
+                await websocket.send_json({"error": "Internal error while answering the question", "status": 500})
+    except WebSocketDisconnect:
+        # The session stays available for reconnects until it is evicted as idle
+        pass
+
+
+@app.get("/stats")
+async def stats():
+    """Active sessions, question counts and shared cache hit rates"""
+    return JSONResponse(content=dict(
+        server_stats,
+        active_sessions=len(sessions.sessions),
+        sql_cache=sql_cache.get_stats() if sql_cache else None
+    ))
+
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage timings of answered questions in Prometheus format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
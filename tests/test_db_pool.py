@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+class TransactionalConnection:
+    """SQLite connection that opens a transaction on the first statement, as MySQL with autocommit off does"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+
+    def cursor(self):
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+        return self._conn.cursor()
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+@pytest.fixture
+def db_path():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "pool.db")
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY)")
+        conn.execute("INSERT INTO items VALUES (1)")
+        conn.commit()
+        conn.close()
+        yield path
+
+
+def count_items(pool):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM items")
+        count = cursor.fetchone()[0]
+        cursor.close()
+        return count
+
+
+def test_reused_connection_sees_rows_committed_after_its_first_query(db_path):
+    pool = ConnectionPool(lambda: TransactionalConnection(db_path), size=1)
+    assert count_items(pool) == 1
+
+    writer = sqlite3.connect(db_path)
+    writer.execute("INSERT INTO items VALUES (2)")
+    writer.commit()
+    writer.close()
+
+    assert count_items(pool) == 2
+    assert pool.stats["reused"] == 1
+    pool.close()
+
+
+def test_waiter_gets_slot_freed_by_broken_connection(db_path):
+    pool = ConnectionPool(lambda: TransactionalConnection(db_path), size=1, timeout=3)
+    conn = pool.acquire()
+    acquired = []
+
+    def wait_for_connection():
+        acquired.append(pool.acquire())
+
+    waiter = threading.Thread(target=wait_for_connection)
+    start = time.monotonic()
+    waiter.start()
+    time.sleep(0.1)
+    pool.release(conn, broken=True)
+    waiter.join()
+
+    assert acquired and time.monotonic() - start < 1
+    pool.release(acquired[0])
+    pool.close()
+
+
+def test_acquire_times_out_when_pool_is_exhausted(db_path):
+    pool = ConnectionPool(lambda: TransactionalConnection(db_path), size=1, timeout=0.1)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    pool.release(conn)
+    pool.close()
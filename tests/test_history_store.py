@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+from history_store import HistoryStore
+
+
+def stored_previews(store):
+    return [row[0] for row in store._conn.execute("SELECT results_preview FROM history")]
+
+
+def test_result_previews_are_not_persisted_by_default():
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(os.path.join(directory, "history.db"))
+        store.add_entry("session", "Who is the oldest patient?", "SELECT name FROM patients", 1, "abc",
+                        [("John Smith",)])
+        assert stored_previews(store) == [None]
+        entry = store.recent_entries("session", 5)[0]
+        assert (entry["row_count"], entry["result_hash"], entry["results_preview"]) == (1, "abc", [])
+
+
+def test_result_previews_are_persisted_when_opted_in():
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(os.path.join(directory, "history.db"), store_previews=True)
+        store.add_entry("session", "Who is the oldest patient?", "SELECT name FROM patients", 1, "abc",
+                        [("John Smith",)])
+        assert store.recent_entries("session", 5)[0]["results_preview"] == [["John Smith"]]
@@ -0,0 +1,15 @@
+from unittest import mock
+
+from schema_catalog import SchemaCatalog
+
+
+def test_first_refresh_is_due_even_right_after_boot():
+    catalog = SchemaCatalog(refresh_seconds=300)
+    with mock.patch("schema_catalog.time.monotonic", return_value=12.0):
+        assert catalog.is_stale()
+        catalog.checked_at = 12.0
+        assert not catalog.is_stale()
+
+
+def test_infinite_refresh_interval_never_introspects():
+    assert not SchemaCatalog(refresh_seconds=float('inf')).is_stale()
@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+import time
+
+from sql_cache import SQLQueryCache
+
+
+def saved_questions(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [entry["question"] for entry in json.load(f)["entries"]]
+
+
+def test_puts_are_saved_together_after_the_save_interval():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sql_cache.json")
+        cache = SQLQueryCache(path=path, save_interval=0.2)
+        for index in range(50):
+            cache.put(("", f"question {index}"), f"SELECT {index}", 1.0)
+        assert saved_questions(path) == []
+        time.sleep(0.5)
+        assert len(saved_questions(path)) == 50
+
+
+def test_flush_writes_pending_entries_and_they_load_back():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sql_cache.json")
+        cache = SQLQueryCache(path=path, save_interval=60)
+        cache.put(("", "how many patients"), "SELECT COUNT(*) FROM patients", 1.5)
+        cache.flush()
+        assert SQLQueryCache(path=path).get(("", "how many patients")) == "SELECT COUNT(*) FROM patients"
+
+
+def test_zero_interval_saves_on_every_put():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sql_cache.json")
+        cache = SQLQueryCache(path=path, save_interval=0)
+        cache.put(("", "how many patients"), "SELECT COUNT(*) FROM patients", 1.5)
+        assert saved_questions(path) == ["how many patients"]
@@ -0,0 +1,34 @@
+import pytest
+
+from sql_guard import apply_row_limit, check_query
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM t -- all rows",
+    "SELECT * FROM t -- all rows\n",
+    "SELECT * FROM t # all rows",
+    "SELECT * FROM t; # all rows",
+    "SELECT * FROM t /* note */ -- all rows",
+])
+def test_limit_is_not_appended_inside_a_trailing_comment(sql):
+    assert apply_row_limit(sql, 1000) == "SELECT * FROM t LIMIT 1000"
+
+
+def test_limit_before_a_trailing_comment_is_lowered():
+    assert apply_row_limit("SELECT * FROM t LIMIT 5000 -- everything", 1000) == "SELECT * FROM t LIMIT 1000"
+    assert apply_row_limit("SELECT * FROM t LIMIT 10 # a few", 1000) == "SELECT * FROM t LIMIT 10"
+
+
+def test_comment_markers_inside_literals_are_kept():
+    assert apply_row_limit("SELECT '-- not a comment', \"#\" FROM t", 100) == \
+        "SELECT '-- not a comment', \"#\" FROM t LIMIT 100"
+
+
+def test_statement_after_a_leading_comment_is_limited():
+    assert apply_row_limit("-- patients\nSELECT * FROM t", 100) == "-- patients\nSELECT * FROM t LIMIT 100"
+
+
+def test_commented_select_passes_the_guard_and_gets_a_limit():
+    check = check_query("SELECT * FROM t -- all rows")
+    assert check.allowed
+    assert apply_row_limit(check.sql, 1000).endswith("LIMIT 1000")
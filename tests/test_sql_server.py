@@ -0,0 +1,17 @@
+import pytest
+
+from sql_server import parse_ws_question
+
+
+@pytest.mark.parametrize("message", ['{"question": 5}', '{"question": null}', '{"question": "  "}', '{}', '   '])
+def test_messages_without_a_usable_question_are_rejected(message):
+    assert parse_ws_question(message) is None
+
+
+@pytest.mark.parametrize("message, question", [
+    ('How many patients are there?', 'How many patients are there?'),
+    ('{"question": "How many patients are there?"}', 'How many patients are there?'),
+    ('5', '5'),
+])
+def test_plain_text_and_json_questions_are_accepted(message, question):
+    assert parse_ws_question(message) == question
@@ -0,0 +1,83 @@
+import asyncio
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+import title_generation
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(title_generation, "MAX_REQUEST_BYTES", 2000)
+    return TestClient(title_generation.app)
+
+
+def test_request_over_content_length_limit_is_rejected(client):
+    response = client.post("/extract", files={"file": ("a.txt", b"x" * 5000, "text/plain")})
+    assert response.status_code == 413
+
+
+def test_streamed_request_is_cut_off_at_the_limit(client):
+    def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\n'
+        for _ in range(10):
+            yield b"y" * 500
+        yield b"\r\n--b--\r\n"
+
+    response = client.post("/extract", content=body(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+
+
+def test_small_upload_is_processed(client):
+    response = client.post("/extract", files={"file": ("a.txt", b"Name: John Smith\nDOB: 01/15/1985\n", "text/plain")})
+    assert response.status_code == 200
+    assert response.json()["extracted_info"] == {"name": "John Smith", "dob": "01/15/1985"}
+
+
+def test_batch_expansion_removes_spooled_files_on_failure(monkeypatch, tmp_path):
+    monkeypatch.setattr(title_generation, "UPLOAD_SPOOL_DIR", str(tmp_path))
+
+    def fail(filename, path):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(title_generation, "expand_zip_archive", fail)
+    files = [UploadFile(io.BytesIO(b"hello"), filename="a.txt"), UploadFile(io.BytesIO(b"PK"), filename="b.zip")]
+    with pytest.raises(OSError):
+        asyncio.run(title_generation.expand_batch_uploads(files))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("url", [
+    "https://169.254.169.254/latest/meta-data/",
+    "https://10.0.0.5/hook",
+    "https://localhost/hook",
+    "https://127.0.0.1/hook",
+    "https://[::1]/hook",
+    "https://[::ffff:192.168.0.1]/hook",
+])
+def test_callback_url_to_internal_address_is_rejected(monkeypatch, url):
+    monkeypatch.setattr(title_generation, "JOB_CALLBACK_HOSTS", set())
+    with pytest.raises(title_generation.HTTPException) as excinfo:
+        title_generation.validate_callback_url(url)
+    assert excinfo.value.status_code == 400
+
+
+def test_callback_url_to_public_address_is_accepted(monkeypatch):
+    monkeypatch.setattr(title_generation, "JOB_CALLBACK_HOSTS", set())
+    title_generation.validate_callback_url("https://93.184.216.34/hook")
+
+
+def test_callback_url_to_listed_host_is_accepted(monkeypatch):
+    monkeypatch.setattr(title_generation, "JOB_CALLBACK_HOSTS", {"hooks.internal"})
+    title_generation.validate_callback_url("https://hooks.internal/done")
+    with pytest.raises(title_generation.HTTPException):
+        title_generation.validate_callback_url("https://example.com/done")
+
+
+def test_callback_is_not_sent_to_internal_address(monkeypatch):
+    monkeypatch.setattr(title_generation, "JOB_CALLBACK_HOSTS", set())
+    monkeypatch.setattr(title_generation.requests, "post", lambda *args, **kwargs: pytest.fail("callback was sent"))
+    title_generation.send_job_callback("https://127.0.0.1/hook", {})
@@ -1,40 +1,239 @@
 import os
+import time
+import asyncio
+import hashlib
+import ipaddress
+import socket
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 import openai
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from docx import Document
-import PyPDF2
+import requests
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 import json
 import re
+from datetime import datetime
+from urllib.parse import urlsplit
+from extraction_cache import PROMPT_TEXT_CHARS, create_cache_from_env, hash_prompt_text
+from llm_batching import MicroBatcher
+from metrics import Counter, Histogram, render_metrics, size_bucket
+from job_store import JobStore, QUEUED, RUNNING
+from doc_parsers import ACTIVE_BACKENDS, FORMAT_NAMES, UnsupportedFormatError, extract_text_from_path
 
 load_dotenv()
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+# Maximum number of documents from one /extract/batch request processed at once
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+# Worker processes used for PDF/DOCX parsing (0 parses in the threadpool instead)
+PARSE_POOL_WORKERS = int(os.getenv('PARSE_POOL_WORKERS', str(os.cpu_count() or 1)))
+# Maximum number of OpenAI requests in flight per worker
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '16'))
+# Documents packed into one LLM request (1 disables packing) and how long to wait for a batch to fill
+LLM_BATCH_SIZE = int(os.getenv('LLM_BATCH_SIZE', '1'))
+LLM_BATCH_WAIT_MS = int(os.getenv('LLM_BATCH_WAIT_MS', '50'))
+# Uploads are streamed to disk in chunks and rejected past the size limit
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR') or None
+# Whole request bodies are cut off past these sizes while they are received, before multipart parsing
+# spools them: one file plus form overhead, or all files of an /extract/batch request
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(MAX_UPLOAD_BYTES + 64 * 1024)))
+MAX_BATCH_REQUEST_BYTES = int(os.getenv('MAX_BATCH_REQUEST_BYTES', str(10 * MAX_UPLOAD_BYTES)))
+# Background workers and SQLite state for the /jobs submit/poll mode
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', 'jobs.db')
+JOB_CALLBACK_TIMEOUT = float(os.getenv('JOB_CALLBACK_TIMEOUT', '10'))
+# Callback URLs must use one of these schemes and either point at one of the listed hosts or, when none
+# are listed, at a host that resolves only to public addresses
+JOB_CALLBACK_SCHEMES = {s.strip().lower() for s in os.getenv('JOB_CALLBACK_SCHEMES', 'https').split(',') if s.strip()}
+JOB_CALLBACK_HOSTS = {h.strip().lower() for h in os.getenv('JOB_CALLBACK_HOSTS', '').split(',') if h.strip()}
+
+class RequestTooLarge(Exception):
+    pass
+
+class RequestSizeLimitMiddleware:
+    """
+    Rejects request bodies over the limit for their path with 413: up front from Content-Length, or
+    as soon as a streamed (chunked) body passes it, so oversized uploads are never fully received
+    """
+
+    def __init__(self, app, limit_for_path):
+        self.app = app
+        self.limit_for_path = limit_for_path
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for_path(scope["path"]) if scope["type"] == "http" else None
+        if not limit:
+            return await self.app(scope, receive, send)
+
+        # Whether the app has started its response, and whether a 413 went out instead
+        state = {"started": False, "rejected": False}
+
+        async def reject():
+            if state["started"] or state["rejected"]:
+                return
+            state["rejected"] = True
+            body = json.dumps({"detail": f"Request body exceeds the {limit} byte limit"}).encode()
+            await send({"type": "http.response.start", "status": 413,
+                        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length and length.isdigit() and int(length) > limit:
+            return await reject()
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    await reject()
+                    raise RequestTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # Once the 413 is out, whatever the app makes of the aborted body is dropped
+            if state["rejected"]:
+                return
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestTooLarge:
+            await reject()
+
+def request_body_limit(path: str) -> int:
+    return MAX_BATCH_REQUEST_BYTES if path.rstrip("/") == "/extract/batch" else MAX_REQUEST_BYTES
+
 app = FastAPI()
+app.add_middleware(RequestSizeLimitMiddleware, limit_for_path=request_body_limit)
+
+parse_pool = None
+result_cache = create_cache_from_env()
+# How often each path answered an extraction: result cache, local heuristics or the LLM
+path_counts = {"file_cache": 0, "text_cache": 0, "heuristic": 0, "llm": 0}
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+job_store = None
+job_queue = None
+job_worker_tasks = []
+
+STAGE_SECONDS = Histogram(
+    "extraction_stage_seconds", "Time spent in each extraction stage",
+    ["stage"]
+)
+REQUEST_SECONDS = Histogram(
+    "extraction_document_seconds", "End-to-end extraction time per document",
+    ["file_type", "size_bucket", "source"]
+)
+DOCUMENTS_TOTAL = Counter(
+    "extraction_documents_total", "Documents processed, by answering path",
+    ["file_type", "size_bucket", "source"]
+)
+LLM_TOKENS_TOTAL = Counter(
+    "openai_tokens_total", "OpenAI tokens used by extraction requests",
+    ["kind"]
+)
 
-def extract_text_from_pdf(file) -> str:
-    reader = PyPDF2.PdfReader(file)
-    return "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
+def file_type_label(filename: str) -> str:
+    ext = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ""
+    return ext if ext in ("pdf", "docx", "txt", "rtf", "html", "htm", "odt") else "other"
 
-def extract_text_from_docx(file) -> str:
-    doc = Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
+def record_token_usage(response):
+    usage = response.get('usage') or {}
+    LLM_TOKENS_TOTAL.inc(usage.get('prompt_tokens', 0), "prompt")
+    LLM_TOKENS_TOTAL.inc(usage.get('completion_tokens', 0), "completion")
 
 def extract_text(file: UploadFile) -> str:
-    ext = file.filename.lower().split('.')[-1]
-    if ext == "pdf":
-        return extract_text_from_pdf(file.file)
-    elif ext == "docx":
-        return extract_text_from_docx(file.file)
-    elif ext == "txt":
-        return file.file.read().decode('utf-8')
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported file format")
+    path, _ = spool_file(file.file)
+    try:
+        return extract_text_from_path(path)
+    except UnsupportedFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.unlink(path)
 
-def get_title_from_doc(doc_text: str) -> dict:
-    prompt = f"""
-    You are a precise data extraction assistant. Your task is to extract a person's full name and date of birth from the provided document text.
+def get_parse_pool():
+    global parse_pool
+    if parse_pool is None and PARSE_POOL_WORKERS > 0:
+        parse_pool = ProcessPoolExecutor(max_workers=PARSE_POOL_WORKERS)
+    return parse_pool
+
+async def extract_text_async(path: str) -> str:
+    """Parse a spooled document off the event loop, in the parse pool when one is configured"""
+    pool = get_parse_pool()
+    try:
+        if pool is None:
+            return await run_in_threadpool(extract_text_from_path, path)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, extract_text_from_path, path)
+    except UnsupportedFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def upload_too_large():
+    return HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+
+def spool_file(file) -> tuple:
+    """
+    Copy a readable file object to a temporary file in chunks, hashing it on the way.
+    Returns: (temporary file path, sha256 of the contents)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.NamedTemporaryFile(delete=False, dir=UPLOAD_SPOOL_DIR)
+    try:
+        with spool:
+            while True:
+                chunk = file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise upload_too_large()
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        os.unlink(spool.name)
+        raise
+    return spool.name, digest.hexdigest()
+
+async def spool_upload(upload: UploadFile) -> tuple:
+    """
+    Async counterpart of spool_file for UploadFile, enforcing MAX_UPLOAD_BYTES.
+    The multipart parser has already spooled the file (to memory, then its own unnamed temporary file),
+    so this is a second copy; it gives the parsers a path. Ingress is bounded earlier, while the body is
+    received, by RequestSizeLimitMiddleware.
+    """
+    size = getattr(upload, "size", None)
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+    await upload.seek(0)
+    with STAGE_SECONDS.time("read"):
+        return await run_in_threadpool(spool_file, upload.file)
+
+@app.on_event("startup")
+def start_parse_pool():
+    for mime_type, (backend_name, _) in ACTIVE_BACKENDS.items():
+        print(f"Parser backend for {FORMAT_NAMES.get(mime_type, mime_type)}: {backend_name}")
+    get_parse_pool()
+
+@app.on_event("shutdown")
+def stop_parse_pool():
+    global parse_pool
+    if parse_pool is not None:
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+        parse_pool = None
+
+EXTRACTION_INSTRUCTIONS = """You are a precise data extraction assistant. Your task is to extract a person's full name and date of birth from the provided document text.
 
     EXTRACTION RULES:
     1. Look for full names (first name + last name at minimum)
@@ -55,7 +254,11 @@ def get_title_from_doc(doc_text: str) -> dict:
     - Company names, organization names
     - Addresses, phone numbers
     - Random dates that aren't birth dates
-    - Partial names or single words
+    - Partial names or single words"""
+
+def build_title_prompt(doc_text: str) -> str:
+    return f"""
+    {EXTRACTION_INSTRUCTIONS}
 
     OUTPUT FORMAT:
     You must respond with ONLY a valid JSON object in this exact format:
@@ -69,107 +272,301 @@ def get_title_from_doc(doc_text: str) -> dict:
     If neither found: {{"name": null, "dob": null}}
 
     DOCUMENT TEXT:
-    \"\"\"{doc_text[:2000]}\"\"\"
+    \"\"\"{doc_text[:PROMPT_TEXT_CHARS]}\"\"\"
 
     JSON Response:"""
 
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,  
-            max_tokens=150,   
-        )
-
-        content = response['choices'][0]['message']['content'].strip()
+def build_batch_title_prompt(doc_texts: list) -> str:
+    """Pack several documents into one prompt that asks for one JSON result per document"""
+    documents = "\n\n".join(
+        f'    DOCUMENT {index}:\n    \"\"\"{doc_text[:PROMPT_TEXT_CHARS]}\"\"\"'
+        for index, doc_text in enumerate(doc_texts, 1)
+    )
+    return f"""
+    {EXTRACTION_INSTRUCTIONS}
+
+    You will be given {len(doc_texts)} separate documents. Extract the name and DOB from each one independently.
+
+    OUTPUT FORMAT:
+    You must respond with ONLY a valid JSON object in this exact format, with exactly one entry per document:
+    {{
+        "results": [
+            {{"id": 1, "name": "First Last", "dob": "MM/DD/YYYY"}}
+        ]
+    }}
+
+    Use null for any name or dob that is not found.
+
+{documents}
+
+    JSON Response:"""
+
+def parse_title_response(content: str) -> dict:
+    """Pull the name/dob JSON object out of the model's reply"""
+    json_match = re.search(r'\{.*\}', content.strip(), re.DOTALL)
+    if json_match:
+        json_str = json_match.group()
+        result = json.loads(json_str)
         
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if json_match:
-            json_str = json_match.group()
-            result = json.loads(json_str)
-            
-            if not isinstance(result, dict) or not all(key in result for key in ['name', 'dob']):
-                return {"name": None, "dob": None}
-            
-            # name = clean_name(result.get('name'))
-            # dob = clean_dob(result.get('dob'))
-            name = result.get('name')
-            dob = result.get('dob')
-            return {"name": name, "dob": dob}
-        else:
+        if not isinstance(result, dict) or not all(key in result for key in ['name', 'dob']):
             return {"name": None, "dob": None}
+        
+        # Same normalization as the heuristic path: title-cased name, MM/DD/YYYY date
+        name = clean_name(result.get('name'))
+        dob = clean_dob(result.get('dob'))
+        return {"name": name, "dob": dob}
+    else:
+        return {"name": None, "dob": None}
+
+def get_title_from_doc(doc_text: str) -> dict:
+    with STAGE_SECONDS.time("prompt_build"):
+        prompt = build_title_prompt(doc_text)
+
+    try:
+        with STAGE_SECONDS.time("llm"):
+            response = openai.ChatCompletion.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,  
+                max_tokens=150,   
+            )
+        record_token_usage(response)
+
+        content = response['choices'][0]['message']['content']
+        with STAGE_SECONDS.time("json_parse"):
+            return parse_title_response(content)
             
     except (json.JSONDecodeError, KeyError, Exception) as e:
         print(f"Error processing OpenAI response: {e}")
         return {"name": None, "dob": None}
 
-# def clean_name(name):
-#     """Clean and validate extracted name"""
-#     if not name or not isinstance(name, str):
-#         return None
+def parse_batch_title_response(content: str, count: int) -> list:
+    """Split a packed response back into one name/dob dict per document, in input order"""
+    results = [{"name": None, "dob": None} for _ in range(count)]
+    json_match = re.search(r'\{.*\}', content.strip(), re.DOTALL)
+    if not json_match:
+        return results
+
+    entries = json.loads(json_match.group()).get("results", [])
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("id", position + 1)
+        if isinstance(index, int) and 1 <= index <= count:
+            results[index - 1] = {"name": clean_name(entry.get("name")), "dob": clean_dob(entry.get("dob"))}
+    return results
+
+async def get_titles_from_docs(doc_texts: list) -> list:
+    """One chat completion for a micro-batch of documents"""
+    with STAGE_SECONDS.time("prompt_build"):
+        prompt = build_batch_title_prompt(doc_texts)
+
+    try:
+        async with llm_semaphore:
+            with STAGE_SECONDS.time("llm"):
+                response = await openai.ChatCompletion.acreate(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    max_tokens=60 * len(doc_texts) + 50,
+                )
+        record_token_usage(response)
+
+        content = response['choices'][0]['message']['content']
+        with STAGE_SECONDS.time("json_parse"):
+            return parse_batch_title_response(content, len(doc_texts))
+
+    except (json.JSONDecodeError, KeyError, Exception) as e:
+        print(f"Error processing OpenAI batch response: {e}")
+        return [{"name": None, "dob": None} for _ in doc_texts]
+
+title_batcher = MicroBatcher(get_titles_from_docs, max_batch_size=LLM_BATCH_SIZE, max_wait_ms=LLM_BATCH_WAIT_MS)
+
+async def aget_title_from_doc(doc_text: str) -> dict:
+    """Async variant of get_title_from_doc that does not block the event loop"""
+    if LLM_BATCH_SIZE > 1:
+        return await title_batcher.submit(doc_text)
+
+    with STAGE_SECONDS.time("prompt_build"):
+        prompt = build_title_prompt(doc_text)
+
+    try:
+        async with llm_semaphore:
+            with STAGE_SECONDS.time("llm"):
+                response = await openai.ChatCompletion.acreate(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    max_tokens=150,
+                )
+        record_token_usage(response)
+
+        content = response['choices'][0]['message']['content']
+        with STAGE_SECONDS.time("json_parse"):
+            return parse_title_response(content)
+
+    except (json.JSONDecodeError, KeyError, Exception) as e:
+        print(f"Error processing OpenAI response: {e}")
+        return {"name": None, "dob": None}
+
+def clean_name(name):
+    """Clean and validate extracted name"""
+    if not name or not isinstance(name, str):
+        return None
     
-#     # Remove extra whitespace and convert to proper case
-#     name = ' '.join(name.strip().split())
+    # Remove extra whitespace and convert to proper case
+    name = ' '.join(name.strip().split())
     
-#     # Basic validation - should have at least first and last name
-#     if len(name.split()) < 2:
-#         return None
+    # Basic validation - should have at least first and last name
+    if len(name.split()) < 2:
+        return None
     
-#     # Remove common titles
-#     titles = ['dr.', 'mr.', 'mrs.', 'ms.', 'prof.', 'dr', 'mr', 'mrs', 'ms', 'prof']
-#     words = name.lower().split()
-#     cleaned_words = [word for word in name.split() if word.lower().rstrip('.') not in titles]
+    # Remove common titles
+    titles = ['dr.', 'mr.', 'mrs.', 'ms.', 'prof.', 'dr', 'mr', 'mrs', 'ms', 'prof']
+    cleaned_words = [word for word in name.split() if word.lower().rstrip('.') not in titles]
     
-#     if len(cleaned_words) >= 2:
-#         return ' '.join(cleaned_words).title()
+    if len(cleaned_words) >= 2:
+        return ' '.join(cleaned_words).title()
     
-#     return None
+    return None
 
-# def clean_dob(dob):
-#     """Clean and validate extracted date of birth"""
-#     if not dob or not isinstance(dob, str):
-#         return None
-    
-#     # Remove extra whitespace
-#     dob = dob.strip()
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+def clean_dob(dob):
+    """Clean and validate extracted date of birth, returning MM/DD/YYYY"""
+    if not dob or not isinstance(dob, str):
+        return None
     
-#     # Try to match MM/DD/YYYY format
-#     if re.match(r'^\d{1,2}/\d{1,2}/\d{4}$', dob):
-#         return dob
+    # Remove extra whitespace
+    dob = dob.strip()
     
-#     # Try to parse other common formats and convert to MM/DD/YYYY
-#     date_patterns = [
-#         (r'(\d{1,2})-(\d{1,2})-(\d{4})', r'\1/\2/\3'),  # MM-DD-YYYY
-#         (r'(\d{4})-(\d{1,2})-(\d{1,2})', r'\2/\3/\1'),  # YYYY-MM-DD
-#         (r'(\d{1,2})\.(\d{1,2})\.(\d{4})', r'\1/\2/\3'), # MM.DD.YYYY
-#     ]
+    # Try to parse common formats and convert to MM/DD/YYYY
+    date_patterns = [
+        (r'^(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4})$', ('month', 'day', 'year')),  # MM/DD/YYYY, MM-DD-YYYY, MM.DD.YYYY
+        (r'^(\d{4})-(\d{1,2})-(\d{1,2})$', ('year', 'month', 'day')),          # YYYY-MM-DD
+        (r'^([A-Za-z]{3,9})\.?\s+(\d{1,2}),?\s+(\d{4})$', ('month', 'day', 'year')),  # January 15, 1985
+        (r'^(\d{1,2})[\s\-]([A-Za-z]{3,9})[\s\-,]+(\d{4})$', ('day', 'month', 'year')),  # 15-Jan-1985
+    ]
     
-#     for pattern, replacement in date_patterns:
-#         match = re.match(pattern, dob)
-#         if match:
-#             return re.sub(pattern, replacement, dob)
+    for pattern, order in date_patterns:
+        match = re.match(pattern, dob)
+        if not match:
+            continue
+        parts = dict(zip(order, match.groups()))
+        month = parts['month']
+        if month.isdigit():
+            month = int(month)
+        else:
+            month = MONTHS.get(month[:3].lower())
+        try:
+            parsed = datetime(int(parts['year']), month or 0, int(parts['day']))
+        except ValueError:
+            return None
+        if parsed.year < 1900 or parsed > datetime.now():
+            return None
+        return parsed.strftime("%m/%d/%Y")
     
-#     return None
+    return None
+
+NAME_LABEL_PATTERN = re.compile(
+    r"^[ \t]*(?:patient(?:'s)?[ \t]+)?(?:full[ \t]+)?name[ \t]*[:\-][ \t]*"
+    r"([A-Za-z][A-Za-z .'\-]*?)"
+    r"(?=[ \t]{2,}|[ \t]+(?:dob|d\.o\.b|date of birth|birth|age|sex|gender|mrn|id)\b|[ \t]*$)",
+    re.IGNORECASE | re.MULTILINE
+)
+DOB_LABEL_PATTERN = re.compile(
+    r"\b(?:dob|d\.o\.b\.?|date of birth|birth date|birthdate|born)[ \t]*[:\-]?[ \t]*"
+    r"(\d{1,2}[/\-.]\d{1,2}[/\-.]\d{4}|\d{4}-\d{1,2}-\d{1,2}"
+    r"|[A-Za-z]{3,9}\.?[ \t]+\d{1,2},?[ \t]+\d{4}|\d{1,2}[ \t\-][A-Za-z]{3,9}[ \t\-,]+\d{4})",
+    re.IGNORECASE
+)
+
+def extract_title_locally(doc_text: str):
+    """
+    Deterministic name/DOB extraction from explicitly labeled fields.
+    Returns: the result when exactly one name and one DOB are found, otherwise None
+    """
+    text = doc_text[:PROMPT_TEXT_CHARS]
+    names = {clean_name(match) for match in NAME_LABEL_PATTERN.findall(text)}
+    dobs = {clean_dob(match) for match in DOB_LABEL_PATTERN.findall(text)}
+
+    if len(names) != 1 or len(dobs) != 1 or None in names or None in dobs:
+        return None
+    return {"name": names.pop(), "dob": dobs.pop()}
+
+async def process_document(filename: str, path: str, file_key: str) -> tuple:
+    """
+    Extract name/DOB for one uploaded document.
+    Returns: (result, source) where source is "file_cache", "text_cache", "heuristic" or "llm"
+    """
+    start = time.perf_counter()
+    result, source = await resolve_document(filename, path, file_key)
+    path_counts[source] += 1
+
+    labels = (file_type_label(filename), size_bucket(os.path.getsize(path)), source)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, *labels)
+    DOCUMENTS_TOTAL.inc(1, *labels)
+    return result, source
+
+async def cache_call(method, *args, **kwargs):
+    """Call a result_cache method, off the event loop when its backend blocks (SQLite)"""
+    if result_cache.blocking:
+        return await run_in_threadpool(method, *args, **kwargs)
+    return method(*args, **kwargs)
+
+async def resolve_document(filename: str, path: str, file_key: str) -> tuple:
+    if result_cache:
+        cached = await cache_call(result_cache.get_by_file, file_key)
+        if cached is not None:
+            return cached, "file_cache"
+
+    with STAGE_SECONDS.time("parse"):
+        text = await extract_text_async(path)
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="No text could be extracted from the file")
+
+    result = extract_title_locally(text)
+    if result is not None:
+        if result_cache:
+            await cache_call(result_cache.set, result, file_key=file_key)
+        return result, "heuristic"
+
+    text_key = hash_prompt_text(text) if result_cache else None
+    if result_cache:
+        cached = await cache_call(result_cache.get_by_text, text_key)
+        if cached is not None:
+            await cache_call(result_cache.set, cached, file_key=file_key)
+            return cached, "text_cache"
+
+    result = await aget_title_from_doc(text)
+
+    # An all-null result is also what a failed OpenAI call returns, so only cache real answers
+    if result_cache and (result.get("name") or result.get("dob")):
+        await cache_call(result_cache.set, result, file_key=file_key, text_key=text_key)
+    return result, "llm"
 
 @app.post("/extract")
 async def extract_info(file: UploadFile = File(...)):
     """
     Extract name and date of birth from uploaded document.
-    Supported formats: PDF, DOCX, TXT
+    Supported formats: PDF, DOCX, TXT, RTF, HTML, ODT (detected from content)
     Returns: JSON with extracted name and dob
     """
     try:
-        text = extract_text(file)
-        
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from the file")
-        
-        result = get_title_from_doc(text)
+        path, file_key = await spool_upload(file)
+        try:
+            result, source = await process_document(file.filename, path, file_key)
+        finally:
+            os.unlink(path)
         
         return JSONResponse(content={
             "success": True,
             "extracted_info": result,
-            "filename": file.filename
+            "filename": file.filename,
+            "source": source
         })
         
     except HTTPException:
@@ -178,3 +575,259 @@ async def extract_info(file: UploadFile = File(...)):
         print(f"Extraction error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
+def remove_spooled(documents: list):
+    """Delete the temporary files of documents that will not be processed"""
+    for document in documents:
+        if "path" in document:
+            try:
+                os.unlink(document["path"])
+            except OSError:
+                pass
+
+def expand_zip_archive(filename: str, path: str) -> list:
+    """Spool each member of a zip archive to its own temporary file"""
+    documents = []
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        return [{"filename": filename, "error": "Invalid zip archive"}]
+    try:
+        with archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                if member.file_size > MAX_UPLOAD_BYTES:
+                    documents.append({"filename": member.filename, "error": upload_too_large().detail})
+                    continue
+                try:
+                    with archive.open(member) as member_file:
+                        member_path, file_key = spool_file(member_file)
+                except HTTPException as e:
+                    documents.append({"filename": member.filename, "error": e.detail})
+                    continue
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+                    # Corrupt, encrypted or unsupported-compression member: fail it alone
+                    documents.append({"filename": member.filename, "error": f"Could not read archive member: {e}"})
+                    continue
+                documents.append({"filename": member.filename, "path": member_path, "file_key": file_key})
+    except BaseException:
+        remove_spooled(documents)
+        raise
+    return documents
+
+async def expand_batch_uploads(files: List[UploadFile]) -> list:
+    """Spool uploads to disk as documents, unpacking zip archives in place"""
+    documents = []
+    try:
+        for upload in files:
+            try:
+                path, file_key = await spool_upload(upload)
+            except HTTPException as e:
+                documents.append({"filename": upload.filename, "error": e.detail})
+                continue
+            if upload.filename.lower().endswith(".zip"):
+                try:
+                    documents.extend(await run_in_threadpool(expand_zip_archive, upload.filename, path))
+                finally:
+                    os.unlink(path)
+            else:
+                documents.append({"filename": upload.filename, "path": path, "file_key": file_key})
+    except BaseException:
+        # Whatever failed (I/O, zip errors, cancellation), the files spooled so far are not processed
+        remove_spooled(documents)
+        raise
+    return documents
+
+@app.post("/extract/batch")
+async def extract_batch(files: List[UploadFile] = File(...)):
+    """
+    Extract name and date of birth from many uploaded documents.
+    Accepts several files and/or zip archives of PDF, DOCX, TXT, RTF, HTML, ODT documents.
+    Returns: per-file results in input order, with per-file errors
+    """
+    documents = await expand_batch_uploads(files)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(document):
+        filename = document["filename"]
+        if "error" in document:
+            return {"filename": filename, "success": False, "error": document["error"]}
+        async with semaphore:
+            try:
+                result, source = await process_document(filename, document["path"], document["file_key"])
+                return {"filename": filename, "success": True, "extracted_info": result, "source": source}
+            except HTTPException as e:
+                return {"filename": filename, "success": False, "error": e.detail}
+            except Exception as e:
+                print(f"Extraction error for {filename}: {str(e)}")
+                return {"filename": filename, "success": False, "error": f"Processing error: {str(e)}"}
+            finally:
+                os.unlink(document["path"])
+
+    results = await asyncio.gather(*(run(document) for document in documents))
+
+    return JSONResponse(content={
+        "success": True,
+        "count": len(results),
+        "failed": sum(1 for r in results if not r["success"]),
+        "results": results
+    })
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the extraction result cache"""
+    if result_cache is None:
+        return JSONResponse(content={"enabled": False})
+    stats = await cache_call(result_cache.get_stats)
+    return JSONResponse(content=dict(stats, enabled=True))
+
+@app.get("/extract/stats")
+async def extraction_stats():
+    """How many extractions each path answered, and its share of the total"""
+    total = sum(path_counts.values())
+    return JSONResponse(content={
+        "total": total,
+        "paths": {
+            source: {"count": count, "rate": round(count / total, 4) if total else 0.0}
+            for source, count in path_counts.items()
+        },
+        "llm_batching": dict(title_batcher.get_stats(), max_batch_size=LLM_BATCH_SIZE, max_wait_ms=LLM_BATCH_WAIT_MS)
+    })
+
+def job_response(job) -> dict:
+    def timestamp(value):
+        return datetime.fromtimestamp(value).isoformat() if value else None
+
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "extracted_info": job["result"],
+        "source": job["source"],
+        "error": job["error"],
+        "created_at": timestamp(job["created_at"]),
+        "finished_at": timestamp(job["finished_at"])
+    }
+
+def is_public_host(host: str) -> bool:
+    """True when every address the host resolves to is a public unicast address"""
+    try:
+        infos = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return False
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            return False
+    return bool(infos)
+
+def validate_callback_url(callback_url: str):
+    """
+    Reject callback URLs outside the allowed schemes, and hosts that are neither listed in
+    JOB_CALLBACK_HOSTS nor resolve only to public addresses, so clients cannot aim the service
+    at loopback, private, link-local or reserved addresses. Resolves the host, so call it off the loop
+    """
+    try:
+        parts = urlsplit(callback_url)
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        parts, host = None, ""
+    if parts is None or parts.scheme.lower() not in JOB_CALLBACK_SCHEMES or not host:
+        raise HTTPException(status_code=400, detail=f"callback_url must be an absolute {'/'.join(sorted(JOB_CALLBACK_SCHEMES))} URL")
+    if JOB_CALLBACK_HOSTS:
+        if host not in JOB_CALLBACK_HOSTS:
+            raise HTTPException(status_code=400, detail=f"callback_url host {host} is not allowed")
+    elif not is_public_host(host):
+        raise HTTPException(status_code=400, detail=f"callback_url host {host} does not resolve to a public address")
+
+def send_job_callback(callback_url: str, payload: dict):
+    try:
+        # Checked again at send time, as the host may resolve elsewhere than when the job was submitted
+        validate_callback_url(callback_url)
+    except HTTPException as e:
+        print(f"Skipping job callback to {callback_url}: {e.detail}")
+        return
+    try:
+        # No redirects: they would bypass validate_callback_url
+        response = requests.post(callback_url, json=payload, timeout=JOB_CALLBACK_TIMEOUT, allow_redirects=False)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error sending job callback to {callback_url}: {e}")
+
+async def run_job(job_id: str):
+    job = await run_in_threadpool(job_store.get_job, job_id)
+    if job is None or job["status"] not in (QUEUED, RUNNING):
+        return
+
+    path = job["path"]
+    if not path or not os.path.exists(path):
+        await run_in_threadpool(job_store.mark_failed, job_id, "Upload is no longer available")
+    else:
+        await run_in_threadpool(job_store.mark_running, job_id)
+        try:
+            result, source = await process_document(job["filename"], path, job["file_key"])
+            await run_in_threadpool(job_store.mark_done, job_id, result, source)
+        except HTTPException as e:
+            await run_in_threadpool(job_store.mark_failed, job_id, e.detail)
+        except Exception as e:
+            print(f"Extraction error for job {job_id}: {str(e)}")
+            await run_in_threadpool(job_store.mark_failed, job_id, f"Processing error: {str(e)}")
+        # Only once the outcome is recorded: a job cancelled at shutdown keeps its upload and is re-run on restart
+        os.unlink(path)
+
+    if job["callback_url"]:
+        finished = await run_in_threadpool(job_store.get_job, job_id)
+        await run_in_threadpool(send_job_callback, job["callback_url"], job_response(finished))
+
+async def job_worker():
+    while True:
+        job_id = await job_queue.get()
+        try:
+            await run_job(job_id)
+        finally:
+            job_queue.task_done()
+
+@app.on_event("startup")
+async def start_job_workers():
+    global job_store, job_queue
+    job_store = await run_in_threadpool(JobStore, JOB_STORE_PATH)
+    job_queue = asyncio.Queue()
+    # Pick up jobs that were still pending when the service last stopped
+    for job_id in await run_in_threadpool(job_store.unfinished_job_ids):
+        job_queue.put_nowait(job_id)
+    for _ in range(JOB_WORKERS):
+        job_worker_tasks.append(asyncio.create_task(job_worker()))
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    for task in job_worker_tasks:
+        task.cancel()
+    job_worker_tasks.clear()
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), callback_url: Optional[str] = Form(None)):
+    """
+    Queue a document for background extraction and return at once.
+    Poll GET /jobs/{job_id} for the result, or pass callback_url to have it POSTed there.
+    """
+    if callback_url:
+        await run_in_threadpool(validate_callback_url, callback_url)
+    path, file_key = await spool_upload(file)
+    job_id = await run_in_threadpool(job_store.create_job, file.filename, path, file_key, callback_url)
+    await job_queue.put(job_id)
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": QUEUED})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a submitted job, with its extracted info once done"""
+    job = await run_in_threadpool(job_store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job_response(job))
+
+@app.get("/metrics")
+async def metrics():
+    """Stage timings, per-document histograms and token counters in Prometheus format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")